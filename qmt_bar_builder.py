@@ -0,0 +1,351 @@
+# coding=utf-8
+"""
+QMT本地K线合成
+从本地保存的1分钟线合成5/15/30/60分钟线，从日线合成周线和月线，
+并由本地保存的分笔数据合成1秒/1分钟/5分钟线，
+分钟线按A股交易时段（集合竞价、午间休市）划分，不需要再次从QMT下载
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from qmt_bar_store import LocalBarStore
+from qmt_trading_calendar import BEIJING_OFFSET_MS, MS_PER_DAY
+
+
+# 可合成的周期及其来源周期
+DERIVED_PERIODS = {
+    '5m': '1m',
+    '15m': '1m',
+    '30m': '1m',
+    '60m': '1m',
+    '1w': '1d',
+    '1mon': '1d',
+}
+
+# 分钟线周期对应的分钟数
+MINUTE_PERIODS = {'5m': 5, '15m': 15, '30m': 30, '60m': 60}
+
+# A股交易时段（北京时间，距当日零点的分钟数）
+MORNING_OPEN = 9 * 60 + 30
+MORNING_CLOSE = 11 * 60 + 30
+AFTERNOON_OPEN = 13 * 60
+SESSION_MINUTES = 240  # 上午、下午各120分钟
+
+# 由分笔数据合成的K线周期及其毫秒数。以_tick结尾，与从QMT下载的同名周期分开保存，便于离线对照校验
+TICK_BAR_PERIODS = {'1s_tick': 1000, '1m_tick': 60000, '5m_tick': 300000}
+
+# 开盘集合竞价撮合时刻（北京时间，距当日零点的分钟数），之前的虚拟成交价不计入K线
+OPEN_AUCTION_MATCH = 9 * 60 + 25
+
+# 合成K线需要读取的分笔字段
+TICK_FIELDS = ['time', 'lastPrice', 'volume', 'amount', 'lastClose']
+
+# 增量合成时向前多读取的来源数据时长，覆盖最长的一根合成K线（月线）
+LOOKBACK_MS = 32 * MS_PER_DAY
+
+# 各字段的聚合方式，未列出的字段取最后一个值
+AGGREGATIONS = {
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum',
+    'amount': 'sum',
+    'preClose': 'first',
+}
+
+
+def minute_bar_labels(times_ms, minutes):
+    """计算分钟线所属的合成K线的时间标签
+
+    QMT分钟线以结束时刻标记（09:31 表示 09:30-09:31），09:30 为集合竞价K线。
+    每根分钟线先换算为当日交易时段内的第几分钟（1-240，午休不计），
+    再按合成周期向上取整，最后换算回结束时刻：
+    集合竞价并入第一根K线，上午最后一根在11:30结束，下午从13:00重新计数，
+    例如60分钟线为 10:30、11:30、14:00、15:00。
+
+    Args:
+        times_ms (ndarray): 分钟线的毫秒时间戳
+        minutes (int): 合成周期的分钟数
+
+    Returns:
+        ndarray: 合成K线结束时刻的毫秒时间戳
+    """
+    local_ms = np.asarray(times_ms, dtype='int64') + BEIJING_OFFSET_MS
+    day_start = local_ms // MS_PER_DAY * MS_PER_DAY
+    minute_of_day = (local_ms - day_start) // 60000
+
+    session_minute = np.where(
+        minute_of_day <= MORNING_CLOSE,
+        minute_of_day - MORNING_OPEN,
+        np.where(minute_of_day <= AFTERNOON_OPEN,
+                 MORNING_CLOSE - MORNING_OPEN,
+                 MORNING_CLOSE - MORNING_OPEN + minute_of_day - AFTERNOON_OPEN)
+    )
+    # 集合竞价及开盘前并入第一根，收盘后的盘后交易并入最后一根
+    session_minute = np.clip(session_minute, 1, SESSION_MINUTES)
+
+    bucket_end = -(-session_minute // minutes) * minutes
+    bucket_end = np.minimum(bucket_end, SESSION_MINUTES)
+    morning_length = MORNING_CLOSE - MORNING_OPEN
+    clock_minute = np.where(bucket_end <= morning_length,
+                            MORNING_OPEN + bucket_end,
+                            AFTERNOON_OPEN + bucket_end - morning_length)
+
+    return day_start + clock_minute * 60000 - BEIJING_OFFSET_MS
+
+
+def calendar_bar_groups(times_ms, period):
+    """计算日线所属的周线或月线分组
+
+    Args:
+        times_ms (ndarray): 日线的毫秒时间戳
+        period (str): '1w' 或 '1mon'
+
+    Returns:
+        ndarray: 分组编号，同一周（周一至周日）或同一月的日线编号相同
+    """
+    day_number = (np.asarray(times_ms, dtype='int64') + BEIJING_OFFSET_MS) // MS_PER_DAY
+    if period == '1w':
+        # 1970-01-01是星期四，加3后按7天取整即以星期一为一周的开始
+        return (day_number + 3) // 7
+    dates = pd.to_datetime(day_number, unit='D')
+    return (dates.year * 12 + dates.month - 1).to_numpy()
+
+
+def resample_bars(df, period):
+    """将来源K线合成为目标周期
+
+    Args:
+        df (DataFrame): 来源K线，time列为毫秒时间戳，按时间升序
+        period (str): 目标周期，见 DERIVED_PERIODS
+
+    Returns:
+        DataFrame: 合成后的K线，time列为每根K线的结束时刻（周线、月线为该周期最后一个交易日）
+    """
+    if period not in DERIVED_PERIODS:
+        raise ValueError(f"不支持合成的周期: {period}")
+    if df is None or df.empty:
+        return pd.DataFrame(columns=[] if df is None else df.columns)
+
+    df = df.drop(columns=['stock_code'], errors='ignore').reset_index(drop=True)
+    times = df['time'].to_numpy(dtype='int64')
+
+    if period in MINUTE_PERIODS:
+        keys = minute_bar_labels(times, MINUTE_PERIODS[period])
+        time_agg = 'max'
+        df = df.assign(time=keys)
+    else:
+        keys = calendar_bar_groups(times, period)
+        time_agg = 'last'
+
+    aggregations = {column: AGGREGATIONS.get(column, 'last') for column in df.columns if column != 'time'}
+    aggregations['time'] = time_agg
+
+    result = df.groupby(keys, sort=True).agg(aggregations).reset_index(drop=True)
+    columns = ['time'] + [column for column in df.columns if column != 'time']
+    result = result[columns]
+    result['time'] = result['time'].astype('int64')
+    return result
+
+
+def resample_incremental(base_df, period, last_time=None):
+    """增量合成：只重新计算最后一根已合成K线及之后的部分
+
+    最后一根已合成的K线可能在来源数据追加后发生变化（例如盘中合成的60分钟线），
+    因此从它开始重新计算，保存时按时间覆盖。
+
+    Args:
+        base_df (DataFrame): 来源K线，至少包含 last_time 之前 LOOKBACK_MS 内的数据
+        period (str): 目标周期
+        last_time (int): 已合成数据最后一根K线的毫秒时间戳，没有已合成数据时为None
+
+    Returns:
+        DataFrame: 时间不早于 last_time 的合成K线
+    """
+    result = resample_bars(base_df, period)
+    if last_time is None or result.empty:
+        return result
+
+    if period in MINUTE_PERIODS:
+        return result[result['time'] >= last_time].reset_index(drop=True)
+
+    # 周线、月线以该周期最后一个交易日标记，按分组判断是否与最后一根属于同一周期
+    last_group = calendar_bar_groups([last_time], period)[0]
+    groups = calendar_bar_groups(result['time'].to_numpy(), period)
+    return result[groups >= last_group].reset_index(drop=True)
+
+
+def tick_bar_labels(times_ms, bar_ms):
+    """计算分笔数据所属的K线的时间标签
+
+    分笔数据是截至该时刻的快照，K线区间为左开右闭并以结束时刻标记（09:31 表示 09:30-09:31）。
+    每笔先换算为交易时段内的毫秒数（午休不计）再按周期向上取整：
+    开盘集合竞价并入第一根K线，11:30之后午休期间的快照并入11:30的K线，
+    13:00整点的快照属于下午第一根K线，15:00收盘集合竞价及之后的快照并入最后一根K线。
+
+    Args:
+        times_ms (ndarray): 分笔数据的毫秒时间戳
+        bar_ms (int): K线周期的毫秒数，须能整除上午和下午的交易时长
+
+    Returns:
+        ndarray: K线结束时刻的毫秒时间戳
+    """
+    local_ms = np.asarray(times_ms, dtype='int64') + BEIJING_OFFSET_MS
+    day_start = local_ms // MS_PER_DAY * MS_PER_DAY
+    ms_of_day = local_ms - day_start
+
+    morning_open = MORNING_OPEN * 60000
+    morning_close = MORNING_CLOSE * 60000
+    afternoon_open = AFTERNOON_OPEN * 60000
+    morning_length = morning_close - morning_open
+
+    session_ms = np.where(
+        ms_of_day <= morning_close,
+        ms_of_day - morning_open,
+        np.where(ms_of_day < afternoon_open,
+                 morning_length,
+                 morning_length + np.maximum(ms_of_day - afternoon_open, 1))
+    )
+    session_ms = np.clip(session_ms, 1, SESSION_MINUTES * 60000)
+
+    bucket_end = -(-session_ms // bar_ms) * bar_ms
+    clock_ms = np.where(bucket_end <= morning_length,
+                        morning_open + bucket_end,
+                        afternoon_open + bucket_end - morning_length)
+
+    return day_start + clock_ms - BEIJING_OFFSET_MS
+
+
+def build_tick_bars(tick_df, period):
+    """由分笔数据合成K线
+
+    分笔数据的volume和amount是当日累计值，按交易日分别差分得到每笔的成交增量，
+    每个交易日的第一笔以累计值本身作为增量；累计值回落（行情修正）时增量记为0。
+    价格为0的快照（尚未成交）和09:25之前的集合竞价虚拟价格不参与开高低收。
+    没有分笔数据的时间段不生成K线。全部计算在NumPy数组上完成，不逐笔循环。
+
+    Args:
+        tick_df (DataFrame): 分笔数据，time列为毫秒时间戳
+        period (str): 目标周期，见 TICK_BAR_PERIODS
+
+    Returns:
+        DataFrame: K线，列为 time/open/high/low/close/volume/amount/preClose，time为每根K线的结束时刻
+    """
+    if period not in TICK_BAR_PERIODS:
+        raise ValueError(f"不支持由分笔数据合成的周期: {period}")
+    columns = ['time', 'open', 'high', 'low', 'close', 'volume', 'amount', 'preClose']
+    if tick_df is None or tick_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    df = tick_df.drop_duplicates(subset='time', keep='last')
+    if not df['time'].is_monotonic_increasing:
+        df = df.sort_values('time')
+
+    times = df['time'].to_numpy(dtype='int64')
+    prices = df['lastPrice'].to_numpy(dtype='float64')
+    local_ms = times + BEIJING_OFFSET_MS
+    day_number = local_ms // MS_PER_DAY
+    first_of_day = np.concatenate(([True], day_number[1:] != day_number[:-1]))
+
+    increments = {}
+    for field in ('volume', 'amount'):
+        if field not in df.columns:
+            increments[field] = np.zeros(len(df))
+            continue
+        cumulative = df[field].fillna(0).to_numpy(dtype='float64')
+        delta = np.diff(cumulative, prepend=0.0)
+        delta[first_of_day] = cumulative[first_of_day]
+        increments[field] = np.maximum(delta, 0.0)
+
+    # 先差分再过滤，过滤掉的快照没有成交增量
+    keep = (local_ms - day_number * MS_PER_DAY >= OPEN_AUCTION_MATCH * 60000) & (prices > 0)
+    if not keep.any():
+        return pd.DataFrame(columns=columns)
+    times = times[keep]
+    prices = prices[keep]
+
+    labels = tick_bar_labels(times, TICK_BAR_PERIODS[period])
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(labels)) + 1))
+    ends = np.concatenate((starts[1:], [len(labels)]))
+
+    result = pd.DataFrame({
+        'time': labels[starts],
+        'open': prices[starts],
+        'high': np.maximum.reduceat(prices, starts),
+        'low': np.minimum.reduceat(prices, starts),
+        'close': prices[ends - 1],
+        'volume': np.add.reduceat(increments['volume'][keep], starts),
+        'amount': np.add.reduceat(increments['amount'][keep], starts),
+    })
+    if 'lastClose' in df.columns:
+        result['preClose'] = df['lastClose'].to_numpy(dtype='float64')[keep][starts]
+    else:
+        result['preClose'] = np.nan
+    return result
+
+
+def load_tick_day(save_path, save_format, stock_code, trade_date):
+    """读取本地保存的某只股票一个交易日的分笔数据
+
+    CSV按时间二分定位到当日的数据行，列式存储只打开当日的分区，数据库按主键范围查询，
+    二进制格式直接映射当日的文件。
+
+    Args:
+        save_path (str): 数据保存目录
+        save_format (str): 保存格式
+        stock_code (str): 股票代码
+        trade_date (str): 交易日，格式YYYYMMDD
+
+    Returns:
+        DataFrame: 当日分笔数据，time列为毫秒时间戳，没有数据时返回空DataFrame
+    """
+    store = LocalBarStore(save_path, save_format)
+    try:
+        df = store.read_one(stock_code, 'tick', trade_date, trade_date)
+    finally:
+        store.close()
+    return df[[field for field in TICK_FIELDS if field in df.columns]]
+
+
+def _build_tick_bars_task(save_path, save_format, stock_code, trade_date, period):
+    """在子进程中读取一只股票一个交易日的分笔数据并合成K线
+
+    Returns:
+        tuple: (股票代码, 交易日, K线, 分笔数量, 错误说明)
+    """
+    try:
+        ticks = load_tick_day(save_path, save_format, stock_code, trade_date)
+        return stock_code, trade_date, build_tick_bars(ticks, period), len(ticks), None
+    except Exception as e:
+        return stock_code, trade_date, None, 0, str(e)
+
+
+def build_tick_bars_parallel(tasks, period, save_path, save_format, max_workers=None):
+    """多进程并行地由本地分笔数据合成K线
+
+    每个任务是一只股票的一个交易日，在独立的进程中读取并合成，
+    全市场一个交易日的分笔文件可以同时利用全部CPU核心处理。
+
+    Args:
+        tasks (list): (股票代码, 交易日YYYYMMDD) 列表
+        period (str): 目标周期，见 TICK_BAR_PERIODS
+        save_path (str): 数据保存目录
+        save_format (str): 保存格式
+        max_workers (int): 进程数，默认为CPU核心数
+
+    Yields:
+        tuple: 按完成顺序返回 (股票代码, 交易日, K线, 分笔数量, 错误说明)，出错时K线为None
+    """
+    if period not in TICK_BAR_PERIODS:
+        raise ValueError(f"不支持由分笔数据合成的周期: {period}")
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = [executor.submit(_build_tick_bars_task, save_path, save_format, stock_code, trade_date, period)
+                   for stock_code, trade_date in tasks]
+        for future in as_completed(futures):
+            yield future.result()
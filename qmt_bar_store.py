@@ -0,0 +1,269 @@
+# coding=utf-8
+"""
+QMT本地行情读取
+以统一的接口读取保存目录下已下载或合成的数据，支持多只股票、时间范围、字段选择和最后N条查询，
+各格式都只读取请求的范围：CSV按时间二分定位字节偏移，列式存储只打开范围内的分区，
+数据库按主键范围查询，二进制分笔数据直接映射文件
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from qmt_columnar_store import COLUMNAR_FORMATS, ColumnarStore, time_str_to_ms
+from qmt_data_store import MARKET_DB_FILE, SQLiteMarketStore, parse_csv_bytes, read_csv_range_bytes, read_csv_time_range
+from qmt_tick_store import BINARY_FORMAT, TickBinaryStore, records_to_frame
+from qmt_trading_calendar import ms_to_date, ms_to_time_str
+
+
+# 读取多只股票时的并发线程数
+READ_WORKERS = 8
+
+# 生成面板数据时的默认字段
+PANEL_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'amount']
+
+
+def to_time_ms(value, end=False):
+    """将时间参数转换为毫秒时间戳
+
+    Args:
+        value: None、毫秒时间戳，或YYYYMMDD/YYYYMMDDHHMMSS格式的字符串（北京时间）
+        end (bool): 为True且只给出日期时，返回当天最后一毫秒
+
+    Returns:
+        int: 毫秒时间戳，value为None时返回None
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return time_str_to_ms(value, end=end)
+
+
+class LocalBarStore:
+    """本地行情数据读取
+
+    与下载时使用相同的保存目录和保存格式。读取多只股票时在线程池中并发读取，
+    结果合并为一张长表（stock_code、time及各字段），或按 (字段, 股票, 时间) 排列的NumPy面板。
+    """
+
+    def __init__(self, save_path, save_format='csv', max_workers=READ_WORKERS, sqlite_store=None):
+        """
+        初始化本地行情读取
+
+        Args:
+            save_path (str): 数据保存目录
+            save_format (str): 保存格式，'csv'、'db'、'parquet'、'feather' 或 'binary'（仅分笔）
+            max_workers (int): 读取多只股票时的并发线程数
+            sqlite_store (SQLiteMarketStore): 已打开的行情库，未提供时按需打开，由close关闭
+        """
+        if save_format not in ('csv', 'db', BINARY_FORMAT) and save_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"{save_format} 格式不支持读取本地数据")
+        self.save_path = save_path
+        self.save_format = save_format
+        self.max_workers = max(1, int(max_workers))
+        self.sqlite_store = sqlite_store
+        self.owns_sqlite_store = sqlite_store is None
+        self.lock = threading.Lock()
+        self.columnar_store = ColumnarStore(save_path, save_format) if save_format in COLUMNAR_FORMATS else None
+
+    def read_one(self, stock_code, period, start=None, end=None, fields=None, count=None):
+        """读取一只股票的数据
+
+        Args:
+            stock_code (str): 股票代码
+            period (str): 周期
+            start: 开始时间（包含），毫秒时间戳或YYYYMMDD/YYYYMMDDHHMMSS
+            end: 结束时间（包含），格式同start
+            fields (list): 需要的字段，默认全部字段
+            count (int): 只返回范围内最后count条
+
+        Returns:
+            DataFrame: 按时间升序的数据，time列为毫秒时间戳，没有数据时返回空DataFrame
+        """
+        start_ms = to_time_ms(start)
+        end_ms = to_time_ms(end, end=True)
+
+        if self.save_format == 'csv':
+            file_path = os.path.join(self.save_path, f"{stock_code}_{period}.csv")
+            if not os.path.exists(file_path):
+                return pd.DataFrame()
+            df = read_csv_time_range(file_path, start_ms, end_ms, fields, count)
+        elif self.columnar_store is not None:
+            # 分区按日期前缀选择，时间字符串原样传入，毫秒时间戳转换为时间字符串
+            start_time = start if isinstance(start, str) or start_ms is None else ms_to_time_str(start_ms)
+            end_time = end if isinstance(end, str) or end_ms is None else ms_to_time_str(end_ms)
+            df = self.columnar_store.read(stock_code, period, start_time, end_time, fields, count)
+        elif self.save_format == 'db':
+            store = self._get_sqlite_store()
+            if store is None:
+                return pd.DataFrame()
+            df = store.read(stock_code, period, start_ms, end_ms, fields, count)
+        else:
+            if period != 'tick':
+                raise ValueError("二进制格式只保存分笔数据")
+            df = self._read_binary_ticks(stock_code, start_ms, end_ms, count)
+            if fields is not None:
+                df = df[['time'] + [field for field in fields if field in df.columns and field != 'time']]
+
+        return df.drop(columns=['stock_code'], errors='ignore').reset_index(drop=True)
+
+    def read(self, stock_codes, period, start=None, end=None, fields=None, count=None):
+        """读取多只股票的数据，合并为一张长表
+
+        Args:
+            stock_codes (list): 股票代码列表
+            period (str): 周期
+            start: 开始时间（包含），毫秒时间戳或YYYYMMDD/YYYYMMDDHHMMSS
+            end: 结束时间（包含），格式同start
+            fields (list): 需要的字段，默认全部字段
+            count (int): 每只股票只返回范围内最后count条，例如最近N根K线
+
+        Returns:
+            DataFrame: 列为 stock_code、time 及各字段，按股票代码的给定顺序和时间排列
+        """
+        stock_codes = list(stock_codes)
+        if self.save_format == 'csv':
+            frames = self._read_csv_frames(stock_codes, period, to_time_ms(start), to_time_ms(end, end=True),
+                                           fields, count)
+        else:
+            frames = self._map_codes(lambda stock_code: self.read_one(stock_code, period, start, end, fields, count),
+                                     stock_codes)
+            frames = [df.assign(stock_code=stock_code) for stock_code, df in zip(stock_codes, frames) if not df.empty]
+
+        if not frames:
+            return pd.DataFrame(columns=['stock_code', 'time'] + [field for field in (fields or []) if field != 'time'])
+
+        result = pd.concat(frames, ignore_index=True)
+        columns = ['stock_code', 'time'] + [column for column in result.columns if column not in ('stock_code', 'time')]
+        return result[columns]
+
+    def read_panel(self, stock_codes, period, start=None, end=None, fields=None, count=None):
+        """读取多只股票的数据，对齐为NumPy面板
+
+        Args:
+            stock_codes (list): 股票代码列表，决定面板第二维的顺序
+            period (str): 周期
+            start: 开始时间（包含）
+            end: 结束时间（包含）
+            fields (list): 字段，决定面板第一维的顺序，默认 PANEL_FIELDS
+            count (int): 每只股票只取范围内最后count条
+
+        Returns:
+            tuple: (times, values)，times为全部股票时间的并集（毫秒时间戳，升序），
+                values形状为 (字段数, 股票数, 时间数)，股票在该时间没有数据时为NaN
+        """
+        stock_codes = list(stock_codes)
+        fields = list(fields or PANEL_FIELDS)
+        df = self.read(stock_codes, period, start, end, fields, count)
+        if df.empty:
+            return np.empty(0, dtype='int64'), np.full((len(fields), len(stock_codes), 0), np.nan)
+
+        times, time_index = np.unique(df['time'].to_numpy(dtype='int64'), return_inverse=True)
+        code_index = pd.Index(stock_codes).get_indexer(df['stock_code'])
+        values = np.full((len(fields), len(stock_codes), len(times)), np.nan)
+        for position, field in enumerate(fields):
+            if field in df.columns:
+                values[position, code_index, time_index] = df[field].to_numpy(dtype='float64')
+        return times, values
+
+    def close(self):
+        """关闭由本对象打开的数据库连接"""
+        with self.lock:
+            if self.sqlite_store is not None and self.owns_sqlite_store:
+                self.sqlite_store.close()
+                self.sqlite_store = None
+
+    def _map_codes(self, func, stock_codes):
+        """对每只股票调用func，股票较多时在线程池中并发执行，结果按股票顺序返回"""
+        if len(stock_codes) <= 1 or self.max_workers == 1:
+            return [func(stock_code) for stock_code in stock_codes]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stock_codes)),
+                                thread_name_prefix="qmt-read") as executor:
+            return list(executor.map(func, stock_codes))
+
+    def _read_csv_frames(self, stock_codes, period, start_ms, end_ms, fields, count):
+        """批量读取多只股票的CSV数据
+
+        先并发定位每个文件中范围内的字节，再把表头相同的文件的数据行拼接在一起一次性解析，
+        避免逐个文件调用 read_csv 的固定开销。
+
+        Returns:
+            list: 带stock_code列的DataFrame列表
+        """
+        def locate(stock_code):
+            file_path = os.path.join(self.save_path, f"{stock_code}_{period}.csv")
+            if not os.path.exists(file_path):
+                return None
+            return read_csv_range_bytes(file_path, start_ms, end_ms, count)
+
+        groups = {}
+        for stock_code, located in zip(stock_codes, self._map_codes(locate, stock_codes)):
+            if located is None or not located[1].strip():
+                continue
+            header, data_bytes = located
+            if not data_bytes.endswith(b'\n'):
+                data_bytes += b'\n'
+            group = groups.setdefault(tuple(header), ([], [], []))
+            group[0].append(stock_code)
+            group[1].append(data_bytes)
+            group[2].append(data_bytes.count(b'\n'))
+
+        frames = []
+        for header, (codes, chunks, row_counts) in groups.items():
+            df = parse_csv_bytes(list(header), b''.join(chunks), fields)
+            if len(df) != sum(row_counts):
+                # 存在空行等无法按行数对应的情况，逐个文件解析
+                for stock_code, data_bytes in zip(codes, chunks):
+                    frames.append(parse_csv_bytes(list(header), data_bytes, fields)
+                                  .drop(columns=['stock_code'], errors='ignore').assign(stock_code=stock_code))
+                continue
+            df = df.drop(columns=['stock_code'], errors='ignore')
+            df['stock_code'] = np.repeat(codes, row_counts)
+            frames.append(df)
+
+        if len(frames) > 1:
+            # 不同表头的文件分组解析后，恢复股票代码的给定顺序
+            order = {stock_code: position for position, stock_code in enumerate(stock_codes)}
+            frames.sort(key=lambda df: order[df['stock_code'].iloc[0]])
+        return frames
+
+    def _get_sqlite_store(self):
+        """打开行情库，数据库文件不存在时返回None"""
+        with self.lock:
+            if self.sqlite_store is None:
+                db_path = os.path.join(self.save_path, MARKET_DB_FILE)
+                if not os.path.exists(db_path):
+                    return None
+                self.sqlite_store = SQLiteMarketStore(db_path)
+            return self.sqlite_store
+
+    def _read_binary_ticks(self, stock_code, start_ms, end_ms, count):
+        """读取二进制分笔数据，只转换范围内的记录"""
+        store = TickBinaryStore(self.save_path)
+        days = store.read(stock_code,
+                          ms_to_date(start_ms) if start_ms is not None else None,
+                          ms_to_date(end_ms) if end_ms is not None else None)
+
+        selected = []
+        row_count = 0
+        # 从最后一个交易日向前选取，凑足count条后不再处理更早的交易日
+        for trade_date in sorted(days, reverse=True):
+            records = days[trade_date]
+            times = records['time']
+            first = np.searchsorted(times, start_ms, 'left') if start_ms is not None else 0
+            last = np.searchsorted(times, end_ms, 'right') if end_ms is not None else len(records)
+            if count is not None:
+                first = max(first, last - (count - row_count))
+            if last > first:
+                selected.append(records[first:last])
+                row_count += last - first
+            if count is not None and row_count >= count:
+                break
+
+        if not selected:
+            return pd.DataFrame()
+        return pd.concat([records_to_frame(records) for records in selected[::-1]], ignore_index=True)
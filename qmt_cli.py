@@ -0,0 +1,394 @@
+# coding=utf-8
+"""
+QMT命令行工具
+不需要图形界面即可下载行情数据、继续或重试批量任务、本地合成K线和运行全推监控，
+适合在服务器、计划任务或脚本中使用。默认参数来自 qmt_config.json，也可以用JSON任务文件
+描述一次下载，命令行参数优先于任务文件，任务文件优先于配置文件。
+
+示例:
+    python qmt_cli.py download --codes 000001.SZ,600000.SH --period 1d --start 20240101
+    python qmt_cli.py download --job job.json --workers 8
+    python qmt_cli.py resume
+    python qmt_cli.py resample --codes-file codes.txt --period 15m
+    python qmt_cli.py monitor --scope 沪深A股 --rise 0.07 --fall 0.07 --no-sound
+"""
+
+import argparse
+import datetime
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+
+# 主线程每次阻塞等待的最长时间（秒）：Windows 上主线程阻塞在没有超时的等待中时不会响应 Ctrl+C
+SIGNAL_POLL_INTERVAL = 0.5
+
+# 下载参数的默认值，依次被配置文件、任务文件和命令行参数覆盖
+DEFAULT_JOB = {
+    'stock_codes': [],
+    'data_type': '1d',
+    'start_date': '20240101',
+    'end_date': None,  # 默认为当天
+    'save_format': 'csv',
+    'save_path': 'data',
+    'bulk_mode': True,
+    'workers': 4,
+    'incremental': True,
+    'json_layout': 'ndjson',
+}
+
+# 任务文件和命令行参数名到下载参数的对应关系
+JOB_ARGUMENTS = {
+    'codes': 'stock_codes',
+    'period': 'data_type',
+    'start': 'start_date',
+    'end': 'end_date',
+    'format': 'save_format',
+    'path': 'save_path',
+    'bulk': 'bulk_mode',
+    'workers': 'workers',
+    'incremental': 'incremental',
+    'json_layout': 'json_layout',
+}
+
+
+def load_config(config_file):
+    """读取GUI共用的JSON配置文件，文件不存在或损坏时返回空配置"""
+    if not config_file or not os.path.exists(config_file):
+        return {}
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"读取配置文件 {config_file} 时发生错误: {e}，使用默认配置", file=sys.stderr)
+        return {}
+
+
+def read_code_file(file_path):
+    """读取股票代码文件
+
+    Excel文件读取第一列，其他文件每行一个代码，也可以用逗号分隔
+
+    Returns:
+        list: 股票代码列表
+    """
+    if file_path.lower().endswith(('.xlsx', '.xls')):
+        import pandas as pd
+        return [code.strip() for code in pd.read_excel(file_path).iloc[:, 0].astype(str) if code.strip()]
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return split_codes(content.replace('\n', ','))
+
+
+def split_codes(text):
+    """按逗号或空白拆分股票代码，去掉空项和重复项并保持顺序"""
+    codes = []
+    for code in text.replace(',', ' ').split():
+        if code not in codes:
+            codes.append(code)
+    return codes
+
+
+def build_job(args, config):
+    """合并配置文件、任务文件和命令行参数，得到一次下载的全部参数
+
+    Returns:
+        dict: 下载参数，键见 DEFAULT_JOB
+    """
+    job = dict(DEFAULT_JOB)
+    download_config = config.get('download', {})
+    for key in ('bulk_mode', 'json_layout'):
+        if key in download_config:
+            job[key] = download_config[key]
+    if 'batch_workers' in download_config:
+        job['workers'] = download_config['batch_workers']
+
+    if getattr(args, 'job', None):
+        with open(args.job, 'r', encoding='utf-8') as f:
+            job_file = json.load(f)
+        for key, value in job_file.items():
+            key = JOB_ARGUMENTS.get(key, key)
+            if key == 'codes_file':
+                job['stock_codes'] = job['stock_codes'] + read_code_file(value)
+            elif key in job:
+                job[key] = value
+        if isinstance(job['stock_codes'], str):
+            job['stock_codes'] = split_codes(job['stock_codes'])
+
+    for name, key in JOB_ARGUMENTS.items():
+        value = getattr(args, name, None)
+        if value is None:
+            continue
+        job[key] = split_codes(value) if name == 'codes' else value
+
+    if getattr(args, 'codes_file', None):
+        job['stock_codes'] = job['stock_codes'] + [code for code in read_code_file(args.codes_file)
+                                                   if code not in job['stock_codes']]
+    if not job['end_date']:
+        job['end_date'] = datetime.datetime.now().strftime('%Y%m%d')
+    job['start_date'] = str(job['start_date'])
+    job['end_date'] = str(job['end_date'])
+    job['workers'] = max(1, int(job['workers']))
+    return job
+
+
+def create_service(job):
+    """按下载参数创建数据服务"""
+    from qmt_core import QMTDataService
+    return QMTDataService(incremental=job['incremental'], json_layout=job['json_layout'])
+
+
+def require_qmt():
+    """检查QMT库是否可用，不可用时输出错误"""
+    from qmt_core import QMT_AVAILABLE
+    if not QMT_AVAILABLE:
+        print("错误: QMT库不可用，请安装xtquant并启动QMT客户端", file=sys.stderr)
+    return QMT_AVAILABLE
+
+
+def wait_until_stopped(stop_event, duration=None):
+    """等待停止信号或到达运行时长，每次最多阻塞 SIGNAL_POLL_INTERVAL 秒，使 Ctrl+C 能及时处理
+
+    Args:
+        stop_event (threading.Event): 停止信号
+        duration (float): 最长运行时长（秒），None或0表示一直等待
+
+    Returns:
+        bool: 是否收到停止信号，到达运行时长时返回False
+    """
+    deadline = time.monotonic() + duration if duration else None
+    while True:
+        timeout = SIGNAL_POLL_INTERVAL
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            timeout = min(timeout, remaining)
+        if stop_event.wait(timeout):
+            return True
+
+
+def run_job_with_signals(service, job_id, stock_codes, workers):
+    """执行批量任务，Ctrl+C 时停止开始新的股票，等待正在下载的股票完成后返回
+
+    任务在后台线程中执行，主线程分段等待其结束，Windows 上同样可以及时响应 Ctrl+C。
+
+    Returns:
+        int: 进程退出码，有失败的股票时为1
+    """
+    def on_interrupt(signum, frame):
+        service.log("收到中断信号，等待正在下载的股票完成")
+        service.stop_batch()
+
+    outcome = {}
+
+    def run_job():
+        outcome['results'] = service.run_batch_job(job_id, stock_codes, workers)
+
+    worker = threading.Thread(target=run_job, name="qmt-batch-job")
+    previous = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        worker.start()
+        while worker.is_alive():
+            worker.join(SIGNAL_POLL_INTERVAL)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+    results = outcome.get('results') or {}
+    return 1 if any(status == '错误' for status, _ in results.values()) else 0
+
+
+def command_download(args, config):
+    """下载一只或多只股票的数据，多只股票作为批量任务执行，可以用 resume/retry 继续"""
+    job = build_job(args, config)
+    if not job['stock_codes']:
+        print("错误: 请通过 --codes、--codes-file 或任务文件指定股票代码", file=sys.stderr)
+        return 2
+    if not require_qmt():
+        return 1
+
+    service = create_service(job)
+    try:
+        if len(job['stock_codes']) == 1 and not args.job:
+            stock_code = job['stock_codes'][0]
+            os.makedirs(job['save_path'], exist_ok=True)
+            service.prepare_trading_calendar(job['end_date'])
+            status, message = service.download_stock_data(
+                stock_code, job['data_type'], job['start_date'], job['end_date'], job['save_format'], job['save_path']
+            )
+            service.log(message)
+            return 1 if status == '错误' else 0
+
+        job_id = service.create_job(job['stock_codes'], job['data_type'], job['start_date'], job['end_date'],
+                                    job['save_format'], job['save_path'], job['bulk_mode'])
+        return run_job_with_signals(service, job_id, job['stock_codes'], job['workers'])
+    finally:
+        service.close()
+
+
+def command_resume(args, config):
+    """继续最近一个未完成的批量任务，或重试最近一个任务中失败的股票"""
+    if not require_qmt():
+        return 1
+    job = build_job(args, config)
+    service = create_service(job)
+    try:
+        if args.command == 'retry':
+            job_id, stock_codes = service.failed_job()
+        else:
+            job_id, stock_codes = service.resumable_job()
+        if not stock_codes:
+            return 0
+        return run_job_with_signals(service, job_id, stock_codes, job['workers'])
+    finally:
+        service.close()
+
+
+def command_resample(args, config):
+    """从本地已保存的数据合成其他周期，不访问QMT"""
+    job = build_job(args, config)
+    if not job['stock_codes']:
+        print("错误: 请通过 --codes、--codes-file 或任务文件指定股票代码", file=sys.stderr)
+        return 2
+    if not args.period:
+        print("错误: 请通过 --period 指定目标周期", file=sys.stderr)
+        return 2
+
+    service = create_service(job)
+    try:
+        service.resample(job['stock_codes'], args.period, job['save_format'], job['save_path'],
+                         job['start_date'], job['end_date'])
+        return 0
+    finally:
+        service.close()
+
+
+def command_monitor(args, config):
+    """运行全推监控，直到按下 Ctrl+C 或到达指定的运行时长"""
+    from qmt_core import print_log
+    from qmt_monitor import (AlertSoundWorker, CUSTOM_SCOPE, DEFAULT_COOLDOWN, DEFAULT_HYSTERESIS, FullPushMonitor,
+                             create_sound_backend, get_monitor_stock_list)
+
+    if not require_qmt():
+        return 1
+
+    monitor_config = config.get('monitor', {})
+    scope = args.scope or monitor_config.get('monitor_stocks', '全市场')
+    custom_codes = []
+    if args.codes:
+        custom_codes.extend(split_codes(args.codes))
+    if args.codes_file:
+        custom_codes.extend(code for code in read_code_file(args.codes_file) if code not in custom_codes)
+    if custom_codes:
+        scope = CUSTOM_SCOPE
+
+    sound_worker = AlertSoundWorker(create_sound_backend(args.sound_backend or monitor_config.get('sound_backend', 'auto')),
+                                    log_callback=print_log)
+    monitor = FullPushMonitor(
+        rise_threshold=args.rise if args.rise is not None else monitor_config.get('rise_threshold', 0.05),
+        fall_threshold=args.fall if args.fall is not None else monitor_config.get('fall_threshold', 0.05),
+        sound_enabled=args.sound if args.sound is not None else monitor_config.get('sound_enabled', True),
+        sound_type=args.sound_type or monitor_config.get('sound_type', '系统提示音'),
+        on_message=lambda text: print(text, end='', flush=True),
+        log_callback=print_log,
+        hysteresis=args.hysteresis if args.hysteresis is not None else monitor_config.get('hysteresis', DEFAULT_HYSTERESIS),
+        cooldown=args.cooldown if args.cooldown is not None else monitor_config.get('cooldown', DEFAULT_COOLDOWN),
+        sound_worker=sound_worker
+    )
+
+    monitor_stocks = get_monitor_stock_list(scope, custom_codes, print_log)
+    if not monitor_stocks:
+        print_log("警告: 未获取到监控股票列表")
+        return 1
+    print_log(f"获取到 {len(monitor_stocks)} 只股票用于监控")
+
+    if not monitor.start(monitor_stocks):
+        sound_worker.stop()
+        return 1
+    print(monitor.status_text(scope), end='', flush=True)
+
+    stop_event = threading.Event()
+    previous = signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    try:
+        wait_until_stopped(stop_event, args.duration)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+        monitor.stop()
+        sound_worker.stop()
+        print_log(monitor.stats_text())
+        print_log(f"全推监控已停止 (累计: 涨 {monitor.alert_count['rise']}, 跌 {monitor.alert_count['fall']})")
+    return 0
+
+
+def add_job_arguments(parser, period_help="数据类型: tick、1m、5m、1d，默认1d"):
+    """添加下载参数，未指定的参数使用任务文件或配置文件中的值"""
+    parser.add_argument('--codes', help="股票代码，多个用逗号分隔")
+    parser.add_argument('--codes-file', help="股票代码文件，文本文件每行一个代码，Excel文件读取第一列")
+    parser.add_argument('--job', help="JSON任务文件，键与下载参数同名，例如 stock_codes、data_type、save_path")
+    parser.add_argument('--period', help=period_help)
+    parser.add_argument('--start', help="开始日期YYYYMMDD，默认20240101")
+    parser.add_argument('--end', help="结束日期YYYYMMDD，默认当天")
+    parser.add_argument('--format', help="保存格式: csv、json、db、parquet、feather、binary，默认csv")
+    parser.add_argument('--path', help="数据保存目录，默认 data")
+    parser.add_argument('--workers', type=int, help="批量下载并发数，默认取配置文件中的batch_workers")
+    parser.add_argument('--bulk', dest='bulk', action='store_true', default=None, help="K线合并请求下载")
+    parser.add_argument('--no-bulk', dest='bulk', action='store_false', help="逐只股票下载")
+    parser.add_argument('--full', dest='incremental', action='store_false', default=None,
+                        help="不检查已有数据，完整下载或重新合成")
+    parser.add_argument('--json-layout', choices=['ndjson', 'columnar'], help="JSON保存布局")
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="QMT行情数据下载和全推监控命令行工具")
+    parser.add_argument('--config', default='qmt_config.json', help="配置文件路径，默认 qmt_config.json")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    download_parser = subparsers.add_parser('download', help="下载行情数据，多只股票作为批量任务执行")
+    add_job_arguments(download_parser)
+    download_parser.set_defaults(handler=command_download)
+
+    for name, help_text in (('resume', "继续最近一个未完成的批量任务"), ('retry', "重试最近一个任务中失败的股票")):
+        resume_parser = subparsers.add_parser(name, help=help_text)
+        resume_parser.add_argument('--workers', type=int, help="并发数，默认取配置文件中的batch_workers")
+        resume_parser.set_defaults(handler=command_resume)
+
+    resample_parser = subparsers.add_parser('resample', help="从本地数据合成其他周期，分笔合成按 --start/--end 选择交易日")
+    add_job_arguments(resample_parser, period_help="目标周期，例如 15m、30m、60m、1w、1mon、1m_tick")
+    resample_parser.set_defaults(handler=command_resample)
+
+    monitor_parser = subparsers.add_parser('monitor', help="全推行情涨跌幅监控，按 Ctrl+C 停止")
+    monitor_parser.add_argument('--scope', help="监控范围: 全市场、沪深A股、创业板、科创板，默认取配置文件")
+    monitor_parser.add_argument('--codes', help="自定义监控股票，多个用逗号分隔")
+    monitor_parser.add_argument('--codes-file', help="自定义监控股票文件")
+    monitor_parser.add_argument('--rise', type=float, help="涨幅阈值，例如0.05表示5%%")
+    monitor_parser.add_argument('--fall', type=float, help="跌幅阈值")
+    monitor_parser.add_argument('--hysteresis', type=float, help="预警回差，回到阈值以内超过该幅度后才重新预警，默认0.005")
+    monitor_parser.add_argument('--cooldown', type=float, help="同一股票两次预警之间的最短间隔（秒），默认60")
+    monitor_parser.add_argument('--sound', dest='sound', action='store_true', default=None, help="播放预警声音")
+    monitor_parser.add_argument('--no-sound', dest='sound', action='store_false', help="不播放预警声音")
+    monitor_parser.add_argument('--sound-type', help="声音类型: 系统提示音、警报声、铃声、自定义音效")
+    monitor_parser.add_argument('--sound-backend', choices=['auto', 'winsound', 'bell', 'none'],
+                                help="声音后端: auto在Windows上使用系统提示音、其他系统不发声，bell为终端响铃")
+    monitor_parser.add_argument('--duration', type=float, help="运行时长（秒），默认一直运行")
+    monitor_parser.set_defaults(handler=command_monitor)
+    return parser
+
+
+def main(argv=None):
+    """命令行入口
+
+    Returns:
+        int: 进程退出码
+    """
+    args = build_parser().parse_args(argv)
+    config = load_config(args.config)
+    return args.handler(args, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
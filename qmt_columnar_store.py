@@ -0,0 +1,289 @@
+# coding=utf-8
+"""
+QMT列式数据存储
+以Parquet或Feather（Arrow IPC）格式按 股票代码/周期/日期 分区保存行情数据，
+时间保存为int64毫秒时间戳，数值列使用zstd压缩，分笔数据的盘口列表展开为独立的数值列
+"""
+
+import datetime
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+
+from qmt_trading_calendar import BEIJING_OFFSET_MS, MS_PER_DAY
+
+# 列式存储依赖pyarrow；导入时只检查是否安装，读写分区文件时才导入
+COLUMNAR_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+
+# 支持的列式保存格式及文件扩展名
+COLUMNAR_FORMATS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+# 压缩算法
+COMPRESSION = 'zstd'
+
+
+def partition_key_of_day(day_number, period):
+    """根据北京时间的日序号计算分区键
+
+    分笔数据每个交易日一个分区，日内K线每月一个分区，日线每年一个分区。
+
+    Args:
+        day_number (int): 自1970-01-01起的日序号（北京时间）
+        period (str): 周期
+
+    Returns:
+        str: 分区键，格式YYYYMMDD、YYYYMM或YYYY
+    """
+    date_str = (datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day_number))).strftime('%Y%m%d')
+    if period == 'tick':
+        return date_str
+    if period == '1d':
+        return date_str[:4]
+    return date_str[:6]
+
+
+def time_str_to_ms(time_str, end=False):
+    """将xtdata格式的时间字符串转换为毫秒时间戳
+
+    Args:
+        time_str (str): 时间，格式YYYYMMDD或YYYYMMDDHHMMSS（北京时间）
+        end (bool): 为True且只给出日期时，返回当天最后一毫秒
+
+    Returns:
+        int: 毫秒时间戳
+    """
+    time_str = str(time_str)
+    if len(time_str) > 8:
+        dt = datetime.datetime.strptime(time_str[:14], '%Y%m%d%H%M%S')
+    else:
+        dt = datetime.datetime.strptime(time_str, '%Y%m%d')
+        if end:
+            dt += datetime.timedelta(days=1) - datetime.timedelta(milliseconds=1)
+    return int((dt - datetime.datetime(1970, 1, 1)) / datetime.timedelta(milliseconds=1)) - BEIJING_OFFSET_MS
+
+
+def expand_list_columns(df):
+    """将盘口等列表类型的列展开为按档位编号的数值列
+
+    例如askPrice列中的[买一价, ..., 买五价]展开为askPrice1至askPrice5。
+
+    Args:
+        df (DataFrame): 原始数据
+
+    Returns:
+        DataFrame: 展开后的数据
+    """
+    for column in list(df.columns):
+        if df[column].dtype != object:
+            continue
+        sample = df[column].dropna()
+        if sample.empty or not isinstance(sample.iloc[0], (list, tuple, np.ndarray)):
+            continue
+
+        values = df[column].tolist()
+        try:
+            matrix = np.array(values, dtype='float64')
+            if matrix.ndim != 2:
+                raise ValueError
+        except (ValueError, TypeError):
+            # 档位数量不一致或存在空值时逐行补齐
+            width = max(len(value) for value in values if isinstance(value, (list, tuple, np.ndarray)))
+            matrix = np.full((len(values), width), np.nan)
+            for row, value in enumerate(values):
+                if isinstance(value, (list, tuple, np.ndarray)):
+                    matrix[row, :len(value)] = value
+
+        position = df.columns.get_loc(column)
+        expanded = pd.DataFrame(matrix, index=df.index,
+                                columns=[f"{column}{level + 1}" for level in range(matrix.shape[1])])
+        df = pd.concat([df.iloc[:, :position], expanded, df.iloc[:, position + 1:]], axis=1)
+    return df
+
+
+class ColumnarStore:
+    """列式行情数据存储
+
+    目录结构为 {保存目录}/{格式}/{周期}/{股票代码}/{分区}.{扩展名}。
+    写入时只重写涉及的分区，分区内按时间去重并排序；
+    读取时只打开时间范围覆盖的分区，并且可以只读取需要的列。
+    """
+
+    def __init__(self, save_path, file_format='parquet'):
+        """
+        初始化列式存储
+
+        Args:
+            save_path (str): 数据保存目录
+            file_format (str): 'parquet' 或 'feather'
+        """
+        if file_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"不支持的列式存储格式: {file_format}")
+        if not COLUMNAR_AVAILABLE:
+            raise ImportError("列式存储需要安装pyarrow: pip install pyarrow")
+
+        self.root = os.path.join(save_path, file_format)
+        self.file_format = file_format
+        self.extension = COLUMNAR_FORMATS[file_format]
+
+    def stock_dir(self, stock_code, period):
+        """股票数据所在的目录"""
+        return os.path.join(self.root, period, stock_code)
+
+    def partitions(self, stock_code, period):
+        """列出股票已有的分区
+
+        Returns:
+            list: 按分区键升序排列的 (分区键, 文件路径)
+        """
+        directory = self.stock_dir(stock_code, period)
+        if not os.path.isdir(directory):
+            return []
+        result = []
+        for name in os.listdir(directory):
+            if name.endswith(self.extension):
+                result.append((name[:-len(self.extension)], os.path.join(directory, name)))
+        result.sort()
+        return result
+
+    def write(self, stock_code, period, df):
+        """写入数据，与分区中已有的数据按时间合并去重
+
+        Args:
+            stock_code (str): 股票代码
+            period (str): 周期
+            df (DataFrame): 数据，time列为毫秒时间戳
+
+        Returns:
+            int: 写入的记录数
+        """
+        if df is None or df.empty or 'time' not in df.columns:
+            return 0
+
+        df = df.drop(columns=['stock_code'], errors='ignore').reset_index(drop=True)
+        df['time'] = df['time'].astype('int64')
+        df = expand_list_columns(df)
+
+        times = df['time'].to_numpy()
+        day_numbers = (times + BEIJING_OFFSET_MS) // MS_PER_DAY
+        unique_days, inverse = np.unique(day_numbers, return_inverse=True)
+        day_keys = np.array([partition_key_of_day(day, period) for day in unique_days])
+        keys = day_keys[inverse]
+
+        directory = self.stock_dir(stock_code, period)
+        os.makedirs(directory, exist_ok=True)
+
+        for key in np.unique(keys):
+            part = df[keys == key]
+            file_path = os.path.join(directory, f"{key}{self.extension}")
+            if os.path.exists(file_path):
+                part = pd.concat([self._read_file(file_path), part], ignore_index=True)
+            part = part.drop_duplicates(subset='time', keep='last').sort_values('time')
+            self._write_file(part.reset_index(drop=True), file_path)
+
+        return len(df)
+
+    def read(self, stock_code, period, start_time=None, end_time=None, columns=None, count=None):
+        """读取数据
+
+        Args:
+            stock_code (str): 股票代码
+            period (str): 周期
+            start_time (str): 开始时间，格式YYYYMMDD或YYYYMMDDHHMMSS
+            end_time (str): 结束时间，格式YYYYMMDD或YYYYMMDDHHMMSS
+            columns (list): 需要读取的列，默认读取全部列
+            count (int): 只读取范围内最后count条，从最后一个分区向前读取，凑足后不再打开更早的分区
+
+        Returns:
+            DataFrame: 按时间升序的数据，time列为毫秒时间戳
+        """
+        if columns is not None and 'time' not in columns:
+            columns = ['time'] + list(columns)
+
+        start_ms = time_str_to_ms(start_time) if start_time else None
+        end_ms = time_str_to_ms(end_time, end=True) if end_time else None
+
+        frames = []
+        row_count = 0
+        for key, file_path in reversed(self.partitions(stock_code, period)):
+            # 分区键是日期前缀，只比较相同长度的部分即可跳过范围外的分区
+            if start_time and key < str(start_time)[:len(key)]:
+                break
+            if end_time and key > str(end_time)[:len(key)]:
+                continue
+            df = self._read_file(file_path, columns)
+            if start_ms is not None:
+                df = df[df['time'] >= start_ms]
+            if end_ms is not None:
+                df = df[df['time'] <= end_ms]
+            frames.append(df)
+            row_count += len(df)
+            if count is not None and row_count >= count:
+                break
+
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+
+        df = pd.concat(frames[::-1], ignore_index=True)
+        if count is not None:
+            df = df.iloc[-count:] if count > 0 else df.iloc[:0]
+        return df.reset_index(drop=True)
+
+    def last_time(self, stock_code, period):
+        """获取已保存数据的最新时间，只读取最后一个分区的time列
+
+        Returns:
+            int: 毫秒时间戳，没有数据时返回None
+        """
+        partitions = self.partitions(stock_code, period)
+        if not partitions:
+            return None
+        times = self._read_file(partitions[-1][1], ['time'])['time']
+        if times.empty:
+            return None
+        return int(times.max())
+
+    def _read_file(self, file_path, columns=None):
+        """读取单个分区文件
+
+        不同时间写入的分区字段可能不同（例如后来才有的盘口档位），先读取分区的字段列表，
+        只读取分区中存在的列，分区中没有的列补为NaN，返回的列与请求的顺序一致。
+        """
+        read_columns = columns
+        if columns is not None:
+            names = set(self._file_columns(file_path))
+            read_columns = [column for column in columns if column in names]
+        if self.file_format == 'parquet':
+            df = pd.read_parquet(file_path, columns=read_columns)
+        else:
+            df = pd.read_feather(file_path, columns=read_columns)
+        if columns is None:
+            return df
+        for column in columns:
+            if column not in df.columns:
+                df[column] = np.nan
+        return df[list(columns)]
+
+    def _file_columns(self, file_path):
+        """读取分区文件的字段名，只读取文件的元数据"""
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        if self.file_format == 'parquet':
+            return pyarrow.parquet.read_schema(file_path).names
+        with pyarrow.ipc.open_file(file_path) as reader:
+            return reader.schema.names
+
+    def _write_file(self, df, file_path):
+        """写入单个分区文件，先写临时文件再替换，避免中断时损坏已有分区"""
+        temp_path = f"{file_path}.tmp"
+        if self.file_format == 'parquet':
+            df.to_parquet(temp_path, engine='pyarrow', compression=COMPRESSION, index=False)
+        else:
+            df.to_feather(temp_path, compression=COMPRESSION)
+        os.replace(temp_path, file_path)
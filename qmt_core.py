@@ -0,0 +1,1042 @@
+# coding=utf-8
+"""
+QMT数据服务
+不依赖图形界面的下载、保存、增量检查、本地合成和批量任务逻辑，
+供GUI和命令行工具共用；运行状态通过日志回调和进度回调报告给调用方
+"""
+
+import datetime
+import os
+import threading
+
+import pandas as pd
+
+from qmt_download_engine import BatchDownloadEngine, BULK_CHUNK_SIZE, chunk_codes, fetch_kline_bulk, iter_tick_days
+from qmt_trading_calendar import TradingCalendar, ms_to_date, ms_to_time_str, session_close_ms
+from qmt_data_store import (DataManifest, SQLiteMarketStore, JsonStreamWriter, JSON_LAYOUTS, MARKET_DB_FILE,
+                            REQUIRED_COLUMNS, read_csv_last_time, count_data_rows, parse_time_ms,
+                            upsert_csv_tail, validate_frame)
+from qmt_rate_limiter import xtdata_limiter
+from qmt_job_journal import (JobJournal, JOB_FINISHED, JOB_STOPPED, RESULT_STATES, STATE_FAILED,
+                             STATE_PENDING, STATE_RUNNING)
+
+# QMT相关导入
+try:
+    from xtquant import xtdata
+    xtdata.enable_hello = False
+    QMT_AVAILABLE = True
+except ImportError:
+    xtdata = None
+    QMT_AVAILABLE = False
+
+
+# 下载周期对应的毫秒数，增量下载从已有数据最后一根K线的下一根开始；分笔数据从下一秒开始
+PERIOD_MS = {'tick': 1000, '1m': 60000, '5m': 300000}
+
+# 关闭服务时等待正在下载的股票完成的最长时间（秒）
+BATCH_STOP_TIMEOUT = 30
+
+
+def print_log(message):
+    """带时间戳输出日志到标准输出，作为未提供日志回调时的默认实现"""
+    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    print(f"[{timestamp}] {message}", flush=True)
+
+
+class QMTDataService:
+    """QMT数据服务
+
+    持有数据清单、行情库连接、交易日历和批量下载任务日志，同一目录的清单和数据库连接在服务的生命周期内复用。
+    下载参数全部通过方法参数传入，只有增量下载和JSON布局两项设置作为属性保存，可以在两次操作之间修改。
+    所有方法都是同步执行的，调用方负责决定是否放到后台线程中运行。
+    """
+
+    def __init__(self, log_callback=None, incremental=True, json_layout='ndjson',
+                 journal_path="download_jobs.db", calendar_path="trading_calendar.json"):
+        """
+        初始化数据服务
+
+        Args:
+            log_callback: 日志输出回调函数，默认输出到标准输出
+            incremental (bool): 是否增量下载（跳过已有数据）
+            json_layout (str): JSON保存布局，见 JSON_LAYOUTS
+            journal_path (str): 批量下载任务日志文件路径
+            calendar_path (str): 交易日历缓存文件路径
+        """
+        self.log = log_callback or print_log
+        self.incremental = incremental
+        self.json_layout = json_layout
+        self.sqlite_stores = {}  # 数据目录 -> SQLite行情库，连接在服务运行期间复用
+        self.job_journal = JobJournal(journal_path)  # 批量下载任务日志
+        self.batch_stop_event = threading.Event()  # 批量下载停止信号
+        self.batch_idle = threading.Event()  # 没有正在执行的批量下载时置位，关闭时等待
+        self.batch_idle.set()
+        self.batch_running = False
+        self.trading_calendar = TradingCalendar(calendar_path)  # 本地缓存的交易日历
+        self.manifests = {}  # 数据目录 -> 数据清单
+        self.manifest_lock = threading.Lock()
+
+    def check_existing_data(self, stock_code, data_type, start_date, end_date, save_format, save_path):
+        """检查已有数据，返回需要下载的日期范围"""
+        if not self.incremental:
+            # 如果不启用增量下载，返回原始日期范围
+            return start_date, end_date
+
+        try:
+            last_time = self.get_local_last_time(stock_code, data_type, save_format, save_path)
+            if last_time is not None:
+                new_start_time = self.incremental_start_time(last_time, data_type, end_date)
+
+                if new_start_time is not None:
+                    self.log(f"检测到已有数据到 {ms_to_time_str(last_time)}，从 {new_start_time} 开始增量下载")
+                    return new_start_time, end_date
+                else:
+                    self.log(f"数据已是最新，无需下载")
+                    return None, None
+
+        except Exception as e:
+            self.log(f"检查已有数据时出错: {e}，将进行完整下载")
+
+        # 如果检查失败或没有已有数据，返回原始日期范围
+        return start_date, end_date
+
+    def get_local_last_time(self, stock_code, period, save_format, save_path):
+        """获取本地已保存数据的最新时间，各格式都不需要读取全部数据
+
+        Args:
+            stock_code (str): 股票代码
+            period (str): 周期
+            save_format (str): 保存格式
+            save_path (str): 保存路径
+
+        Returns:
+            int: 毫秒时间戳，没有已保存的数据时返回None
+        """
+        if save_format == 'csv':
+            file_path = os.path.join(save_path, f"{stock_code}_{period}.csv")
+            if os.path.exists(file_path):
+                # 从数据清单获取最新数据时间，不需要读取整个文件
+                return self.get_csv_watermark(stock_code, period, file_path, save_path)
+
+        elif save_format == 'db':
+            # 按(股票代码, 周期)查询最新时间，主键索引查找
+            if os.path.exists(os.path.join(save_path, MARKET_DB_FILE)):
+                return self.get_sqlite_store(save_path).last_time(stock_code, period)
+
+        elif save_format != 'json':
+            # 列式和二进制存储只在使用时导入
+            from qmt_columnar_store import COLUMNAR_FORMATS, ColumnarStore
+            from qmt_tick_store import BINARY_FORMAT, TickBinaryStore
+
+            if save_format in COLUMNAR_FORMATS:
+                # 只读取最后一个分区的时间列
+                return ColumnarStore(save_path, save_format).last_time(stock_code, period)
+
+            if save_format == BINARY_FORMAT and period == 'tick':
+                # 只读取最后一个交易日文件的最后一条记录
+                return TickBinaryStore(save_path).last_time(stock_code)
+
+        return None
+
+    def load_local_bars(self, stock_code, period, save_format, save_path, start_ms=None):
+        """读取本地已保存的K线数据
+
+        Args:
+            stock_code (str): 股票代码
+            period (str): 周期
+            save_format (str): 保存格式
+            save_path (str): 保存路径
+            start_ms (int): 只读取不早于该时间的数据
+
+        Returns:
+            DataFrame: 按时间升序的K线，time列为毫秒时间戳，没有数据时返回空DataFrame
+        """
+        from qmt_bar_store import LocalBarStore
+
+        # CSV按时间二分定位到开始时间，不需要解析整个文件
+        sqlite_store = self.get_sqlite_store(save_path) if save_format == 'db' else None
+        return LocalBarStore(save_path, save_format, sqlite_store=sqlite_store).read_one(stock_code, period, start_ms)
+
+    def prepare_trading_calendar(self, end_date):
+        """加载交易日历，本地缓存不可用时从QMT构建
+
+        Args:
+            end_date (str): 需要覆盖到的日期
+        """
+        try:
+            if not self.trading_calendar.ensure(end_date):
+                self.log("警告: 未能获取交易日历，将按工作日近似处理")
+        except Exception as e:
+            self.log(f"加载交易日历时发生错误: {e}，将按工作日近似处理")
+
+    def validate_data_integrity(self, file_path, data_type, stock_code=None, period=None, save_path=None):
+        """验证保存文件的数据完整性
+
+        写入的数据在写入前已经在内存中验证过。文件的大小、修改时间和末尾校验和与数据清单一致时
+        直接采用清单中的记录数；只有文件在程序之外被修改过时才重新读取整个文件，并重建清单记录。
+        """
+        try:
+            if not os.path.exists(file_path):
+                return False, "文件不存在"
+
+            if file_path.endswith('.csv'):
+                manifest = self.get_manifest(save_path) if stock_code and save_path else None
+                if manifest is not None:
+                    entry = manifest.get(stock_code, period, 'csv')
+                    if DataManifest.verify_file(entry, file_path):
+                        return True, f"验证通过，共 {entry['rows']} 条记录"
+
+                import pandas as pd
+                df = pd.read_csv(file_path)
+
+                if df.empty:
+                    return False, "文件为空"
+
+                # 检查必要的列
+                required_columns = REQUIRED_COLUMNS['tick' if data_type == 'tick' else 'kline']
+                missing_columns = [col for col in required_columns if col not in df.columns]
+                if missing_columns:
+                    return False, f"缺少必要列: {missing_columns}"
+
+                # 检查数据是否有重复的时间戳
+                if 'time' in df.columns:
+                    duplicate_count = df['time'].duplicated().sum()
+                    if duplicate_count > 0:
+                        self.log(f"警告: 发现 {duplicate_count} 条重复时间戳的数据")
+
+                # 文件已完整验证，重建清单记录
+                if manifest is not None:
+                    last_time = parse_time_ms(df['time'].iloc[-1])
+                    manifest.update(stock_code, period, 'csv', last_time, len(df), file_path)
+
+                return True, f"验证通过，共 {len(df)} 条记录"
+
+            return True, "文件存在"
+
+        except Exception as e:
+            return False, f"验证时出错: {e}"
+
+    def download_stock_data(self, stock_code, data_type, start_date, end_date, save_format, save_path, verbose=True):
+        """下载并保存单只股票的数据，供单只下载和批量下载共用
+
+        Args:
+            stock_code (str): 股票代码
+            data_type (str): 数据类型，'tick'、'1m'、'5m'或'1d'
+            start_date (str): 开始日期，格式YYYYMMDD
+            end_date (str): 结束日期，格式YYYYMMDD
+            save_format (str): 保存格式
+            save_path (str): 保存路径
+            verbose (bool): 是否输出逐日的下载日志
+
+        Returns:
+            tuple: (状态, 说明)，状态为'已是最新'、'完成'或'无数据'
+        """
+        # 检查已有数据，确定实际需要下载的日期范围
+        actual_start_date, actual_end_date = self.check_existing_data(
+            stock_code, data_type, start_date, end_date, save_format, save_path
+        )
+
+        if actual_start_date is None or actual_end_date is None:
+            return '已是最新', f"{stock_code} 的 {data_type} 数据已是最新，无需下载"
+
+        self.log(f"开始下载 {stock_code} 的 {data_type} 数据，时间范围: {actual_start_date} 到 {actual_end_date}")
+        filename = f"{stock_code}_{data_type}_{actual_start_date}_{actual_end_date}"
+
+        # 下载历史数据
+        if data_type == 'tick':
+            # 按时间窗口合并请求，再在本地按交易日拆分
+            def on_window_error(window_start, window_end, error):
+                self.log(f"下载 {stock_code} {window_start}-{window_end} tick数据时出错: {error}")
+
+            # 只下载真实的交易日，跳过周末和节假日；增量下载时第一个窗口从已有数据最后一条的下一秒开始
+            trading_days = self.trading_calendar.trading_days(actual_start_date[:8], actual_end_date)
+
+            day_frames = iter_tick_days(stock_code, trading_days, start_time=actual_start_date,
+                                        on_error=on_window_error)
+
+            # 边下载边写入，不在内存中拼接整个时间范围的分笔数据
+            total_count = self.write_tick_frames(day_frames, stock_code, filename, save_format, save_path, verbose)
+            if total_count == 0:
+                return '无数据', f"未获取到 {stock_code} 的新数据"
+
+            self.log(f"{stock_code} 总共写入 {total_count} 条tick数据")
+            return '完成', f"{stock_code} 数据下载完成"
+        else:
+            # K线数据的下载逻辑
+            xtdata_limiter.call(xtdata.download_history_data, stock_code, period=data_type,
+                                start_time=actual_start_date, end_time=actual_end_date)
+
+            # K线数据
+            fields = ['time', 'open', 'high', 'low', 'close', 'volume', 'amount']
+            data = xtdata_limiter.call(xtdata.get_market_data, field_list=fields, stock_list=[stock_code],
+                                        period=data_type, start_time=actual_start_date, end_time=actual_end_date)
+
+        if not data:
+            return '无数据', f"未获取到 {stock_code} 的数据"
+
+        # 保存数据
+        if not self.save_data(data, stock_code, filename, save_format, save_path, data_type):
+            return '错误', f"{stock_code} 数据保存失败"
+
+        return '完成', f"{stock_code} 数据下载完成"
+
+    def incremental_start_time(self, last_time, data_type, end_date):
+        """根据已有数据的最新时间计算增量下载的开始时间
+
+        日线从下一个交易日开始；分钟和分笔数据如果最后一个交易日尚未收盘，
+        则从已有数据最后一根K线的下一根（分笔数据为下一秒）开始，否则从下一个交易日开始。
+        万一与已有数据重叠，重叠的记录在保存时按时间合并。
+
+        Args:
+            last_time (int): 已有数据最新的毫秒时间戳
+            data_type (str): 数据类型
+            end_date (str): 结束日期，格式YYYYMMDD
+
+        Returns:
+            str: 开始时间，格式YYYYMMDD或YYYYMMDDHHMMSS；数据已是最新时返回None
+        """
+        last_date = ms_to_date(last_time)
+
+        if data_type != '1d' and last_time < session_close_ms(last_date):
+            # 时间字符串精确到秒，加上一个周期后截断到秒，不会再次包含最后一条
+            start_time = ms_to_time_str(last_time + PERIOD_MS.get(data_type, 1000))
+        else:
+            start_time = self.trading_calendar.next_trading_day(last_date)
+
+        if start_time[:8] > end_date:
+            return None
+        return start_time
+
+    def get_manifest(self, save_path):
+        """获取数据目录对应的数据清单，同一目录只打开一次
+
+        Args:
+            save_path (str): 数据保存目录
+
+        Returns:
+            DataManifest: 数据清单
+        """
+        key = os.path.abspath(save_path)
+        with self.manifest_lock:
+            if key not in self.manifests:
+                os.makedirs(key, exist_ok=True)
+                self.manifests[key] = DataManifest(key)
+            return self.manifests[key]
+
+    def get_csv_watermark(self, stock_code, period, csv_path, save_path):
+        """获取CSV数据文件中最新数据的毫秒时间戳
+
+        优先查询数据清单；清单缺失或文件已被外部修改时，只读取文件末行并重建清单记录。
+
+        Returns:
+            int: 最新数据的毫秒时间戳，文件没有数据时返回None
+        """
+        manifest = self.get_manifest(save_path)
+        entry = manifest.get(stock_code, period, 'csv')
+        if DataManifest.matches_file(entry, csv_path):
+            return entry['last_time']
+
+        last_time = read_csv_last_time(csv_path)
+        if last_time is not None:
+            manifest.update(stock_code, period, 'csv', last_time, count_data_rows(csv_path), csv_path)
+        return last_time
+
+    def write_csv_data(self, df, csv_path, stock_code, period, save_path, label, append=None):
+        """写入CSV数据文件并更新数据清单
+
+        数据按时间去重。增量追加时如果新数据与已有数据的时间重叠，只合并文件末尾重叠的部分，
+        新数据覆盖已有数据，重复或重叠的同步不会产生重复记录。
+
+        Args:
+            df (DataFrame): 待写入的数据，time列为毫秒时间戳
+            csv_path (str): CSV文件路径
+            stock_code (str): 股票代码
+            period (str): 周期
+            save_path (str): 数据保存目录
+            label (str): 日志中的数据名称
+            append (bool): 是否追加到已有文件，默认按增量下载设置决定
+
+        Returns:
+            int: 实际写入的记录数
+        """
+        manifest = self.get_manifest(save_path)
+        if append is None:
+            append = self.incremental
+        append = append and os.path.exists(csv_path)
+
+        watermark = self.get_csv_watermark(stock_code, period, csv_path, save_path) if append else None
+
+        # 在内存中验证待写入的数据，并检查与已有数据的边界，写入后不需要重新读取文件
+        is_valid, message = validate_frame(df, 'tick' if period == 'tick' else 'kline', watermark)
+        if not is_valid:
+            self.log(f"{stock_code} 数据完整性验证失败: {message}")
+            return 0
+        self.log(f"{stock_code} 数据完整性验证: {message}")
+
+        df = df.drop_duplicates(subset='time', keep='last')
+        if not df['time'].is_monotonic_increasing:
+            df = df.sort_values('time')
+
+        if append:
+            if watermark is not None and df['time'].min() <= watermark:
+                # 与已有数据重叠，只合并文件末尾的重叠部分
+                previous = manifest.get(stock_code, period, 'csv')
+                previous_valid = DataManifest.matches_file(previous, csv_path)
+                removed, written = upsert_csv_tail(csv_path, df)
+
+                rows = previous['rows'] - removed + written if previous_valid else count_data_rows(csv_path)
+                last_time = max(watermark, int(df['time'].max()))
+                manifest.update(stock_code, period, 'csv', last_time, rows, csv_path)
+                self.log(f"{label}已合并到: {csv_path} (新增{written - removed}条，更新{len(df) - (written - removed)}条记录)")
+                return len(df)
+
+        last_time = int(df['time'].max())
+
+        # 转换时间戳为可读格式
+        df['time'] = pd.to_datetime(df['time'], unit='ms')
+
+        if append:
+            # 追加模式，不写入表头
+            df.to_csv(csv_path, mode='a', header=False, index=False, encoding='utf-8-sig')
+            self.log(f"{label}已追加到: {csv_path} (新增{len(df)}条记录)")
+
+            previous = manifest.get(stock_code, period, 'csv')
+            if watermark is not None and previous:
+                rows = previous['rows'] + len(df)
+            else:
+                rows = count_data_rows(csv_path)
+        else:
+            # 新建文件或覆盖模式
+            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            self.log(f"{label}已保存到: {csv_path} (共{len(df)}条记录)")
+            rows = len(df)
+
+        manifest.update(stock_code, period, 'csv', last_time, rows, csv_path)
+        return len(df)
+
+    def get_sqlite_store(self, save_path):
+        """获取数据目录对应的SQLite行情库，同一目录只打开一次连接
+
+        Args:
+            save_path (str): 数据保存目录
+
+        Returns:
+            SQLiteMarketStore: 行情库
+        """
+        key = os.path.abspath(save_path)
+        with self.manifest_lock:
+            if key not in self.sqlite_stores:
+                os.makedirs(key, exist_ok=True)
+                self.sqlite_stores[key] = SQLiteMarketStore(os.path.join(key, MARKET_DB_FILE))
+            return self.sqlite_stores[key]
+
+    def open_json_writer(self, save_path, filename):
+        """按设置的JSON布局创建流式写入器
+
+        Args:
+            save_path (str): 保存路径
+            filename (str): 文件名（不含扩展名）
+
+        Returns:
+            JsonStreamWriter: JSON写入器
+        """
+        layout = self.json_layout
+        if layout not in JSON_LAYOUTS:
+            layout = 'ndjson'
+        return JsonStreamWriter(os.path.join(save_path, f"{filename}{JSON_LAYOUTS[layout]}"), layout)
+
+    def write_tick_frames(self, day_frames, stock_code, filename, save_format, save_path, verbose=False):
+        """逐个交易日流式写入分笔数据
+
+        每个交易日的数据到达后立即写入目标文件，内存中最多只保留一个下载窗口的数据，
+        不会把整个时间范围的分笔数据拼接在一起，也不逐条转换为Python字典。
+
+        Args:
+            day_frames: 可迭代的 (交易日YYYYMMDD, 当日分笔数据) 序列
+            stock_code (str): 股票代码
+            filename (str): JSON文件名（不含扩展名）
+            save_format (str): 保存格式
+            save_path (str): 保存路径
+            verbose (bool): 是否输出逐日的写入日志
+
+        Returns:
+            int: 写入的记录数
+        """
+        csv_path = os.path.join(save_path, f"{stock_code}_tick.csv")
+        json_writer = None
+        db_store = None
+        columnar_store = None
+        binary_store = None
+        if save_format not in ('csv', 'json', 'db'):
+            from qmt_columnar_store import COLUMNAR_FORMATS, ColumnarStore
+            from qmt_tick_store import BINARY_FORMAT, TickBinaryStore
+
+            columnar_store = ColumnarStore(save_path, save_format) if save_format in COLUMNAR_FORMATS else None
+            binary_store = TickBinaryStore(save_path) if save_format == BINARY_FORMAT else None
+        total_count = 0
+
+        try:
+            for trade_date, day_df in day_frames:
+                if day_df is None or day_df.empty:
+                    continue
+
+                df = day_df.reset_index(drop=True)
+                missing_fields = [field for field in ['time', 'lastPrice', 'volume'] if field not in df.columns]
+                if missing_fields:
+                    self.log(f"警告: {stock_code} tick数据缺少字段: {missing_fields}")
+
+                # 添加股票代码列，并将股票代码和时间放在前面
+                df['stock_code'] = stock_code
+                cols = ['stock_code', 'time'] + [col for col in df.columns if col not in ['stock_code', 'time']]
+                df = df[cols]
+
+                if save_format == 'csv':
+                    # 第一批数据按增量设置决定追加或覆盖，之后的交易日都追加到同一文件
+                    written = self.write_csv_data(df, csv_path, stock_code, 'tick', save_path, "tick数据",
+                                                  append=True if total_count else None)
+                elif save_format == 'json':
+                    if json_writer is None:
+                        json_writer = self.open_json_writer(save_path, filename)
+                    json_writer.write(df)
+                    written = len(df)
+                elif save_format == 'db':
+                    db_store = self.get_sqlite_store(save_path)
+                    written = db_store.write(stock_code, 'tick', df)
+                elif columnar_store is not None:
+                    written = columnar_store.write(stock_code, 'tick', df)
+                elif binary_store is not None:
+                    written = binary_store.append(stock_code, df)
+                else:
+                    written = 0
+
+                total_count += written
+                if verbose and trade_date:
+                    self.log(f"{stock_code} {trade_date} 写入 {written} 条tick数据")
+        finally:
+            if json_writer is not None:
+                json_writer.close()
+                self.log(f"数据已保存到: {json_writer.file_path}")
+
+        if db_store is not None:
+            self.log(f"tick数据已保存到数据库: {db_store.path} (共{total_count}条记录)")
+        if columnar_store is not None and total_count:
+            self.log(f"tick数据已保存到: {columnar_store.stock_dir(stock_code, 'tick')} (共{total_count}条记录)")
+        if binary_store is not None and total_count:
+            self.log(f"tick数据已保存到: {binary_store.stock_dir(stock_code)} (共{total_count}条记录)")
+
+        if save_format == 'csv' and total_count:
+            # 验证保存的数据完整性
+            is_valid, message = self.validate_data_integrity(csv_path, 'tick', stock_code, 'tick', save_path)
+            if not is_valid:
+                self.log(f"数据完整性验证失败: {message}")
+            else:
+                self.log(f"数据完整性验证: {message}")
+
+        return total_count
+
+    def kline_data_to_frame(self, data):
+        """将K线数据转换为DataFrame
+
+        Args:
+            data: get_market_data返回的单只股票数据 {字段: DataFrame}，或批量模式下已按股票拆分好的DataFrame
+
+        Returns:
+            DataFrame: 以字段为列的K线数据
+        """
+        if isinstance(data, pd.DataFrame):
+            return data.copy()
+
+        df = pd.DataFrame()
+        for field, values in data.items():
+            if hasattr(values, 'values') and len(values.values) > 0:
+                df[field] = values.values[0]
+        return df
+
+    def save_data(self, data, stock_code, filename, save_format, save_path, period):
+        """保存数据到指定格式
+
+        Args:
+            period (str): 数据周期
+        """
+        try:
+            # 数据验证
+            if data is None or len(data) == 0:
+                self.log(f"错误: {stock_code} 数据为空，无法保存")
+                return False
+
+            # 检查数据类型并确定是tick数据还是K线数据
+            is_tick_data = False
+            data_count = 0
+
+            if isinstance(data, pd.DataFrame):
+                # 批量模式下已按股票拆分好的K线数据
+                data_count = len(data)
+            elif isinstance(data, dict) and stock_code in data:
+                # 检查是否为tick数据格式 {股票代码: DataFrame}
+                tick_df = data[stock_code]
+                if isinstance(tick_df, pd.DataFrame) and len(tick_df) > 0:
+                    data_count = len(tick_df)
+                    # 检查是否包含tick数据的典型字段
+                    if 'lastPrice' in tick_df.columns:
+                        is_tick_data = True
+                        # 验证tick数据完整性
+                        required_fields = ['time', 'lastPrice', 'volume']
+                        missing_fields = [field for field in required_fields if field not in tick_df.columns]
+                        if missing_fields:
+                            self.log(f"警告: {stock_code} tick数据缺少字段: {missing_fields}")
+                else:
+                    # 检查K线数据
+                    for field, values in data.items():
+                        if hasattr(values, 'values') and len(values.values) > 0:
+                            if data_count == 0:
+                                data_count = len(values.values[0])
+                            break
+
+            if is_tick_data:
+                # tick数据走流式写入，整段数据作为一批写入
+                self.write_tick_frames([(None, data[stock_code])], stock_code, filename, save_format, save_path)
+
+            elif save_format == 'csv':
+                # 使用统一的文件名格式，不包含日期范围
+                csv_path = os.path.join(save_path, f"{stock_code}_{period}.csv")
+
+                # 处理K线数据
+                df = self.kline_data_to_frame(data)
+
+                self.write_csv_data(df, csv_path, stock_code, period, save_path, "K线数据")
+
+                # 验证保存的数据完整性
+                is_valid, message = self.validate_data_integrity(csv_path, 'kline', stock_code, period, save_path)
+                if not is_valid:
+                    self.log(f"数据完整性验证失败: {message}")
+                else:
+                    self.log(f"数据完整性验证: {message}")
+
+            elif save_format == 'json':
+                # 处理K线数据
+                json_writer = self.open_json_writer(save_path, filename)
+                try:
+                    json_writer.write(self.kline_data_to_frame(data))
+                finally:
+                    json_writer.close()
+
+                self.log(f"数据已保存到: {json_writer.file_path}")
+
+            elif save_format == 'db':
+                # 处理K线数据
+                df = self.kline_data_to_frame(data)
+                db_store = self.get_sqlite_store(save_path)
+                db_store.write(stock_code, period, df)
+                self.log(f"K线数据已保存到数据库: {db_store.path}")
+
+            else:
+                from qmt_columnar_store import COLUMNAR_FORMATS, ColumnarStore
+                from qmt_tick_store import BINARY_FORMAT
+
+                if save_format in COLUMNAR_FORMATS:
+                    # 按分区写入列式存储，与已有数据按时间合并去重
+                    store = ColumnarStore(save_path, save_format)
+                    store.write(stock_code, period, self.kline_data_to_frame(data))
+                    self.log(f"K线数据已保存到: {store.stock_dir(stock_code, period)}")
+
+                elif save_format == BINARY_FORMAT:
+                    self.log(f"错误: 二进制格式只用于保存分笔数据，{stock_code} 的 {period} 数据未保存")
+                    return False
+
+            # 保存成功后的验证
+            self.log(f"数据保存完成: {stock_code} ({data_count}条记录)")
+            return True
+
+        except Exception as e:
+            self.log(f"保存数据时发生错误: {e}")
+            import traceback
+            self.log(f"详细错误信息: {traceback.format_exc()}")
+            return False
+
+    def download_kline_bulk(self, stock_codes, data_type, start_date, end_date, save_format, save_path):
+        """合并请求下载一组股票的K线数据并逐只保存
+
+        Args:
+            stock_codes (tuple): 股票代码，同一组股票的下载起止日期相同
+            data_type (str): K线周期
+            start_date (str): 开始时间，格式YYYYMMDD或YYYYMMDDHHMMSS
+            end_date (str): 结束日期
+            save_format (str): 保存格式
+            save_path (str): 保存路径
+
+        Returns:
+            dict: {股票代码: (状态, 说明)}
+        """
+        self.log(f"合并下载 {len(stock_codes)} 只股票的 {data_type} 数据，时间范围: {start_date} 到 {end_date}")
+        frames = fetch_kline_bulk(stock_codes, data_type, start_date, end_date)
+
+        results = {}
+        for stock_code in stock_codes:
+            df = frames.get(stock_code)
+            if df is None or df.empty:
+                results[stock_code] = ('无数据', f"未获取到 {stock_code} 的数据")
+                continue
+
+            filename = f"{stock_code}_{data_type}_{start_date}_{end_date}"
+            if self.save_data(df, stock_code, filename, save_format, save_path, data_type):
+                results[stock_code] = ('完成', f"{stock_code} 数据下载完成")
+            else:
+                results[stock_code] = ('错误', f"{stock_code} 数据保存失败")
+        return results
+
+    def resample_local_data(self, stock_codes, period, save_format, save_path):
+        """从本地已保存的来源K线合成指定周期，不访问QMT
+
+        启用增量下载时只重新计算最后一根已合成K线及之后的部分，否则全部重新合成。
+
+        Args:
+            stock_codes (list): 股票代码列表
+            period (str): 目标周期，见 DERIVED_PERIODS
+            save_format (str): 保存格式
+            save_path (str): 保存路径
+
+        Returns:
+            int: 合成成功的股票数量
+        """
+        from qmt_bar_builder import DERIVED_PERIODS, LOOKBACK_MS, resample_incremental
+
+        base_period = DERIVED_PERIODS[period]
+        done_count = 0
+        for stock_code in stock_codes:
+            try:
+                last_time = None
+                start_ms = None
+                if self.incremental:
+                    last_time = self.get_local_last_time(stock_code, period, save_format, save_path)
+                    if last_time is not None:
+                        start_ms = last_time - LOOKBACK_MS
+
+                base_df = self.load_local_bars(stock_code, base_period, save_format, save_path, start_ms)
+                if base_df.empty:
+                    self.log(f"{stock_code} 没有本地 {base_period} 数据，无法合成 {period}")
+                    continue
+
+                bars = resample_incremental(base_df, period, last_time)
+                if bars.empty:
+                    self.log(f"{stock_code} 的 {period} 数据已是最新")
+                    continue
+
+                first_date = ms_to_date(bars['time'].iloc[0])
+                last_date = ms_to_date(bars['time'].iloc[-1])
+                filename = f"{stock_code}_{period}_{first_date}_{last_date}"
+                if self.save_data(bars, stock_code, filename, save_format, save_path, period):
+                    done_count += 1
+                    self.log(f"{stock_code} 由 {len(base_df)} 根 {base_period} K线合成 {len(bars)} 根 {period} K线")
+            except Exception as e:
+                self.log(f"合成 {stock_code} 的 {period} 数据时出错: {e}")
+
+        self.log(f"本地合成完成，共 {done_count}/{len(stock_codes)} 只股票")
+        return done_count
+
+    def build_local_tick_bars(self, stock_codes, period, start_date, end_date, save_format, save_path,
+                              max_workers=None):
+        """由本地已保存的分笔数据合成K线，不访问QMT
+
+        在给定的时间范围内逐个交易日合成，每只股票的每个交易日作为一个任务在多个进程中并行处理。
+        启用增量下载时跳过已合成K线最后一个交易日之前的交易日，最后一个交易日重新合成并按时间覆盖。
+
+        Args:
+            stock_codes (list): 股票代码列表
+            period (str): 目标周期，见 TICK_BAR_PERIODS
+            start_date (str): 开始日期，格式YYYYMMDD
+            end_date (str): 结束日期，格式YYYYMMDD
+            save_format (str): 保存格式
+            save_path (str): 保存路径
+            max_workers (int): 并行进程数，默认为CPU核数
+
+        Returns:
+            int: 合成成功的股票数量
+        """
+        if save_format == 'json':
+            self.log("错误: JSON格式的分笔数据不支持本地合成，请使用CSV、数据库或列式格式保存")
+            return 0
+
+        # 多进程合成只在使用时导入
+        from qmt_bar_builder import build_tick_bars_parallel
+
+        self.prepare_trading_calendar(end_date)
+        trading_days = self.trading_calendar.trading_days(start_date, end_date)
+
+        tasks = []
+        for stock_code in stock_codes:
+            first_date = start_date
+            if self.incremental:
+                last_time = self.get_local_last_time(stock_code, period, save_format, save_path)
+                if last_time is not None:
+                    first_date = max(first_date, ms_to_date(last_time))
+            tasks.extend((stock_code, trade_date) for trade_date in trading_days if trade_date >= first_date)
+
+        if not tasks:
+            self.log(f"{period} 数据已是最新")
+            return 0
+
+        self.log(f"开始由分笔数据合成 {period}，共 {len(tasks)} 个股票交易日")
+        # 同一只股票的各交易日按日期顺序写入，避免CSV追加乱序
+        results = {}
+        try:
+            for stock_code, trade_date, bars, tick_count, error in build_tick_bars_parallel(
+                    tasks, period, save_path, save_format, max_workers):
+                if error:
+                    self.log(f"合成 {stock_code} {trade_date} 的 {period} 数据时出错: {error}")
+                elif bars is not None and not bars.empty:
+                    results.setdefault(stock_code, []).append((trade_date, bars, tick_count))
+        except Exception as e:
+            self.log(f"分笔合成时发生错误: {e}")
+            return 0
+
+        done_count = 0
+        for stock_code, day_bars in results.items():
+            day_bars.sort(key=lambda item: item[0])
+            bars = pd.concat([item[1] for item in day_bars], ignore_index=True)
+            tick_count = sum(item[2] for item in day_bars)
+            filename = f"{stock_code}_{period}_{day_bars[0][0]}_{day_bars[-1][0]}"
+            if self.save_data(bars, stock_code, filename, save_format, save_path, period):
+                done_count += 1
+                self.log(f"{stock_code} 由 {tick_count} 笔分笔数据合成 {len(bars)} 根 {period} K线")
+
+        self.log(f"分笔合成完成，共 {done_count}/{len(stock_codes)} 只股票")
+        return done_count
+
+    def resample(self, stock_codes, period, save_format, save_path, start_date=None, end_date=None):
+        """按目标周期选择K线合成或分笔合成
+
+        Args:
+            stock_codes (list): 股票代码列表
+            period (str): 目标周期，DERIVED_PERIODS 或 TICK_BAR_PERIODS 中的一个
+            save_format (str): 保存格式
+            save_path (str): 保存路径
+            start_date (str): 分笔合成的开始日期，格式YYYYMMDD
+            end_date (str): 分笔合成的结束日期，格式YYYYMMDD
+
+        Returns:
+            int: 合成成功的股票数量
+        """
+        stock_codes = [code for code in stock_codes if code]
+        if not stock_codes:
+            self.log("错误: 请输入股票代码")
+            return 0
+
+        from qmt_bar_builder import DERIVED_PERIODS, TICK_BAR_PERIODS
+
+        if period in TICK_BAR_PERIODS:
+            return self.build_local_tick_bars(stock_codes, period, start_date, end_date, save_format, save_path)
+        if period not in DERIVED_PERIODS:
+            self.log(f"错误: 不支持合成 {period} 周期")
+            return 0
+        return self.resample_local_data(stock_codes, period, save_format, save_path)
+
+    def create_job(self, stock_codes, data_type, start_date, end_date, save_format, save_path, bulk_mode=True):
+        """为一组股票创建新的批量下载任务
+
+        Returns:
+            int: 任务编号
+        """
+        params = {
+            'data_type': data_type,
+            'start_date': start_date,
+            'end_date': end_date,
+            'save_format': save_format,
+            'save_path': save_path,
+            'bulk_mode': bulk_mode
+        }
+        job_id = self.job_journal.create_job(params, stock_codes)
+        self.log(f"已创建批量下载任务 #{job_id}，共 {len(stock_codes)} 只股票")
+        return job_id
+
+    def resumable_job(self):
+        """查找最近一个未完成的批量下载任务，已完成的股票不会重新下载
+
+        Returns:
+            tuple: (任务编号, 剩余股票代码)，没有可继续的任务时任务编号为None
+        """
+        job = self.job_journal.latest_job(unfinished_only=True)
+        if job is None:
+            self.log("没有未完成的批量下载任务")
+            return None, []
+
+        job_id = job['job_id']
+        # 异常退出时处于下载中的股票需要重新下载
+        self.job_journal.reset_states(job_id, (STATE_RUNNING,))
+        stock_codes = self.job_journal.codes_in_state(job_id, (STATE_PENDING,))
+
+        if not stock_codes:
+            self.job_journal.set_job_status(job_id, JOB_FINISHED)
+            self.log(f"任务 #{job_id} 没有剩余的股票")
+            return job_id, []
+
+        self.log(f"继续批量下载任务 #{job_id}（创建于 {job['created_at']}），剩余 {len(stock_codes)} 只股票")
+        return job_id, stock_codes
+
+    def failed_job(self):
+        """查找最近一个任务中失败的股票，并把它们重置为等待下载，不影响已完成的股票
+
+        Returns:
+            tuple: (任务编号, 失败的股票代码)，没有任务时任务编号为None
+        """
+        job = self.job_journal.latest_job()
+        if job is None:
+            self.log("没有批量下载任务")
+            return None, []
+
+        job_id = job['job_id']
+        stock_codes = self.job_journal.codes_in_state(job_id, (STATE_FAILED,))
+        if not stock_codes:
+            self.log(f"任务 #{job_id} 没有失败的股票")
+            return job_id, []
+
+        self.job_journal.reset_states(job_id, (STATE_FAILED,))
+        self.log(f"重试任务 #{job_id} 中失败的 {len(stock_codes)} 只股票")
+        return job_id, stock_codes
+
+    def run_batch_job(self, job_id, stock_codes, max_workers=4, on_status=None, on_progress=None):
+        """执行批量下载任务，逐只股票把状态写入任务日志
+
+        调用 stop_batch 后不再开始新的股票，正在下载的股票完成后返回，未完成的股票保留在任务日志中。
+
+        Args:
+            job_id (int): 任务编号，下载参数从任务日志中读取
+            stock_codes (list): 本次需要下载的股票代码
+            max_workers (int): 并发数
+            on_status: 股票状态变化回调，参数为 (股票代码, 状态文字)
+            on_progress: 进度回调，参数为 (已完成数量, 总数量)
+
+        Returns:
+            dict: {股票代码: (状态, 说明)}
+        """
+        job = self.job_journal.get_job(job_id)
+        self.batch_stop_event.clear()
+        self.batch_idle.clear()
+        self.batch_running = True
+
+        try:
+            total_count = len(stock_codes)
+            completed = {"count": 0}
+
+            data_type = job['data_type']
+            start_date = job['start_date']
+            end_date = job['end_date']
+            save_format = job['save_format']
+            save_path = job['save_path']
+            bulk_mode = job['bulk_mode'] and data_type != 'tick'
+            ranges = {}
+
+            # 确保保存目录存在
+            os.makedirs(save_path, exist_ok=True)
+
+            # 加载交易日历，用于增量起点和分笔下载的交易日枚举
+            self.prepare_trading_calendar(end_date)
+
+            def on_start(stock_codes):
+                self.job_journal.mark_running(job_id, stock_codes)
+                if on_status is not None:
+                    for stock_code in stock_codes:
+                        on_status(stock_code, '下载中')
+
+            def on_result(stock_code, status, message, elapsed):
+                completed["count"] += 1
+                range_start, range_end = ranges.get(stock_code, (None, None))
+                self.job_journal.mark_result(job_id, stock_code, RESULT_STATES.get(status, STATE_FAILED),
+                                             message, range_start, range_end)
+                if on_status is not None:
+                    on_status(stock_code, status)
+                if status == '错误':
+                    self.log(f"下载 {stock_code} 时发生错误: {message}")
+                else:
+                    self.log(f"{message} ({completed['count']}/{total_count}，耗时{elapsed:.1f}秒)")
+                if on_progress is not None:
+                    on_progress(completed["count"], total_count)
+
+            if bulk_mode:
+                # 合并请求模式：先逐只确定增量起点，起止时间相同的股票合并为一组请求
+                groups = {}
+                for stock_code in stock_codes:
+                    if self.batch_stop_event.is_set():
+                        break
+                    actual_start_date, actual_end_date = self.check_existing_data(
+                        stock_code, data_type, start_date, end_date, save_format, save_path
+                    )
+                    if actual_start_date is None or actual_end_date is None:
+                        on_result(stock_code, '已是最新', f"{stock_code} 的 {data_type} 数据已是最新，跳过下载", 0.0)
+                        continue
+                    # 按完整的开始时间分组，日内续传的股票保留各自精确的起点
+                    group_key = (actual_start_date, actual_end_date)
+                    ranges[stock_code] = group_key
+                    groups.setdefault(group_key, []).append(stock_code)
+
+                tasks = []
+                for codes in groups.values():
+                    tasks.extend(chunk_codes(codes, BULK_CHUNK_SIZE))
+
+                def worker(stock_codes):
+                    group_start, group_end = ranges[stock_codes[0]]
+                    return self.download_kline_bulk(
+                        stock_codes, data_type, group_start, group_end, save_format, save_path
+                    )
+
+                self.log(f"开始批量下载 {total_count} 只股票，合并为 {len(tasks)} 组请求，并发数: {max_workers}")
+            else:
+                tasks = [(stock_code,) for stock_code in stock_codes]
+
+                def worker(stock_codes):
+                    stock_code = stock_codes[0]
+                    return {stock_code: self.download_stock_data(
+                        stock_code, data_type, start_date, end_date, save_format, save_path, verbose=False
+                    )}
+
+                self.log(f"开始批量下载 {total_count} 只股票，并发数: {max_workers}")
+
+            engine = BatchDownloadEngine(worker, max_workers=max_workers,
+                                         on_start=on_start, on_result=on_result)
+            results = engine.run(tasks, stop_event=self.batch_stop_event)
+
+            failed_count = sum(1 for status, _ in results.values() if status == '错误')
+            if self.batch_stop_event.is_set():
+                self.job_journal.set_job_status(job_id, JOB_STOPPED)
+                remaining = len(self.job_journal.codes_in_state(job_id, (STATE_PENDING, STATE_RUNNING)))
+                self.log(f"批量下载任务 #{job_id} 已停止，本次处理 {len(results)} 只股票，"
+                         f"剩余 {remaining} 只可通过\"继续任务\"恢复")
+            else:
+                self.job_journal.set_job_status(job_id, JOB_FINISHED)
+                self.log(f"批量下载完成，共处理 {total_count} 只股票，失败 {failed_count} 只")
+
+            stats = xtdata_limiter.stats()
+            self.log(f"当前请求速率 {stats['rate']:.1f} 次/秒，累计成功 {stats['success']} 次，"
+                     f"失败 {stats['failure']} 次，重试 {stats['retry']} 次")
+            if failed_count:
+                self.log(f"可通过\"重试失败\"单独重新下载失败的 {failed_count} 只股票")
+            return results
+
+        except Exception as e:
+            self.log(f"批量下载时发生错误: {e}")
+            return {}
+        finally:
+            self.batch_running = False
+            self.batch_idle.set()
+
+    def stop_batch(self):
+        """请求停止批量下载：不再开始新的股票，正在下载的股票完成后停止"""
+        self.batch_stop_event.set()
+
+    def close(self, timeout=BATCH_STOP_TIMEOUT):
+        """停止批量下载，等待正在下载的股票完成后关闭数据清单、行情库和任务日志
+
+        Args:
+            timeout (float): 等待批量下载停止的最长时间（秒）
+        """
+        # 未完成的股票保留在任务日志中，下次启动后可以继续
+        self.batch_stop_event.set()
+        if not self.batch_idle.wait(timeout):
+            self.log("批量下载未能在等待时间内停止，强制关闭")
+        with self.manifest_lock:
+            for manifest in self.manifests.values():
+                manifest.close()
+            for store in self.sqlite_stores.values():
+                store.close()
+            self.manifests.clear()
+            self.sqlite_stores.clear()
+        self.job_journal.close()
@@ -0,0 +1,835 @@
+# coding=utf-8
+"""
+QMT本地数据存储
+维护保存目录下每个(股票代码, 周期, 格式)数据文件的清单：最新数据时间、记录数、文件大小和末尾校验和，
+增量下载和完整性验证时直接查询清单，不需要重新解析整个数据文件；并提供分笔数据的流式写入
+和以(股票代码, 周期, 时间)为主键的SQLite行情库
+"""
+
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import pandas as pd
+
+from qmt_columnar_store import expand_list_columns
+from qmt_trading_calendar import BEIJING_OFFSET_MS
+
+
+# 清单文件名，保存在数据目录下
+MANIFEST_FILE = "data_manifest.db"
+
+# SQLite行情库文件名和表名
+MARKET_DB_FILE = "stock_data.db"
+MARKET_TABLE = "market_data"
+MARKET_COLUMNS_TABLE = "market_columns"  # 每个周期写入过的字段
+
+# 旧版本按周期分表保存的表名（tick_data、data_{周期}），打开行情库时并入 MARKET_TABLE
+LEGACY_TABLE_PATTERN = re.compile(r'^(?:tick_data|data_(\w+))$')
+LEGACY_TABLE_PREFIX = "legacy_"  # 迁移后旧表改名保留，不再重复迁移
+
+# 批量写入时每次executemany的行数
+INSERT_BATCH_SIZE = 50000
+
+# 计算文件末尾校验和时读取的字节数
+CHECKSUM_BLOCK_SIZE = 65536
+
+# JSON中北京时间字符串的时区后缀
+BEIJING_TZ_SUFFIX = "+08:00"
+
+# JSON布局及对应的文件扩展名
+JSON_LAYOUTS = {
+    'ndjson': '.jsonl',
+    'columnar': '.cols.jsonl',
+}
+
+# 各类数据必须包含的列
+REQUIRED_COLUMNS = {
+    'tick': ['stock_code', 'time', 'lastPrice'],
+    'kline': ['time', 'open', 'high', 'low', 'close', 'volume'],
+}
+
+
+def parse_time_ms(value):
+    """将数据文件中的时间值转换为毫秒时间戳
+
+    Args:
+        value: 毫秒时间戳，保存CSV时由 pd.to_datetime(unit='ms') 生成的UTC时间字符串，
+            或 format_local_time 生成的带时区偏移的北京时间字符串
+
+    Returns:
+        int: 毫秒时间戳
+    """
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    timestamp = pd.Timestamp(text)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+    return (timestamp - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+
+
+def format_local_time(timestamps_ms):
+    """将毫秒时间戳列批量转换为北京时间字符串
+
+    CSV中的时间字符串是不带时区的UTC时间，这里的字符串带有时区偏移，
+    读取时不会与CSV的时间混淆，parse_time_ms 可以解析两种格式。
+
+    Args:
+        timestamps_ms (Series): 毫秒时间戳
+
+    Returns:
+        Series: 时间字符串，格式YYYY-MM-DD HH:MM:SS.fff+08:00
+    """
+    local_time = pd.to_datetime(timestamps_ms.astype('int64') + BEIJING_OFFSET_MS, unit='ms')
+    return local_time.dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3] + BEIJING_TZ_SUFFIX
+
+
+def read_csv_last_time(file_path, time_column='time'):
+    """只读取CSV文件的表头和最后一行，获取最新的数据时间
+
+    Args:
+        file_path (str): CSV文件路径
+        time_column (str): 时间列名
+
+    Returns:
+        int: 最后一行的毫秒时间戳，文件没有数据时返回None
+    """
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+        header = next(csv.reader([f.readline()]), [])
+    if time_column not in header:
+        return None
+    column_index = header.index(time_column)
+
+    last_line = None
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        buffer = b''
+        # 从文件末尾向前按块读取，直到找到最后一个非空行
+        while position > 0:
+            read_size = min(65536, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+            lines = buffer.rstrip(b'\r\n').split(b'\n')
+            if len(lines) > 1:
+                last_line = lines[-1].decode('utf-8').rstrip('\r')
+                break
+
+    # 只有表头时没有数据行
+    if not last_line or not last_line.strip():
+        return None
+
+    values = next(csv.reader([last_line]), [])
+    if len(values) <= column_index or not values[column_index]:
+        return None
+    return parse_time_ms(values[column_index])
+
+
+def find_csv_tail_offset(file_path, min_time, time_column='time'):
+    """从CSV文件末尾向前扫描，找到第一条时间不早于min_time的数据行的字节偏移
+
+    只读取与min_time重叠的文件末尾部分，不解析之前的数据。
+
+    Args:
+        file_path (str): CSV文件路径
+        min_time (int): 毫秒时间戳
+        time_column (str): 时间列名
+
+    Returns:
+        int: 字节偏移；所有数据行都早于min_time时返回文件长度
+    """
+    with open(file_path, 'rb') as f:
+        header_line = f.readline()
+        header = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+        column_index = header.index(time_column)
+        data_start = len(header_line)
+
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()      # buffer之后的数据行都已确认不早于min_time
+        position = offset      # buffer在文件中的起始位置
+        buffer = b''
+
+        while True:
+            cut = buffer.rfind(b'\n', 0, max(len(buffer) - 1, 0))
+            if cut == -1 and position > data_start:
+                # buffer中没有完整的一行，继续向前读取
+                read_size = min(65536, position - data_start)
+                position -= read_size
+                f.seek(position)
+                buffer = f.read(read_size) + buffer
+                continue
+
+            line = buffer[cut + 1:]
+            if not line:
+                return offset
+            if line.strip():
+                values = next(csv.reader([line.decode('utf-8').rstrip('\r\n')]), [])
+                if len(values) > column_index and values[column_index]:
+                    if parse_time_ms(values[column_index]) < min_time:
+                        return offset
+            offset = position + cut + 1
+            buffer = buffer[:cut + 1]
+
+
+def find_csv_time_offset(file_path, min_time, time_column='time'):
+    """按时间二分查找CSV文件，找到第一条时间不早于min_time的数据行的字节偏移
+
+    数据行按时间升序排列，每次跳到区间中点并对齐到下一行的行首，只解析该行的时间，
+    定位任意时刻只需读取对数级数量的行，与文件大小和目标时间在文件中的位置无关。
+
+    Args:
+        file_path (str): CSV文件路径
+        min_time (int): 毫秒时间戳
+        time_column (str): 时间列名
+
+    Returns:
+        int: 字节偏移；所有数据行都早于min_time时返回文件长度
+    """
+    with open(file_path, 'rb') as f:
+        header_line = f.readline()
+        header = next(csv.reader([header_line.decode('utf-8-sig')]), [])
+        column_index = header.index(time_column)
+
+        def line_time(position):
+            """读取从position开始的一行的时间，返回(时间, 下一行的偏移)，空行的时间视为无穷大"""
+            f.seek(position)
+            line = f.readline()
+            values = next(csv.reader([line.decode('utf-8').rstrip('\r\n')]), [])
+            if len(values) <= column_index or not values[column_index]:
+                return None, f.tell()
+            return parse_time_ms(values[column_index]), f.tell()
+
+        low = len(header_line)  # 始终是行首，之前的数据行都早于min_time
+        f.seek(0, os.SEEK_END)
+        high = f.tell()         # 行首或文件末尾，之后的数据行都不早于min_time
+
+        while low < high:
+            middle = (low + high) // 2
+            f.seek(middle - 1)
+            f.readline()
+            position = f.tell()  # 中点处或之后的第一个行首
+            if position >= high:
+                # 中点之后到high之间没有行首，从low开始逐行推进
+                position = low
+            row_time, next_position = line_time(position)
+            if row_time is None or row_time >= min_time:
+                high = position
+            else:
+                low = next_position
+        return high
+
+
+def find_csv_rows_before(file_path, end_offset, count):
+    """从end_offset向前按块扫描换行符，找到之前第count行的行首偏移，不解析内容
+
+    Args:
+        file_path (str): CSV文件路径
+        end_offset (int): 行首偏移或文件长度
+        count (int): 行数
+
+    Returns:
+        int: 字节偏移；end_offset之前不足count行时返回第一条数据行的偏移
+    """
+    if count <= 0:
+        return end_offset
+    with open(file_path, 'rb') as f:
+        data_start = len(f.readline())
+        position = end_offset - 1  # 跳过end_offset前一行的换行符
+        remaining = count
+        while position > data_start and remaining > 0:
+            read_size = min(65536, position - data_start)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size)
+            newlines = block.count(b'\n')
+            if newlines >= remaining:
+                index = len(block)
+                for _ in range(remaining):
+                    index = block.rfind(b'\n', 0, index)
+                return position + index + 1
+            remaining -= newlines
+    return data_start
+
+
+def read_csv_range_bytes(file_path, start_ms=None, end_ms=None, count=None, time_column='time'):
+    """定位CSV文件中一段时间范围内的数据行，返回表头和原始字节，不解析内容
+
+    Args:
+        file_path (str): CSV文件路径
+        start_ms (int): 开始时间（毫秒时间戳，包含）
+        end_ms (int): 结束时间（毫秒时间戳，包含）
+        count (int): 只取范围内最后count行
+        time_column (str): 时间列名
+
+    Returns:
+        tuple: (表头列名列表, 数据行字节)
+    """
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+        header = next(csv.reader([f.readline()]), [])
+
+    start_offset = find_csv_time_offset(file_path, start_ms, time_column) if start_ms is not None else None
+    end_offset = find_csv_time_offset(file_path, end_ms + 1, time_column) if end_ms is not None else None
+    with open(file_path, 'rb') as f:
+        header_length = len(f.readline())
+        if end_offset is None:
+            f.seek(0, os.SEEK_END)
+            end_offset = f.tell()
+        if start_offset is None:
+            start_offset = header_length
+        if count is not None:
+            start_offset = max(start_offset, find_csv_rows_before(file_path, end_offset, count))
+        f.seek(start_offset)
+        return header, f.read(max(end_offset - start_offset, 0))
+
+
+def parse_csv_bytes(header, data_bytes, columns=None, time_column='time'):
+    """解析不含表头的CSV数据行，时间列转换为毫秒时间戳
+
+    Args:
+        header (list): 列名
+        data_bytes (bytes): 数据行
+        columns (list): 需要的列，默认全部列
+        time_column (str): 时间列名
+
+    Returns:
+        DataFrame: 数据
+    """
+    if columns is not None:
+        columns = [time_column] + [column for column in columns if column in header and column != time_column]
+    if not data_bytes.strip():
+        return pd.DataFrame(columns=columns or header)
+    df = pd.read_csv(io.BytesIO(data_bytes), header=None, names=header, usecols=columns)
+    df[time_column] = (pd.to_datetime(df[time_column]) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+    return df[columns] if columns is not None else df
+
+
+def read_csv_time_range(file_path, start_ms=None, end_ms=None, columns=None, count=None, time_column='time'):
+    """读取CSV文件中一段时间范围内的数据，只解析范围内的字节
+
+    Args:
+        file_path (str): CSV文件路径
+        start_ms (int): 开始时间（毫秒时间戳，包含）
+        end_ms (int): 结束时间（毫秒时间戳，包含）
+        columns (list): 需要读取的列，默认读取全部列
+        count (int): 只读取范围内最后count行
+        time_column (str): 时间列名
+
+    Returns:
+        DataFrame: 按时间升序的数据，time列为毫秒时间戳
+    """
+    header, data_bytes = read_csv_range_bytes(file_path, start_ms, end_ms, count, time_column)
+    return parse_csv_bytes(header, data_bytes, columns, time_column)
+
+
+def upsert_csv_tail(file_path, df, time_column='time'):
+    """将数据合并到CSV文件末尾，按时间去重，新数据覆盖已有数据
+
+    只读取并重写文件末尾与新数据时间重叠的部分：截断重叠部分后，
+    写回合并、去重、排序后的数据，文件前面的数据保持不变。
+
+    Args:
+        file_path (str): CSV文件路径
+        df (DataFrame): 新数据，time列为毫秒时间戳，列与文件表头一致
+        time_column (str): 时间列名
+
+    Returns:
+        tuple: (从文件中移除的记录数, 写回的记录数)
+    """
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+        header = next(csv.reader([f.readline()]), [])
+    if set(header) != set(df.columns):
+        raise ValueError(f"数据列与文件表头不一致: {file_path}")
+
+    offset = find_csv_tail_offset(file_path, int(df[time_column].min()), time_column)
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        tail_bytes = f.read()
+
+    if tail_bytes.strip():
+        tail = pd.read_csv(io.BytesIO(tail_bytes), header=None, names=header)
+        tail[time_column] = tail[time_column].map(parse_time_ms)
+    else:
+        tail = pd.DataFrame(columns=header)
+
+    merged = pd.concat([tail, df[header]], ignore_index=True)
+    merged = merged.drop_duplicates(subset=time_column, keep='last').sort_values(time_column)
+    merged[time_column] = pd.to_datetime(merged[time_column].astype('int64'), unit='ms')
+
+    with open(file_path, 'r+b') as f:
+        f.truncate(offset)
+    merged.to_csv(file_path, mode='a', header=False, index=False, encoding='utf-8')
+    return len(tail), len(merged)
+
+
+def validate_frame(df, data_type, watermark=None):
+    """在写入前验证内存中数据的完整性，不需要重新读取数据文件
+
+    Args:
+        df (DataFrame): 待写入的数据，time列为毫秒时间戳
+        data_type (str): 'tick' 或 'kline'
+        watermark (int): 已有数据最新的毫秒时间戳，用于检查与已有数据的边界
+
+    Returns:
+        tuple: (是否通过, 说明)
+    """
+    if df is None or df.empty:
+        return False, "数据为空"
+
+    required_columns = REQUIRED_COLUMNS['tick' if data_type == 'tick' else 'kline']
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    if missing_columns:
+        return False, f"缺少必要列: {missing_columns}"
+
+    times = df['time']
+    if times.isna().any():
+        return False, f"存在 {int(times.isna().sum())} 条缺少时间的记录"
+
+    notes = []
+    duplicate_count = int(times.duplicated().sum())
+    if duplicate_count > 0:
+        notes.append(f"{duplicate_count} 条重复时间戳已去重")
+    if not times.is_monotonic_increasing:
+        notes.append("数据未按时间排序，已重新排序")
+    if watermark is not None:
+        overlap_count = int((times <= watermark).sum())
+        if overlap_count > 0:
+            notes.append(f"{overlap_count} 条与已有数据重叠，已按时间合并")
+
+    message = f"验证通过，本次 {len(df)} 条记录"
+    if notes:
+        message += "（" + "，".join(notes) + "）"
+    return True, message
+
+
+def tail_checksum(file_path, block_size=CHECKSUM_BLOCK_SIZE):
+    """计算文件末尾数据块的CRC32校验和
+
+    追加和末尾合并只会改变文件末尾，结合文件大小即可发现文件被外部改写，
+    而不需要读取整个文件。
+
+    Args:
+        file_path (str): 文件路径
+        block_size (int): 读取的字节数
+
+    Returns:
+        int: CRC32校验和
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - block_size, 0))
+        return zlib.crc32(f.read())
+
+
+def count_data_rows(file_path):
+    """统计CSV文件的数据行数（不含表头），按字节块计数换行符，不解析内容
+
+    Args:
+        file_path (str): CSV文件路径
+
+    Returns:
+        int: 数据行数
+    """
+    count = 0
+    last_byte = b'\n'
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            count += block.count(b'\n')
+            last_byte = block[-1:]
+    if last_byte != b'\n':
+        count += 1
+    return max(count - 1, 0)
+
+
+class DataManifest:
+    """本地数据清单
+
+    每条记录对应一个数据文件，记录最新数据时间（毫秒时间戳）、记录数、文件大小、修改时间和末尾校验和。
+    清单保存在数据目录下的SQLite文件中，每次更新都在一个事务内完成；
+    查询时直接读取内存中的字典。
+    """
+
+    def __init__(self, save_path):
+        """
+        初始化数据清单
+
+        Args:
+            save_path (str): 数据保存目录
+        """
+        self.path = os.path.join(save_path, MANIFEST_FILE)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS manifest (
+                stock_code TEXT NOT NULL,
+                period TEXT NOT NULL,
+                save_format TEXT NOT NULL,
+                last_time INTEGER,
+                rows INTEGER,
+                file_size INTEGER,
+                file_mtime INTEGER,
+                updated_at TEXT,
+                tail_crc INTEGER,
+                PRIMARY KEY (stock_code, period, save_format)
+            )
+        """)
+        self.conn.commit()
+
+        self.entries = {}
+        cursor = self.conn.execute(
+            "SELECT stock_code, period, save_format, last_time, rows, file_size, file_mtime, tail_crc FROM manifest"
+        )
+        for stock_code, period, save_format, last_time, rows, file_size, file_mtime, tail_crc in cursor:
+            self.entries[(stock_code, period, save_format)] = {
+                'last_time': last_time,
+                'rows': rows,
+                'file_size': file_size,
+                'file_mtime': file_mtime,
+                'tail_crc': tail_crc
+            }
+
+    def get(self, stock_code, period, save_format):
+        """查询数据文件的清单记录
+
+        Returns:
+            dict: 清单记录，不存在时返回None
+        """
+        return self.entries.get((stock_code, period, save_format))
+
+    def update(self, stock_code, period, save_format, last_time, rows, file_path=None):
+        """更新数据文件的清单记录
+
+        Args:
+            stock_code (str): 股票代码
+            period (str): 周期
+            save_format (str): 保存格式
+            last_time (int): 最新数据的毫秒时间戳
+            rows (int): 记录数
+            file_path (str): 数据文件路径，用于记录文件大小、修改时间和末尾校验和
+        """
+        file_size = None
+        file_mtime = None
+        tail_crc = None
+        if file_path and os.path.exists(file_path):
+            stat = os.stat(file_path)
+            file_size = stat.st_size
+            file_mtime = stat.st_mtime_ns
+            tail_crc = tail_checksum(file_path)
+
+        entry = {
+            'last_time': int(last_time) if last_time is not None else None,
+            'rows': int(rows) if rows is not None else None,
+            'file_size': file_size,
+            'file_mtime': file_mtime,
+            'tail_crc': tail_crc
+        }
+        updated_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO manifest (stock_code, period, save_format, last_time, rows, "
+                    "file_size, file_mtime, updated_at, tail_crc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (stock_code, period, save_format, entry['last_time'], entry['rows'],
+                     file_size, file_mtime, updated_at, tail_crc)
+                )
+            self.entries[(stock_code, period, save_format)] = entry
+
+    def remove(self, stock_code, period, save_format):
+        """删除数据文件的清单记录"""
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM manifest WHERE stock_code=? AND period=? AND save_format=?",
+                    (stock_code, period, save_format)
+                )
+            self.entries.pop((stock_code, period, save_format), None)
+
+    @staticmethod
+    def matches_file(entry, file_path):
+        """清单记录是否与磁盘上的文件一致（文件未被外部修改）
+
+        Args:
+            entry (dict): 清单记录
+            file_path (str): 数据文件路径
+
+        Returns:
+            bool: 文件大小和修改时间都与清单一致时返回True
+        """
+        if not entry or not os.path.exists(file_path):
+            return False
+        stat = os.stat(file_path)
+        return entry['file_size'] == stat.st_size and entry['file_mtime'] == stat.st_mtime_ns
+
+    @staticmethod
+    def verify_file(entry, file_path):
+        """在文件大小和修改时间之外再核对末尾校验和，确认文件仍是上次写入时的状态
+
+        Args:
+            entry (dict): 清单记录
+            file_path (str): 数据文件路径
+
+        Returns:
+            bool: 文件与清单一致时返回True
+        """
+        if not DataManifest.matches_file(entry, file_path) or entry.get('tail_crc') is None:
+            return False
+        return entry['tail_crc'] == tail_checksum(file_path)
+
+    def close(self):
+        """关闭清单数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+
+class JsonStreamWriter:
+    """JSON流式写入器
+
+    支持两种布局，都是每行一个JSON对象，可以按行或按块加载，不需要一次性解析整个文件：
+    - ndjson: 每行一条记录
+    - columnar: 每批数据一行，{字段: [值, ...]}
+
+    每批数据到达后整体序列化写入文件，时间列批量转换为带+08:00偏移的北京时间字符串，
+    不逐条构造Python字典，也不缩进。
+    """
+
+    def __init__(self, file_path, layout='ndjson'):
+        """
+        初始化写入器
+
+        Args:
+            file_path (str): 文件路径
+            layout (str): 'ndjson' 或 'columnar'
+        """
+        if layout not in JSON_LAYOUTS:
+            raise ValueError(f"不支持的JSON布局: {layout}")
+        self.file_path = file_path
+        self.layout = layout
+        self.total_records = 0
+        self.file = open(file_path, 'w', encoding='utf-8')
+
+    def write(self, df):
+        """写入一批数据
+
+        Args:
+            df (DataFrame): 数据，time列为毫秒时间戳
+        """
+        if df.empty:
+            return
+
+        out = df.reset_index(drop=True)
+        if 'time' in out.columns:
+            out = out.assign(time=format_local_time(out['time']))
+
+        if self.layout == 'ndjson':
+            text = out.to_json(orient='records', lines=True, force_ascii=False)
+            self.file.write(text if text.endswith('\n') else text + '\n')
+        else:
+            parts = []
+            for column in out.columns:
+                values = out[column].to_json(orient='values', force_ascii=False)
+                parts.append(f"{json.dumps(str(column), ensure_ascii=False)}:{values}")
+            self.file.write('{' + ','.join(parts) + '}\n')
+        self.total_records += len(out)
+
+    def close(self):
+        """关闭文件"""
+        self.file.close()
+
+
+class SQLiteMarketStore:
+    """SQLite行情库
+
+    所有股票、所有周期的数据保存在同一张表中，主键为(stock_code, period, time)，
+    使用WITHOUT ROWID表按主键聚簇存储，按股票和周期查询最新时间只需一次索引查找。
+    数据库使用WAL日志，连接在整个程序生命周期内复用，写入按批次executemany，
+    时间相同的记录直接覆盖，重复下载不会产生重复数据。
+    不同周期的字段不同，每个周期写入过的字段记录在 MARKET_COLUMNS_TABLE 中，读取时按该列表选择列。
+    旧版本写入的 tick_data、data_{周期} 表在打开时并入行情表，见 _migrate_legacy_tables。
+    """
+
+    def __init__(self, db_path):
+        """
+        初始化行情库
+
+        Args:
+            db_path (str): 数据库文件路径
+        """
+        self.path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MARKET_TABLE} (
+                stock_code TEXT NOT NULL,
+                period TEXT NOT NULL,
+                time INTEGER NOT NULL,
+                PRIMARY KEY (stock_code, period, time)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {MARKET_COLUMNS_TABLE} (
+                period TEXT NOT NULL,
+                column_name TEXT NOT NULL,
+                PRIMARY KEY (period, column_name)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+        self.columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({MARKET_TABLE})")]
+        self.period_columns = {}  # 周期 -> 写入过的字段集合
+        for period, column in self.conn.execute(f"SELECT period, column_name FROM {MARKET_COLUMNS_TABLE}"):
+            self.period_columns.setdefault(period, set()).add(column)
+        self._migrate_legacy_tables()
+
+    def write(self, stock_code, period, df):
+        """写入数据，主键相同的记录覆盖已有数据
+
+        Args:
+            stock_code (str): 股票代码
+            period (str): 周期
+            df (DataFrame): 数据，time列为毫秒时间戳
+
+        Returns:
+            int: 写入的记录数
+        """
+        if df is None or df.empty or 'time' not in df.columns:
+            return 0
+
+        df = df.drop(columns=['stock_code', 'period'], errors='ignore').reset_index(drop=True)
+        df['time'] = df['time'].astype('int64')
+        df = expand_list_columns(df)
+
+        value_columns = [column for column in df.columns if column != 'time']
+        all_columns = ['stock_code', 'period', 'time'] + value_columns
+        column_sql = ', '.join(f'"{column}"' for column in all_columns)
+        placeholders = ', '.join('?' for _ in all_columns)
+        sql = f"INSERT OR REPLACE INTO {MARKET_TABLE} ({column_sql}) VALUES ({placeholders})"
+
+        # 逐列转换为Python原生类型，避免逐行构造字典
+        column_values = [df['time'].tolist()] + [df[column].tolist() for column in value_columns]
+        count = len(df)
+
+        with self.lock:
+            with self.conn:
+                self._ensure_columns(df, value_columns)
+                self._register_period_columns(period, value_columns)
+                for start in range(0, count, INSERT_BATCH_SIZE):
+                    end = min(start + INSERT_BATCH_SIZE, count)
+                    rows = zip([stock_code] * (end - start), [period] * (end - start),
+                               *[values[start:end] for values in column_values])
+                    self.conn.executemany(sql, rows)
+        return count
+
+    def last_time(self, stock_code, period):
+        """获取股票在指定周期下最新数据的时间
+
+        Returns:
+            int: 毫秒时间戳，没有数据时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT MAX(time) FROM {MARKET_TABLE} WHERE stock_code=? AND period=?",
+                (stock_code, period)
+            ).fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def read(self, stock_code, period, start_ms=None, end_ms=None, columns=None, count=None):
+        """读取数据
+
+        Args:
+            stock_code (str): 股票代码
+            period (str): 周期
+            start_ms (int): 开始时间（毫秒时间戳，包含）
+            end_ms (int): 结束时间（毫秒时间戳，包含）
+            columns (list): 需要读取的列，默认读取该周期写入过的全部列
+            count (int): 只读取范围内最后count条，按主键倒序查找
+
+        Returns:
+            DataFrame: 按时间升序的数据，time列为毫秒时间戳
+        """
+        params = (stock_code, period,
+                  start_ms if start_ms is not None else -(1 << 62),
+                  end_ms if end_ms is not None else (1 << 62))
+        order_sql = " ORDER BY time"
+        if count is not None:
+            order_sql = " ORDER BY time DESC LIMIT ?"
+            params += (int(count),)
+
+        # 字段列表与增加列的 ALTER TABLE 在同一把锁下读取
+        with self.lock:
+            if columns is None:
+                # 同一张表中保存了不同周期的数据，只选择该周期写入过的列，与数据是否为空无关
+                used = self.period_columns.get(period, ())
+                select = ['time'] + [column for column in self.columns if column in used and column != 'time']
+            else:
+                select = ['time'] + [column for column in columns if column != 'time' and column in self.columns]
+            column_sql = ', '.join(f'"{column}"' for column in select)
+            sql = (f"SELECT {column_sql} FROM {MARKET_TABLE} "
+                   "WHERE stock_code=? AND period=? AND time BETWEEN ? AND ?" + order_sql)
+            df = pd.read_sql_query(sql, self.conn, params=params)
+        if count is not None:
+            df = df.iloc[::-1].reset_index(drop=True)
+        return df
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+    def _ensure_columns(self, df, value_columns):
+        """为新出现的字段增加列，列类型按数据类型确定"""
+        for column in value_columns:
+            if column in self.columns:
+                continue
+            kind = df[column].dtype.kind
+            if kind in 'iub':
+                column_type = 'INTEGER'
+            elif kind == 'f':
+                column_type = 'REAL'
+            else:
+                column_type = 'TEXT'
+            self.conn.execute(f'ALTER TABLE {MARKET_TABLE} ADD COLUMN "{column}" {column_type}')
+            self.columns.append(column)
+
+    def _register_period_columns(self, period, value_columns):
+        """记录周期写入过的字段，只在字段第一次出现时写入数据库"""
+        known = self.period_columns.setdefault(period, set())
+        new_columns = [column for column in value_columns if column not in known]
+        if new_columns:
+            self.conn.executemany(f"INSERT OR IGNORE INTO {MARKET_COLUMNS_TABLE} (period, column_name) VALUES (?, ?)",
+                                  [(period, column) for column in new_columns])
+            known.update(new_columns)
+
+    def _migrate_legacy_tables(self):
+        """把旧版本按周期分表保存的数据并入行情表，迁移完成的旧表改名为 legacy_{表名} 保留
+
+        旧表由 DataFrame.to_sql 追加写入，time列为UTC时间字符串，可能有重复记录，
+        并入时按主键去重。数据按块读取，不需要一次载入整张旧表。
+        """
+        tables = [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        for table in tables:
+            match = LEGACY_TABLE_PATTERN.match(table)
+            if match is None:
+                continue
+            columns = [row[1] for row in self.conn.execute(f'PRAGMA table_info("{table}")')]
+            if 'stock_code' not in columns or 'time' not in columns:
+                continue
+            period = match.group(1) or 'tick'
+            for chunk in pd.read_sql_query(f'SELECT * FROM "{table}"', self.conn, chunksize=INSERT_BATCH_SIZE):
+                if not pd.api.types.is_numeric_dtype(chunk['time']):
+                    chunk['time'] = (pd.to_datetime(chunk['time']) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+                for stock_code, df in chunk.groupby('stock_code', sort=False):
+                    self.write(stock_code, period, df)
+            with self.conn:
+                self.conn.execute(f'ALTER TABLE "{table}" RENAME TO "{LEGACY_TABLE_PREFIX}{table}"')
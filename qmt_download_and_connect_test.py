@@ -8,18 +8,21 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
 import threading
 import queue
+import collections
 import os
 import json
-import sqlite3
 import pandas as pd
 import datetime
-from datetime import timedelta
 import time
-import winsound  # Windows系统声音
-import markdown  # MD文件渲染
-import html2text  # HTML转文本
-import subprocess  # 用于播放自定义音效
-import json  # JSON配置文件管理
+import subprocess  # 用于打开配置文件
+
+from qmt_core import BATCH_STOP_TIMEOUT, QMTDataService
+from qmt_data_store import JSON_LAYOUTS
+from qmt_tick_store import BINARY_FORMAT
+from qmt_bar_builder import DERIVED_PERIODS, TICK_BAR_PERIODS
+from qmt_job_journal import STATE_LABELS
+from qmt_monitor import (AlertSoundWorker, FullPushMonitor, DEFAULT_COOLDOWN, DEFAULT_HYSTERESIS, SOUND_TYPES,
+                         get_monitor_stock_list)
 
 # QMT相关导入
 try:
@@ -29,8 +32,69 @@ try:
     xtdata.enable_hello = False
     QMT_AVAILABLE = True
 except ImportError:
+    XtQuantTraderCallback = object  # 未安装QMT库时界面和本地功能仍可使用
     QMT_AVAILABLE = False
 
+# 实时数据显示区域最多保留的行数，超出后丢弃最早的行
+REALTIME_MAX_LINES = 500
+
+# 实时数据显示区域的刷新间隔（毫秒），即每秒最多重绘10次
+REALTIME_REFRESH_MS = 100
+
+
+class RealtimeLineBuffer:
+    """实时数据显示区域的行缓冲
+
+    任意线程都可以追加文字，文字按行保存在固定容量的环形缓冲中，界面线程按固定间隔取出新增的行一次性插入显示区域，
+    因此一次刷新之间的多次追加只触发一次重绘，显示区域和缓冲的大小都不超过 max_lines 行。
+    """
+
+    def __init__(self, max_lines=REALTIME_MAX_LINES):
+        self.max_lines = max_lines
+        self.lock = threading.Lock()
+        self.lines = collections.deque(maxlen=max_lines)  # 当前显示的全部行
+        self.pending = collections.deque(maxlen=max_lines)  # 上次刷新后新增的行
+        self.reset = False  # 上次刷新后是否清空过，清空后需要整体重绘
+        self.dirty = False
+
+    def append(self, text, replace=False):
+        """追加文字
+
+        Args:
+            text (str): 要显示的文字，可以包含多行
+            replace (bool): 是否先清空已有内容
+        """
+        lines = text.splitlines()
+        with self.lock:
+            if replace:
+                self.lines.clear()
+                self.pending.clear()
+                self.reset = True
+            self.lines.extend(lines)
+            self.pending.extend(lines)
+            self.dirty = True
+
+    def clear(self):
+        """清空全部内容"""
+        self.append("", replace=True)
+
+    def take(self):
+        """取出上次刷新后的变化
+
+        Returns:
+            tuple: (是否整体重绘, 要插入的行)，没有变化时返回None
+        """
+        with self.lock:
+            if not self.dirty:
+                return None
+            # 新增的行超过容量时旧内容已经全部被挤出，同样整体重绘
+            reset = self.reset or len(self.pending) >= self.max_lines
+            lines = list(self.lines) if reset else list(self.pending)
+            self.pending.clear()
+            self.reset = False
+            self.dirty = False
+            return reset, lines
+
 
 class QMTTraderCallback(XtQuantTraderCallback):
     """QMT交易回调类"""
@@ -71,14 +135,16 @@ class QMTDataDownloadGUI:
         # 初始化基础变量（必须在其他方法调用之前）
         self.xt_trader = None
         self.log_queue = queue.Queue()
+        self.realtime_lines = RealtimeLineBuffer()  # 实时数据显示区域的内容，由 render_realtime_display 定时刷新
         
         # 检查并设置图标
         self.set_window_icon()
         self.is_connected = False
-        self.fullpush_subscription_id = None
-        self.fullpush_running = False
         self.custom_stock_list = []  # 自定义股票列表
-        self.alert_count = {"rise": 0, "fall": 0}  # 预警计数
+        self.fullpush_monitor = None  # 全推监控，启动时创建
+        self.sound_worker = AlertSoundWorker(log_callback=self.log)  # 预警声音线程，全推监控和测试声音共用
+        # 下载、保存和批量任务逻辑由数据服务实现，界面只负责收集参数和显示结果
+        self.service = QMTDataService(log_callback=self.log)
         
         # 配置文件管理
         self.config_file = "qmt_config.json"
@@ -90,12 +156,19 @@ class QMTDataDownloadGUI:
             "monitor": {
                 "rise_threshold": 0.05,
                 "fall_threshold": 0.05,
+                "hysteresis": DEFAULT_HYSTERESIS,
+                "cooldown": DEFAULT_COOLDOWN,
                 "monitor_stocks": "全市场",
                 "sound_enabled": True,
                 "sound_type": "系统提示音"
             },
             "realtime": {
                 "stock_code": "000001.SZ"
+            },
+            "download": {
+                "batch_workers": 4,
+                "bulk_mode": True,
+                "json_layout": "ndjson"
             }
         }
         
@@ -108,8 +181,9 @@ class QMTDataDownloadGUI:
         # 绑定变量变化事件，实现自动保存
         self.bind_config_events()
         
-        # 启动日志处理
+        # 启动日志处理和实时数据显示刷新
         self.process_log_queue()
+        self.render_realtime_display()
         
         # 绑定窗口关闭事件
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -239,10 +313,18 @@ class QMTDataDownloadGUI:
         save_frame.pack(fill=tk.X, padx=5, pady=5)
         
         self.save_format_var = tk.StringVar(value='csv')
-        save_formats = [('CSV', 'csv'), ('JSON', 'json'), ('数据库', 'db')]
+        save_formats = [('CSV', 'csv'), ('JSON', 'json'), ('数据库', 'db'), ('Parquet', 'parquet'), ('Feather', 'feather'),
+                        ('二进制(仅分笔)', BINARY_FORMAT)]
         for i, (text, value) in enumerate(save_formats):
             ttk.Radiobutton(save_frame, text=text, variable=self.save_format_var, value=value).grid(row=0, column=i, padx=10)
         
+        # JSON布局：逐行记录或按列保存
+        ttk.Label(save_frame, text="JSON布局:").grid(row=1, column=0, sticky=tk.W, padx=10, pady=(5, 0))
+        self.json_layout_var = tk.StringVar(value='ndjson')
+        json_layouts = [('逐行记录', 'ndjson'), ('按列保存', 'columnar')]
+        for i, (text, value) in enumerate(json_layouts):
+            ttk.Radiobutton(save_frame, text=text, variable=self.json_layout_var, value=value).grid(row=1, column=i + 1, padx=10, pady=(5, 0))
+        
         # 下载选项
         option_frame = ttk.LabelFrame(download_frame, text="下载选项", padding=10)
         option_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -250,6 +332,15 @@ class QMTDataDownloadGUI:
         self.incremental_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(option_frame, text="增量下载（跳过已有数据）", variable=self.incremental_var).pack(side=tk.LEFT, padx=5)
         
+        # 本地合成：从已保存的1分钟线/日线/分笔数据合成其他周期
+        ttk.Label(option_frame, text="合成周期:").pack(side=tk.LEFT, padx=(20, 2))
+        self.resample_period_var = tk.StringVar(value='15m')
+        ttk.Combobox(option_frame, textvariable=self.resample_period_var,
+                     values=list(DERIVED_PERIODS) + list(TICK_BAR_PERIODS),
+                     width=6, state='readonly').pack(side=tk.LEFT, padx=2)
+        ttk.Button(option_frame, text="本地合成",
+                   command=lambda: self.resample_local_data([self.stock_code_var.get()])).pack(side=tk.LEFT, padx=5)
+        
         # 下载控制
         download_control_frame = ttk.Frame(download_frame)
         download_control_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -307,6 +398,16 @@ class QMTDataDownloadGUI:
         
         ttk.Button(batch_control_frame, text="开始批量下载", command=self.start_batch_download).pack(side=tk.LEFT, padx=5)
         ttk.Button(batch_control_frame, text="停止下载", command=self.stop_batch_download).pack(side=tk.LEFT, padx=5)
+        ttk.Button(batch_control_frame, text="继续任务", command=self.resume_batch_download).pack(side=tk.LEFT, padx=5)
+        ttk.Button(batch_control_frame, text="重试失败", command=self.retry_failed_downloads).pack(side=tk.LEFT, padx=5)
+        ttk.Button(batch_control_frame, text="批量合成", command=self.resample_batch_list).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(batch_control_frame, text="并发数:").pack(side=tk.LEFT, padx=(10, 2))
+        self.batch_workers_var = tk.IntVar(value=4)
+        ttk.Spinbox(batch_control_frame, from_=1, to=16, textvariable=self.batch_workers_var, width=4).pack(side=tk.LEFT, padx=2)
+        
+        self.bulk_mode_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(batch_control_frame, text="合并请求", variable=self.bulk_mode_var).pack(side=tk.LEFT, padx=5)
         
         # 进度条
         self.progress_var = tk.DoubleVar()
@@ -343,6 +444,15 @@ class QMTDataDownloadGUI:
         self.fall_threshold_var = tk.DoubleVar(value=0.09)
         ttk.Entry(fullpush_frame, textvariable=self.fall_threshold_var, width=8).grid(row=0, column=3, padx=5)
         
+        # 预警回差和冷却时间：越过阈值只预警一次，回到阈值以内超过回差后重新布防
+        ttk.Label(fullpush_frame, text="回差:").grid(row=0, column=4, sticky=tk.W, padx=5)
+        self.hysteresis_var = tk.DoubleVar(value=DEFAULT_HYSTERESIS)
+        ttk.Entry(fullpush_frame, textvariable=self.hysteresis_var, width=8).grid(row=0, column=5, padx=5)
+        
+        ttk.Label(fullpush_frame, text="冷却(秒):").grid(row=0, column=6, sticky=tk.W, padx=5)
+        self.cooldown_var = tk.DoubleVar(value=DEFAULT_COOLDOWN)
+        ttk.Entry(fullpush_frame, textvariable=self.cooldown_var, width=8).grid(row=0, column=7, padx=5)
+        
         # 第二行：声音设置
         ttk.Label(fullpush_frame, text="预警声音:").grid(row=1, column=0, sticky=tk.W, padx=5)
         self.sound_enabled_var = tk.BooleanVar(value=True)
@@ -350,7 +460,7 @@ class QMTDataDownloadGUI:
         
         self.sound_type_var = tk.StringVar(value="系统提示音")
         sound_combo = ttk.Combobox(fullpush_frame, textvariable=self.sound_type_var, width=12, state="readonly")
-        sound_combo['values'] = ("系统提示音", "警报声", "铃声", "自定义音效")
+        sound_combo['values'] = SOUND_TYPES
         sound_combo.grid(row=1, column=2, columnspan=2, sticky=tk.W, padx=5)
         
         # 第三行：批量监控设置
@@ -480,7 +590,6 @@ QMT连接和数据下载测试工具 v1.0
                 self.log("开始连接QMT...")
                 
                 # 创建交易接口，使用时间戳生成唯一的session_id
-                import time
                 session_id = int(time.time())
                 self.log(f"生成会话ID: {session_id}")
                 self.xt_trader = XtQuantTrader(path, session_id)
@@ -604,144 +713,10 @@ QMT连接和数据下载测试工具 v1.0
         self.status_text.insert(tk.END, text)
         self.status_text.config(state=tk.DISABLED)
     
-    def check_existing_data(self, stock_code, data_type, start_date, end_date, save_format, save_path):
-        """检查已有数据，返回需要下载的日期范围"""
-        if not self.incremental_var.get():
-            # 如果不启用增量下载，返回原始日期范围
-            return start_date, end_date
-        
-        try:
-            # 根据保存格式确定文件路径
-            if save_format == 'csv':
-                file_path = os.path.join(save_path, f"{stock_code}_{data_type}.csv")
-                if os.path.exists(file_path):
-                    # 读取CSV文件的最后一行，获取最新日期
-                    import pandas as pd
-                    df = pd.read_csv(file_path)
-                    if not df.empty:
-                        if data_type == 'tick':
-                            # tick数据使用time列
-                            if 'time' in df.columns:
-                                last_time = df['time'].iloc[-1]
-                                # 提取日期部分
-                                if isinstance(last_time, str):
-                                    last_date = last_time[:8]  # 取前8位作为日期
-                                else:
-                                    last_date = str(int(last_time))[:8]
-                                
-                                # 计算下一天作为新的开始日期
-                                last_dt = datetime.datetime.strptime(last_date, '%Y%m%d')
-                                next_dt = last_dt + timedelta(days=1)
-                                new_start_date = next_dt.strftime('%Y%m%d')
-                                
-                                if new_start_date <= end_date:
-                                    self.log(f"检测到已有数据到 {last_date}，从 {new_start_date} 开始增量下载")
-                                    return new_start_date, end_date
-                                else:
-                                    self.log(f"数据已是最新，无需下载")
-                                    return None, None
-                        else:
-                            # K线数据使用time列
-                            if 'time' in df.columns:
-                                last_time = df['time'].iloc[-1]
-                                last_date = str(last_time)
-                                
-                                # 根据数据类型计算下一个时间点
-                                if data_type == '1d':
-                                    last_dt = datetime.datetime.strptime(last_date, '%Y%m%d')
-                                    next_dt = last_dt + timedelta(days=1)
-                                    new_start_date = next_dt.strftime('%Y%m%d')
-                                else:
-                                    # 对于分钟数据，使用下一天
-                                    last_dt = datetime.datetime.strptime(last_date[:8], '%Y%m%d')
-                                    next_dt = last_dt + timedelta(days=1)
-                                    new_start_date = next_dt.strftime('%Y%m%d')
-                                
-                                if new_start_date <= end_date:
-                                    self.log(f"检测到已有数据到 {last_date}，从 {new_start_date} 开始增量下载")
-                                    return new_start_date, end_date
-                                else:
-                                    self.log(f"数据已是最新，无需下载")
-                                    return None, None
-            
-            elif save_format == 'db':
-                # 检查数据库中的最新数据
-                db_path = os.path.join(save_path, 'stock_data.db')
-                if os.path.exists(db_path):
-                    import sqlite3
-                    conn = sqlite3.connect(db_path)
-                    table_name = f"{stock_code}_{data_type}"
-                    
-                    # 检查表是否存在
-                    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-                    if cursor.fetchone():
-                        # 获取最新的时间
-                        cursor = conn.execute(f"SELECT MAX(time) FROM {table_name}")
-                        result = cursor.fetchone()
-                        if result and result[0]:
-                            last_time = str(result[0])
-                            if data_type == 'tick':
-                                last_date = last_time[:8]
-                                last_dt = datetime.datetime.strptime(last_date, '%Y%m%d')
-                                next_dt = last_dt + timedelta(days=1)
-                                new_start_date = next_dt.strftime('%Y%m%d')
-                            else:
-                                last_date = last_time[:8] if len(last_time) >= 8 else last_time
-                                last_dt = datetime.datetime.strptime(last_date, '%Y%m%d')
-                                next_dt = last_dt + timedelta(days=1)
-                                new_start_date = next_dt.strftime('%Y%m%d')
-                            
-                            if new_start_date <= end_date:
-                                self.log(f"检测到数据库中已有数据到 {last_date}，从 {new_start_date} 开始增量下载")
-                                conn.close()
-                                return new_start_date, end_date
-                            else:
-                                self.log(f"数据库中数据已是最新，无需下载")
-                                conn.close()
-                                return None, None
-                    conn.close()
-            
-        except Exception as e:
-            self.log(f"检查已有数据时出错: {e}，将进行完整下载")
-        
-        # 如果检查失败或没有已有数据，返回原始日期范围
-        return start_date, end_date
-    
-    def validate_data_integrity(self, file_path, data_type):
-        """验证保存文件的数据完整性"""
-        try:
-            if not os.path.exists(file_path):
-                return False, "文件不存在"
-            
-            if file_path.endswith('.csv'):
-                import pandas as pd
-                df = pd.read_csv(file_path)
-                
-                if df.empty:
-                    return False, "文件为空"
-                
-                # 检查必要的列
-                if data_type == 'tick':
-                    required_columns = ['stock_code', 'time', 'lastPrice']
-                else:
-                    required_columns = ['time', 'open', 'high', 'low', 'close', 'volume']
-                
-                missing_columns = [col for col in required_columns if col not in df.columns]
-                if missing_columns:
-                    return False, f"缺少必要列: {missing_columns}"
-                
-                # 检查数据是否有重复的时间戳
-                if 'time' in df.columns:
-                    duplicate_count = df['time'].duplicated().sum()
-                    if duplicate_count > 0:
-                        self.log(f"警告: 发现 {duplicate_count} 条重复时间戳的数据")
-                
-                return True, f"验证通过，共 {len(df)} 条记录"
-            
-            return True, "文件存在"
-            
-        except Exception as e:
-            return False, f"验证时出错: {e}"
+    def apply_service_settings(self):
+        """把界面上的增量下载和JSON布局设置同步到数据服务"""
+        self.service.incremental = self.incremental_var.get()
+        self.service.json_layout = self.json_layout_var.get()
 
     def download_single_stock(self):
         """下载单只股票数据"""
@@ -762,285 +737,23 @@ QMT连接和数据下载测试工具 v1.0
                     self.log("错误: 请输入股票代码")
                     return
                 
-                # 检查已有数据，确定实际需要下载的日期范围
-                actual_start_date, actual_end_date = self.check_existing_data(
-                    stock_code, data_type, start_date, end_date, save_format, save_path
-                )
-                
-                if actual_start_date is None or actual_end_date is None:
-                    self.log(f"{stock_code} 的 {data_type} 数据已是最新，无需下载")
-                    return
-                
-                self.log(f"开始下载 {stock_code} 的 {data_type} 数据，时间范围: {actual_start_date} 到 {actual_end_date}")
-                
                 # 确保保存目录存在
                 os.makedirs(save_path, exist_ok=True)
                 
-                # 下载历史数据
-                if data_type == 'tick':
-                    # 对于tick数据，需要按天下载
-                    self.log(f"开始下载 {stock_code} 的tick数据")
-                    
-                    # 将日期字符串转换为datetime对象
-                    start_dt = datetime.datetime.strptime(actual_start_date, '%Y%m%d')
-                    end_dt = datetime.datetime.strptime(actual_end_date, '%Y%m%d')
-                    
-                    # 按天下载tick数据
-                    current_dt = start_dt
-                    all_tick_data = []
-                    
-                    while current_dt <= end_dt:
-                        current_date_str = current_dt.strftime('%Y%m%d')
-                        self.log(f"下载 {stock_code} {current_date_str} 的tick数据")
-                        
-                        try:
-                            # 下载当天的tick数据
-                            xtdata.download_history_data(stock_code, period='tick', 
-                                                       start_time=current_date_str, 
-                                                       end_time=current_date_str)
-                            
-                            # 获取当天的tick数据
-                            daily_data = xtdata.get_market_data_ex([], [stock_code], period='tick',
-                                                                 start_time=current_date_str, 
-                                                                 end_time=current_date_str)
-                            
-                            if daily_data and stock_code in daily_data:
-                                tick_df = daily_data[stock_code]
-                                if not tick_df.empty:
-                                    # 将DataFrame转换为字典列表格式
-                                    tick_records = tick_df.to_dict('records')
-                                    all_tick_data.extend(tick_records)
-                                    self.log(f"{current_date_str} 获取到 {len(tick_records)} 条tick数据")
-                                else:
-                                    self.log(f"{current_date_str} 无tick数据")
-                            else:
-                                self.log(f"{current_date_str} 无tick数据")
-                                
-                        except Exception as e:
-                            self.log(f"下载 {current_date_str} tick数据时出错: {e}")
-                        
-                        # 移动到下一天
-                        current_dt += timedelta(days=1)
-                        
-                        # 添加短暂延迟，避免请求过于频繁
-                        time.sleep(0.1)
-                    
-                    # 将所有tick数据组织成标准格式
-                    if all_tick_data:
-                        data = {stock_code: all_tick_data}
-                        self.log(f"总共获取到 {len(all_tick_data)} 条tick数据")
-                    else:
-                        data = None
-                        self.log(f"未获取到任何tick数据")
-                else:
-                    # K线数据的下载逻辑
-                    xtdata.download_history_data(stock_code, period=data_type, start_time=actual_start_date, end_time=actual_end_date)
-                    
-                    # K线数据
-                    fields = ['time', 'open', 'high', 'low', 'close', 'volume', 'amount']
-                    data = xtdata.get_market_data(field_list=fields, stock_list=[stock_code],
-                                                period=data_type, start_time=actual_start_date, end_time=actual_end_date)
-                
-                if not data:
-                    self.log(f"未获取到 {stock_code} 的数据")
-                    return
+                # 加载交易日历，用于增量起点和分笔下载的交易日枚举
+                self.apply_service_settings()
+                self.service.prepare_trading_calendar(end_date)
                 
-                # 保存数据
-                filename = f"{stock_code}_{data_type}_{actual_start_date}_{actual_end_date}"
-                self.save_data(data, stock_code, filename, save_format, save_path)
-                
-                self.log(f"{stock_code} 数据下载完成")
+                status, message = self.service.download_stock_data(
+                    stock_code, data_type, start_date, end_date, save_format, save_path
+                )
+                self.log(message)
                 
             except Exception as e:
                 self.log(f"下载数据时发生错误: {e}")
         
         threading.Thread(target=download_thread, daemon=True).start()
 
-    def save_data(self, data, stock_code, filename, save_format, save_path):
-        """保存数据到指定格式"""
-        try:
-            # 数据验证
-            if not data:
-                self.log(f"错误: {stock_code} 数据为空，无法保存")
-                return False
-            
-            # 检查数据类型并确定是tick数据还是K线数据
-            is_tick_data = False
-            data_count = 0
-            
-            if isinstance(data, dict) and stock_code in data:
-                # 检查是否为tick数据格式
-                tick_list = data[stock_code]
-                if isinstance(tick_list, list) and len(tick_list) > 0:
-                    data_count = len(tick_list)
-                    # 检查第一个元素是否包含tick数据的典型字段
-                    first_item = tick_list[0]
-                    if isinstance(first_item, dict) and 'lastPrice' in first_item:
-                        is_tick_data = True
-                        # 验证tick数据完整性
-                        required_fields = ['time', 'lastPrice', 'volume']
-                        missing_fields = [field for field in required_fields if field not in first_item]
-                        if missing_fields:
-                            self.log(f"警告: {stock_code} tick数据缺少字段: {missing_fields}")
-                else:
-                    # 检查K线数据
-                    for field, values in data.items():
-                        if hasattr(values, 'values') and len(values.values) > 0:
-                            if data_count == 0:
-                                data_count = len(values.values[0])
-                            break
-            
-            if save_format == 'csv':
-                # 使用统一的文件名格式，不包含日期范围
-                csv_path = os.path.join(save_path, f"{stock_code}_{self.data_type_var.get()}.csv")
-                
-                if is_tick_data:
-                    # 处理tick数据
-                    tick_list = data[stock_code]
-                    df = pd.DataFrame(tick_list)
-                    
-                    # 转换时间戳为可读格式
-                    if 'time' in df.columns:
-                        df['time'] = pd.to_datetime(df['time'], unit='ms')
-                    
-                    # 添加股票代码列
-                    df['stock_code'] = stock_code
-                    
-                    # 重新排列列的顺序，将股票代码和时间放在前面
-                    cols = ['stock_code', 'time'] + [col for col in df.columns if col not in ['stock_code', 'time']]
-                    df = df[cols]
-                    
-                    # 检查文件是否存在，决定是否追加
-                    if os.path.exists(csv_path) and self.incremental_var.get():
-                        # 追加模式，不写入表头
-                        df.to_csv(csv_path, mode='a', header=False, index=False, encoding='utf-8-sig')
-                        self.log(f"tick数据已追加到: {csv_path} (新增{len(df)}条记录)")
-                    else:
-                        # 新建文件或覆盖模式
-                        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                        self.log(f"tick数据已保存到: {csv_path} (共{len(df)}条记录)")
-                    
-                    # 验证保存的数据完整性
-                    is_valid, message = self.validate_data_integrity(csv_path, 'tick')
-                    if not is_valid:
-                        self.log(f"数据完整性验证失败: {message}")
-                    else:
-                        self.log(f"数据完整性验证: {message}")
-                    
-                else:
-                    # 处理K线数据
-                    df = pd.DataFrame()
-                    for field, values in data.items():
-                        if hasattr(values, 'values') and len(values.values) > 0:
-                            df[field] = values.values[0]
-                    
-                    if 'time' in df.columns:
-                        df['time'] = pd.to_datetime(df['time'], unit='ms')
-                    
-                    # 检查文件是否存在，决定是否追加
-                    if os.path.exists(csv_path) and self.incremental_var.get():
-                        # 追加模式，不写入表头
-                        df.to_csv(csv_path, mode='a', header=False, index=False, encoding='utf-8-sig')
-                        self.log(f"K线数据已追加到: {csv_path} (新增{len(df)}条记录)")
-                    else:
-                        # 新建文件或覆盖模式
-                        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                        self.log(f"K线数据已保存到: {csv_path} (共{len(df)}条记录)")
-                    
-                    # 验证保存的数据完整性
-                    is_valid, message = self.validate_data_integrity(csv_path, 'kline')
-                    if not is_valid:
-                        self.log(f"数据完整性验证失败: {message}")
-                    else:
-                        self.log(f"数据完整性验证: {message}")
-                
-            elif save_format == 'json':
-                json_path = os.path.join(save_path, f"{filename}.json")
-                
-                if is_tick_data:
-                    # 处理tick数据
-                    tick_list = data[stock_code]
-                    
-                    # 转换时间戳为可读格式
-                    processed_data = []
-                    for tick in tick_list:
-                        tick_copy = tick.copy()
-                        if 'time' in tick_copy:
-                            tick_copy['time'] = datetime.datetime.fromtimestamp(tick_copy['time'] / 1000).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-                        tick_copy['stock_code'] = stock_code
-                        processed_data.append(tick_copy)
-                    
-                    json_data = {
-                        'stock_code': stock_code,
-                        'data_type': 'tick',
-                        'total_records': len(processed_data),
-                        'data': processed_data
-                    }
-                    
-                else:
-                    # 处理K线数据
-                    json_data = {}
-                    for field, values in data.items():
-                        if hasattr(values, 'values') and len(values.values) > 0:
-                            json_data[field] = values.values[0].tolist()
-                
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    json.dump(json_data, f, ensure_ascii=False, indent=2)
-                
-                self.log(f"数据已保存到: {json_path}")
-                
-            elif save_format == 'db':
-                # 保存到SQLite数据库
-                db_path = os.path.join(save_path, "stock_data.db")
-                conn = sqlite3.connect(db_path)
-                
-                if is_tick_data:
-                    # 处理tick数据
-                    tick_list = data[stock_code]
-                    df = pd.DataFrame(tick_list)
-                    
-                    # 转换时间戳为可读格式
-                    if 'time' in df.columns:
-                        df['time'] = pd.to_datetime(df['time'], unit='ms')
-                    
-                    # 添加股票代码列
-                    df['stock_code'] = stock_code
-                    
-                    # 保存到数据库
-                    table_name = "tick_data"
-                    df.to_sql(table_name, conn, if_exists='append', index=False)
-                    self.log(f"tick数据已保存到数据库: {db_path} (共{len(df)}条记录)")
-                    
-                else:
-                    # 处理K线数据
-                    df = pd.DataFrame()
-                    for field, values in data.items():
-                        if hasattr(values, 'values') and len(values.values) > 0:
-                            df[field] = values.values[0]
-                    
-                    if 'time' in df.columns:
-                        df['time'] = pd.to_datetime(df['time'], unit='ms')
-                    
-                    # 添加股票代码列
-                    df['stock_code'] = stock_code
-                    
-                    # 保存到数据库
-                    table_name = f"data_{self.data_type_var.get()}"
-                    df.to_sql(table_name, conn, if_exists='append', index=False)
-                    self.log(f"K线数据已保存到数据库: {db_path}")
-                
-                conn.close()
-            
-            # 保存成功后的验证
-            self.log(f"数据保存完成: {stock_code} ({data_count}条记录)")
-            return True
-                
-        except Exception as e:
-            self.log(f"保存数据时发生错误: {e}")
-            import traceback
-            self.log(f"详细错误信息: {traceback.format_exc()}")
-            return False
-
     def import_excel(self):
         """导入Excel文件"""
         file_path = filedialog.askopenfilename(
@@ -1106,146 +819,143 @@ QMT连接和数据下载测试工具 v1.0
             self.stock_tree.delete(item)
         self.log("已清空股票列表")
 
+    def resample_local_data(self, stock_codes):
+        """在后台线程中从本地已保存的数据合成选定周期，不访问QMT
+        
+        K线周期由来源K线合成，分笔周期按界面上的时间范围由分笔数据合成。
+        
+        Args:
+            stock_codes (list): 股票代码列表
+        """
+        stock_codes = [code for code in stock_codes if code]
+        if not stock_codes:
+            self.log("错误: 请输入股票代码")
+            return
+        
+        period = self.resample_period_var.get()
+        save_format = self.save_format_var.get()
+        save_path = self.save_path_var.get()
+        start_date = self.start_date_var.get()
+        end_date = self.end_date_var.get()
+        self.apply_service_settings()
+        
+        def resample_thread():
+            self.service.resample(stock_codes, period, save_format, save_path, start_date, end_date)
+        
+        threading.Thread(target=resample_thread, daemon=True).start()
+
+    def resample_batch_list(self):
+        """对股票列表中的全部股票进行本地合成"""
+        stock_codes = [str(self.stock_tree.item(item)['values'][1]) for item in self.stock_tree.get_children()]
+        if not stock_codes:
+            self.log("错误: 股票列表为空")
+            return
+        self.resample_local_data(stock_codes)
+
     def start_batch_download(self):
-        """开始批量下载"""
+        """开始批量下载，为股票列表创建一个新任务"""
         if not QMT_AVAILABLE:
             self.log("错误: QMT库不可用")
             return
         
+        if self.service.batch_running:
+            self.log("批量下载正在进行中")
+            return
+        
         items = self.stock_tree.get_children()
         if not items:
             self.log("错误: 股票列表为空")
             return
         
+        stock_codes = [str(self.stock_tree.item(item)['values'][1]) for item in items]
+        job_id = self.service.create_job(stock_codes, self.data_type_var.get(), self.start_date_var.get(),
+                                         self.end_date_var.get(), self.save_format_var.get(),
+                                         self.save_path_var.get(), self.bulk_mode_var.get())
+        self.run_batch_job(job_id, stock_codes)
+
+    def resume_batch_download(self):
+        """继续最近一个未完成的批量下载任务，已完成的股票不会重新下载"""
+        if not QMT_AVAILABLE:
+            self.log("错误: QMT库不可用")
+            return
+        
+        if self.service.batch_running:
+            self.log("批量下载正在进行中")
+            return
+        
+        job_id, stock_codes = self.service.resumable_job()
+        if job_id is None:
+            return
+        self.show_job_items(job_id)
+        if stock_codes:
+            self.run_batch_job(job_id, stock_codes)
+
+    def retry_failed_downloads(self):
+        """单独重试最近一个任务中失败的股票，不影响已完成的股票"""
+        if not QMT_AVAILABLE:
+            self.log("错误: QMT库不可用")
+            return
+        
+        if self.service.batch_running:
+            self.log("批量下载正在进行中")
+            return
+        
+        job_id, stock_codes = self.service.failed_job()
+        if not stock_codes:
+            return
+        self.show_job_items(job_id)
+        self.run_batch_job(job_id, stock_codes)
+
+    def show_job_items(self, job_id):
+        """在股票列表中显示任务的全部股票及其状态"""
+        self.clear_stock_list()
+        for index, (stock_code, state) in enumerate(self.service.job_journal.items(job_id), start=1):
+            self.stock_tree.insert('', tk.END, values=(index, stock_code, STATE_LABELS.get(state, state)))
+
+    def run_batch_job(self, job_id, stock_codes):
+        """在后台线程中执行批量下载任务，逐只股票更新列表中的状态和进度条
+        
+        Args:
+            job_id (int): 任务编号，下载参数从任务日志中读取
+            stock_codes (list): 本次需要下载的股票代码
+        """
+        # 股票代码到树形控件行的映射，用于回报每只股票的下载结果
+        wanted = set(stock_codes)
+        item_map = {}
+        for item in self.stock_tree.get_children():
+            values = self.stock_tree.item(item)['values']
+            if str(values[1]) in wanted:
+                item_map[str(values[1])] = (item, values[0])
+        
+        def set_item_status(stock_code, status):
+            """在主线程中更新股票的下载状态"""
+            if stock_code not in item_map:
+                return
+            item, index = item_map[stock_code]
+            self.master.after(0, lambda: self.stock_tree.item(item, values=(index, stock_code, status)))
+        
+        def set_progress(completed, total):
+            """在主线程中更新进度条"""
+            progress = (completed / total) * 100
+            self.master.after(0, lambda: self.progress_var.set(progress))
+        
+        max_workers = self.batch_workers_var.get()
+        self.apply_service_settings()
+        self.service.batch_running = True
+        
         def batch_download_thread():
-            try:
-                total_count = len(items)
-                completed_count = 0
-                
-                data_type = self.data_type_var.get()
-                start_date = self.start_date_var.get()
-                end_date = self.end_date_var.get()
-                save_format = self.save_format_var.get()
-                save_path = self.save_path_var.get()
-                
-                # 确保保存目录存在
-                os.makedirs(save_path, exist_ok=True)
-                
-                for item in items:
-                    values = self.stock_tree.item(item)['values']
-                    stock_code = values[1]
-                    
-                    try:
-                        # 更新状态为下载中
-                        self.stock_tree.item(item, values=(values[0], stock_code, '下载中'))
-                        
-                        self.log(f"正在下载 {stock_code} ({completed_count + 1}/{total_count})")
-                        
-                        # 检查已有数据，确定实际需要下载的日期范围
-                        actual_start_date, actual_end_date = self.check_existing_data(
-                            stock_code, data_type, start_date, end_date, save_format, save_path
-                        )
-                        
-                        if actual_start_date is None or actual_end_date is None:
-                            self.log(f"{stock_code} 的 {data_type} 数据已是最新，跳过下载")
-                            self.stock_tree.item(item, values=(values[0], stock_code, '已是最新'))
-                            completed_count += 1
-                            continue
-                        
-                        # 下载数据
-                        if data_type == 'tick':
-                            # 对于tick数据，需要按天下载
-                            self.log(f"开始下载 {stock_code} 的tick数据，时间范围: {actual_start_date} 到 {actual_end_date}")
-                            
-                            # 将日期字符串转换为datetime对象
-                            start_dt = datetime.datetime.strptime(actual_start_date, '%Y%m%d')
-                            end_dt = datetime.datetime.strptime(actual_end_date, '%Y%m%d')
-                            
-                            # 按天下载tick数据
-                            current_dt = start_dt
-                            all_tick_data = []
-                            
-                            while current_dt <= end_dt:
-                                current_date_str = current_dt.strftime('%Y%m%d')
-                                
-                                try:
-                                    # 下载当天的tick数据
-                                    xtdata.download_history_data(stock_code, period='tick', 
-                                                               start_time=current_date_str, 
-                                                               end_time=current_date_str)
-                                    
-                                    # 获取当天的tick数据
-                                    daily_data = xtdata.get_market_data_ex([], [stock_code], period='tick',
-                                                                         start_time=current_date_str, 
-                                                                         end_time=current_date_str)
-                                    
-                                    if daily_data and stock_code in daily_data:
-                                        tick_df = daily_data[stock_code]
-                                        if not tick_df.empty:
-                                            # 将DataFrame转换为字典列表格式
-                                            tick_records = tick_df.to_dict('records')
-                                            all_tick_data.extend(tick_records)
-                                            
-                                except Exception as e:
-                                    self.log(f"下载 {stock_code} {current_date_str} tick数据时出错: {e}")
-                                
-                                # 移动到下一天
-                                current_dt += timedelta(days=1)
-                                
-                                # 添加短暂延迟，避免请求过于频繁
-                                time.sleep(0.1)
-                            
-                            # 将所有tick数据组织成标准格式
-                            if all_tick_data:
-                                data = {stock_code: all_tick_data}
-                            else:
-                                data = None
-                        else:
-                            # K线数据的下载逻辑
-                            xtdata.download_history_data(stock_code, period=data_type, start_time=actual_start_date, end_time=actual_end_date)
-                            
-                            fields = ['time', 'open', 'high', 'low', 'close', 'volume', 'amount']
-                            data = xtdata.get_market_data(field_list=fields, stock_list=[stock_code],
-                                                        period=data_type, start_time=actual_start_date, end_time=actual_end_date)
-                        
-                        if data:
-                            # 保存数据
-                            filename = f"{stock_code}_{data_type}_{actual_start_date}_{actual_end_date}"
-                            self.save_data(data, stock_code, filename, save_format, save_path)
-                            
-                            # 更新状态为完成
-                            self.stock_tree.item(item, values=(values[0], stock_code, '完成'))
-                        else:
-                            # 更新状态为失败
-                            self.stock_tree.item(item, values=(values[0], stock_code, '无数据'))
-                        
-                        completed_count += 1
-                        
-                        # 更新进度条
-                        progress = (completed_count / total_count) * 100
-                        self.progress_var.set(progress)
-                        
-                        # 短暂延迟，避免请求过于频繁
-                        time.sleep(0.5)
-                        
-                    except Exception as e:
-                        self.log(f"下载 {stock_code} 时发生错误: {e}")
-                        self.stock_tree.item(item, values=(values[0], stock_code, '错误'))
-                        completed_count += 1
-                        progress = (completed_count / total_count) * 100
-                        self.progress_var.set(progress)
-                
-                self.log(f"批量下载完成，共处理 {total_count} 只股票")
-                
-            except Exception as e:
-                self.log(f"批量下载时发生错误: {e}")
+            self.service.run_batch_job(job_id, stock_codes, max_workers,
+                                       on_status=set_item_status, on_progress=set_progress)
         
         threading.Thread(target=batch_download_thread, daemon=True).start()
 
     def stop_batch_download(self):
-        """停止批量下载"""
-        # 这里可以添加停止下载的逻辑
-        self.log("批量下载停止请求已发送")
+        """停止批量下载：不再开始新的股票，正在下载的股票完成后停止"""
+        if not self.service.batch_running:
+            self.log("当前没有进行中的批量下载")
+            return
+        self.service.stop_batch()
+        self.log("批量下载停止请求已发送，等待正在下载的股票完成")
 
     def get_latest_price(self):
         """获取最新价格"""
@@ -1329,20 +1039,30 @@ QMT连接和数据下载测试工具 v1.0
             return
         
         # 如果已经在运行，先停止
-        if self.fullpush_running:
+        if self.fullpush_monitor is not None and self.fullpush_monitor.running:
             self.stop_fullpush_monitor()
             time.sleep(1)  # 等待停止完成
         
         try:
-            rise_threshold = self.rise_threshold_var.get()
-            fall_threshold = self.fall_threshold_var.get()
             monitor_type = self.monitor_stocks_var.get()
+            monitor = FullPushMonitor(
+                rise_threshold=self.rise_threshold_var.get(),
+                fall_threshold=self.fall_threshold_var.get(),
+                sound_enabled=self.sound_enabled_var.get(),
+                sound_type=self.sound_type_var.get(),
+                on_message=lambda text: self.update_realtime_display(text, append=True),
+                log_callback=self.log,
+                hysteresis=self.hysteresis_var.get(),
+                cooldown=self.cooldown_var.get(),
+                sound_worker=self.sound_worker
+            )
+            self.fullpush_monitor = monitor
             
             # 在后台线程中处理数据下载和订阅
             def start_monitor_thread():
                 try:
                     # 获取要监控的股票列表
-                    monitor_stocks = self.get_monitor_stock_list()
+                    monitor_stocks = get_monitor_stock_list(monitor_type, self.custom_stock_list, self.log)
                     
                     if not monitor_stocks:
                         self.log("警告: 未获取到监控股票列表")
@@ -1351,25 +1071,10 @@ QMT连接和数据下载测试工具 v1.0
                     self.log(f"获取到 {len(monitor_stocks)} 只股票用于监控")
                     
                     # 订阅全推数据
-                    def fullpush_callback(data_dict):
-                        if self.fullpush_running:  # 检查是否仍在运行
-                            # 使用线程池处理数据，避免阻塞
-                            threading.Thread(target=self.process_fullpush_data, 
-                                           args=(data_dict, rise_threshold, fall_threshold, monitor_stocks), 
-                                           daemon=True).start()
-                    
-                    subscription_id = xtdata.subscribe_whole_quote(["SH", "SZ"], callback=fullpush_callback)
-                    
-                    if subscription_id > 0:
-                        self.fullpush_subscription_id = subscription_id
-                        self.fullpush_running = True
-                        self.alert_count = {"rise": 0, "fall": 0}  # 重置计数
-                        
-                        status_msg = f"全推监控已启动\n监控范围: {monitor_type} ({len(monitor_stocks)}只股票)\n涨幅阈值: {rise_threshold:.1%}, 跌幅阈值: {fall_threshold:.1%}\n声音预警: {'启用' if self.sound_enabled_var.get() else '禁用'}\n"
+                    if monitor.start(monitor_stocks):
                         self.log(f"全推监控已启动 - {monitor_type}")
+                        status_msg = monitor.status_text(monitor_type)
                         self.update_realtime_display(status_msg, append=True)
-                    else:
-                        self.log("全推监控启动失败")
                         
                 except Exception as e:
                     self.log(f"启动全推监控时发生错误: {e}")
@@ -1383,167 +1088,35 @@ QMT连接和数据下载测试工具 v1.0
     def stop_fullpush_monitor(self):
         """停止全推监控"""
         try:
-            if not self.fullpush_running:
+            if self.fullpush_monitor is None or not self.fullpush_monitor.running:
                 self.log("全推监控未在运行")
                 return
-                
-            # 设置停止标志
-            self.fullpush_running = False
             
-            # 取消订阅
-            if self.fullpush_subscription_id and QMT_AVAILABLE:
-                try:
-                    xtdata.unsubscribe_quote(self.fullpush_subscription_id)
-                    self.log(f"已取消全推订阅 (ID: {self.fullpush_subscription_id})")
-                except Exception as e:
-                    self.log(f"取消订阅时发生错误: {e}")
-                finally:
-                    self.fullpush_subscription_id = None
+            self.fullpush_monitor.stop()
             
+            self.log(self.fullpush_monitor.stats_text())
             self.log("全推监控已停止")
             self.update_realtime_display("全推监控已停止\n", append=True)
             
         except Exception as e:
             self.log(f"停止全推监控时发生错误: {e}")
 
-    def process_fullpush_data(self, data_dict, rise_threshold, fall_threshold, monitor_stocks):
-        """处理全推数据，支持涨跌双向监控
-        
-        Args:
-            data_dict (dict): 全推数据字典
-            rise_threshold (float): 涨幅阈值
-            fall_threshold (float): 跌幅阈值
-            monitor_stocks (list): 要监控的股票列表
-        """
-        try:
-            # 检查是否仍在运行
-            if not self.fullpush_running:
-                return
-                
-            rise_count = 0
-            fall_count = 0
-            timestamp = datetime.datetime.now().strftime('%H:%M:%S')
-            rise_alerts = []  # 涨幅警报
-            fall_alerts = []  # 跌幅警报
-            
-            # 限制处理的股票数量，避免处理过多数据导致卡顿
-            processed_count = 0
-            max_process_per_batch = 1000  # 每批最多处理1000只股票
-            
-            for code, tick_data in data_dict.items():
-                if not self.fullpush_running:  # 再次检查运行状态
-                    break
-                    
-                if code not in monitor_stocks:
-                    continue
-                
-                processed_count += 1
-                if processed_count > max_process_per_batch:
-                    break  # 限制处理数量，避免阻塞
-                
-                try:
-                    # 提取价格数据
-                    if isinstance(tick_data, list) and tick_data:
-                        last_price = tick_data[0]['lastPrice']
-                        pre_close = tick_data[0]['lastClose']
-                    else:
-                        last_price = tick_data['lastPrice']
-                        pre_close = tick_data['lastClose']
-                    
-                    # 计算涨跌幅
-                    if pre_close > 0:
-                        change_ratio = last_price / pre_close - 1
-                        
-                        # 检查涨幅预警
-                        if change_ratio > rise_threshold:
-                            rise_count += 1
-                            self.alert_count["rise"] += 1
-                            alert_info = f"[{timestamp}] 📈 {code} 涨幅 {change_ratio:.2%}，最新价 {last_price:.2f}\n"
-                            rise_alerts.append(alert_info)
-                            
-                            # 播放涨幅预警声音
-                            if self.sound_enabled_var.get():
-                                threading.Thread(target=self.play_alert_sound, args=("rise",), daemon=True).start()
-                        
-                        # 检查跌幅预警
-                        elif change_ratio < -fall_threshold:
-                            fall_count += 1
-                            self.alert_count["fall"] += 1
-                            alert_info = f"[{timestamp}] 📉 {code} 跌幅 {abs(change_ratio):.2%}，最新价 {last_price:.2f}\n"
-                            fall_alerts.append(alert_info)
-                            
-                            # 播放跌幅预警声音
-                            if self.sound_enabled_var.get():
-                                threading.Thread(target=self.play_alert_sound, args=("fall",), daemon=True).start()
-                            
-                except Exception:
-                    continue
-            
-            # 批量更新UI，减少UI更新频率
-            if (rise_alerts or fall_alerts) and self.fullpush_running:
-                all_alerts = []
-                
-                # 处理涨幅警报
-                if rise_alerts:
-                    if len(rise_alerts) > 5:
-                        all_alerts.extend(rise_alerts[:5])
-                        all_alerts.append(f"[{timestamp}] ... 还有 {len(rise_alerts) - 5} 只股票涨幅超过阈值\n")
-                    else:
-                        all_alerts.extend(rise_alerts)
-                
-                # 处理跌幅警报
-                if fall_alerts:
-                    if len(fall_alerts) > 5:
-                        all_alerts.extend(fall_alerts[:5])
-                        all_alerts.append(f"[{timestamp}] ... 还有 {len(fall_alerts) - 5} 只股票跌幅超过阈值\n")
-                    else:
-                        all_alerts.extend(fall_alerts)
-                
-                # 更新UI显示
-                for alert in all_alerts:
-                    self.master.after(0, lambda text=alert: self.update_realtime_display(text, append=True))
-                
-                # 显示汇总信息
-                if rise_count > 0 or fall_count > 0:
-                    summary = f"[{timestamp}] 本次推送: 涨幅预警 {rise_count} 只, 跌幅预警 {fall_count} 只 (累计: 涨 {self.alert_count['rise']}, 跌 {self.alert_count['fall']})\n"
-                    self.master.after(0, lambda text=summary: self.update_realtime_display(text, append=True))
-                
-        except Exception as e:
-            self.log(f"处理全推数据时发生错误: {e}")
+    def apply_monitor_settings(self):
+        """把界面上的声音设置同步到正在运行的全推监控"""
+        if self.fullpush_monitor is not None:
+            self.fullpush_monitor.sound_enabled = self.sound_enabled_var.get()
+            self.fullpush_monitor.sound_type = self.sound_type_var.get()
 
     def play_alert_sound(self, alert_type="rise"):
-        """播放预警声音
+        """按界面上的声音设置播放预警声音
         
         Args:
             alert_type (str): 预警类型，'rise'表示涨幅预警，'fall'表示跌幅预警
         """
         if not self.sound_enabled_var.get():
             return
-            
-        try:
-            sound_type = self.sound_type_var.get()
-            
-            if sound_type == "系统提示音":
-                # 使用不同的系统声音区分涨跌
-                if alert_type == "rise":
-                    winsound.MessageBeep(winsound.MB_OK)  # 上涨用OK声音
-                else:
-                    winsound.MessageBeep(winsound.MB_ICONEXCLAMATION)  # 下跌用警告声音
-                    
-            elif sound_type == "警报声":
-                # 播放系统警报声
-                winsound.MessageBeep(winsound.MB_ICONHAND)
-                
-            elif sound_type == "铃声":
-                # 播放系统铃声
-                winsound.MessageBeep(winsound.MB_ICONASTERISK)
-                
-            elif sound_type == "自定义音效":
-                # 这里可以扩展为播放自定义音频文件
-                winsound.MessageBeep(winsound.MB_ICONQUESTION)
-                
-        except Exception as e:
-            self.log(f"播放声音时发生错误: {e}")
+        
+        self.sound_worker.notify(alert_type, self.sound_type_var.get())
 
     def test_sound(self):
         """测试声音功能"""
@@ -1637,64 +1210,13 @@ QMT连接和数据下载测试工具 v1.0
     def clear_realtime_display(self):
         """清空实时数据显示"""
         try:
-            self.realtime_text.config(state=tk.NORMAL)
-            self.realtime_text.delete(1.0, tk.END)
-            self.realtime_text.config(state=tk.DISABLED)
-            self.alert_count = {"rise": 0, "fall": 0}
+            self.realtime_lines.clear()
+            if self.fullpush_monitor is not None:
+                self.fullpush_monitor.alert_count = {"rise": 0, "fall": 0}
             self.log("已清空实时数据显示")
         except Exception as e:
             self.log(f"清空显示时发生错误: {e}")
 
-    def get_monitor_stock_list(self):
-        """获取要监控的股票列表
-        
-        Returns:
-            list: 股票代码列表
-        """
-        try:
-            monitor_type = self.monitor_stocks_var.get()
-            
-            if monitor_type == "全市场":
-                # 获取全市场股票
-                if QMT_AVAILABLE:
-                    xtdata.download_sector_data()
-                    sh_stocks = xtdata.get_stock_list_in_sector('上海A股')
-                    sz_stocks = xtdata.get_stock_list_in_sector('深圳A股')
-                    return sh_stocks + sz_stocks
-                else:
-                    return []
-                    
-            elif monitor_type == "沪深A股":
-                if QMT_AVAILABLE:
-                    xtdata.download_sector_data()
-                    return xtdata.get_stock_list_in_sector('沪深A股')
-                else:
-                    return []
-                    
-            elif monitor_type == "创业板":
-                if QMT_AVAILABLE:
-                    xtdata.download_sector_data()
-                    return xtdata.get_stock_list_in_sector('创业板')
-                else:
-                    return []
-                    
-            elif monitor_type == "科创板":
-                if QMT_AVAILABLE:
-                    xtdata.download_sector_data()
-                    return xtdata.get_stock_list_in_sector('科创板')
-                else:
-                    return []
-                    
-            elif monitor_type == "自定义列表":
-                return self.custom_stock_list
-                
-            else:
-                return []
-                
-        except Exception as e:
-            self.log(f"获取监控股票列表时发生错误: {e}")
-            return []
-
     def on_closing(self):
         """窗口关闭时的清理工作"""
         try:
@@ -1702,9 +1224,18 @@ QMT连接和数据下载测试工具 v1.0
             self.save_config()
             
             # 停止全推监控
-            if self.fullpush_running:
+            if self.fullpush_monitor is not None and self.fullpush_monitor.running:
                 self.stop_fullpush_monitor()
             
+            # 停止批量下载并等待正在下载的股票完成，等待期间继续处理界面事件，下载线程的界面更新不会被阻塞；
+            # 然后关闭数据清单、行情库和任务日志，未完成的股票保留在任务日志中，下次启动后可以继续
+            self.service.stop_batch()
+            deadline = time.monotonic() + BATCH_STOP_TIMEOUT
+            while not self.service.batch_idle.wait(0.05) and time.monotonic() < deadline:
+                self.master.update()
+            self.service.close(timeout=0)
+            self.sound_worker.stop()
+            
             # 断开QMT连接
             if self.is_connected and QMT_AVAILABLE:
                 try:
@@ -1721,13 +1252,37 @@ QMT连接和数据下载测试工具 v1.0
             self.master.destroy()
 
     def update_realtime_display(self, text, append=False):
-        """更新实时数据显示区域"""
-        self.realtime_text.config(state=tk.NORMAL)
-        if not append:
-            self.realtime_text.delete(1.0, tk.END)
-        self.realtime_text.insert(tk.END, text)
-        self.realtime_text.config(state=tk.DISABLED)
-        self.realtime_text.see(tk.END)
+        """更新实时数据显示区域，可以在任意线程中调用，内容在下一次刷新时显示
+
+        Args:
+            text (str): 要显示的文字
+            append (bool): 是否追加到已有内容之后，否则替换已有内容
+        """
+        self.realtime_lines.append(text, replace=not append)
+
+    def render_realtime_display(self):
+        """把实时数据缓冲中的变化一次性写入显示区域，并删除超出容量的最早的行"""
+        try:
+            update = self.realtime_lines.take()
+            if update is not None:
+                reset, lines = update
+                self.realtime_text.config(state=tk.NORMAL)
+                if reset:
+                    self.realtime_text.delete(1.0, tk.END)
+                if lines:
+                    self.realtime_text.insert(tk.END, "\n".join(lines) + "\n")
+                # 内容以换行符结尾，最后一个字符之前的行号减一即为行数
+                line_count = int(self.realtime_text.index('end-1c').split('.')[0]) - 1
+                excess = line_count - self.realtime_lines.max_lines
+                if excess > 0:
+                    self.realtime_text.delete(1.0, f"{excess + 1}.0")
+                self.realtime_text.config(state=tk.DISABLED)
+                self.realtime_text.see(tk.END)
+        except Exception as e:
+            self.log(f"刷新实时数据显示时发生错误: {e}")
+        
+        # 每100ms刷新一次
+        self.master.after(REALTIME_REFRESH_MS, self.render_realtime_display)
 
     def open_usage_guide(self):
         """打开使用说明"""
@@ -1771,6 +1326,9 @@ QMT连接和数据下载测试工具 v1.0
             
             # 使用markdown库渲染，然后转换为纯文本显示
             try:
+                import markdown  # MD文件渲染
+                import html2text  # HTML转文本
+                
                 # 将Markdown转换为HTML
                 html_content = markdown.markdown(content, extensions=['tables', 'fenced_code', 'toc'])
                 # 将HTML转换为格式化的纯文本
@@ -2167,6 +1725,10 @@ start_batch_download()
                         self.rise_threshold_var.set(monitor_config['rise_threshold'])
                     if 'fall_threshold' in monitor_config:
                         self.fall_threshold_var.set(monitor_config['fall_threshold'])
+                    if 'hysteresis' in monitor_config:
+                        self.hysteresis_var.set(monitor_config['hysteresis'])
+                    if 'cooldown' in monitor_config:
+                        self.cooldown_var.set(monitor_config['cooldown'])
                     if 'monitor_stocks' in monitor_config:
                         self.monitor_stocks_var.set(monitor_config['monitor_stocks'])
                     if 'sound_enabled' in monitor_config:
@@ -2179,6 +1741,16 @@ start_batch_download()
                     realtime_config = config_data['realtime']
                     if 'stock_code' in realtime_config:
                         self.rt_stock_code_var.set(realtime_config['stock_code'])
+                
+                # 应用下载配置
+                if 'download' in config_data:
+                    download_config = config_data['download']
+                    if 'batch_workers' in download_config:
+                        self.batch_workers_var.set(download_config['batch_workers'])
+                    if 'bulk_mode' in download_config:
+                        self.bulk_mode_var.set(download_config['bulk_mode'])
+                    if download_config.get('json_layout') in JSON_LAYOUTS:
+                        self.json_layout_var.set(download_config['json_layout'])
                         
             else:
                 self.log("配置文件不存在，使用默认配置")
@@ -2203,12 +1775,19 @@ start_batch_download()
                 "monitor": {
                     "rise_threshold": self.rise_threshold_var.get(),
                     "fall_threshold": self.fall_threshold_var.get(),
+                    "hysteresis": self.hysteresis_var.get(),
+                    "cooldown": self.cooldown_var.get(),
                     "monitor_stocks": self.monitor_stocks_var.get(),
                     "sound_enabled": self.sound_enabled_var.get(),
                     "sound_type": self.sound_type_var.get()
                 },
                 "realtime": {
                     "stock_code": self.rt_stock_code_var.get()
+                },
+                "download": {
+                    "batch_workers": self.batch_workers_var.get(),
+                    "bulk_mode": self.bulk_mode_var.get(),
+                    "json_layout": self.json_layout_var.get()
                 }
             }
             
@@ -2247,10 +1826,15 @@ start_batch_download()
             self.account_id_var.set(self.default_config['qmt']['stock_account'])
             self.rise_threshold_var.set(self.default_config['monitor']['rise_threshold'])
             self.fall_threshold_var.set(self.default_config['monitor']['fall_threshold'])
+            self.hysteresis_var.set(self.default_config['monitor']['hysteresis'])
+            self.cooldown_var.set(self.default_config['monitor']['cooldown'])
             self.monitor_stocks_var.set(self.default_config['monitor']['monitor_stocks'])
             self.sound_enabled_var.set(self.default_config['monitor']['sound_enabled'])
             self.sound_type_var.set(self.default_config['monitor']['sound_type'])
             self.rt_stock_code_var.set(self.default_config['realtime']['stock_code'])
+            self.batch_workers_var.set(self.default_config['download']['batch_workers'])
+            self.bulk_mode_var.set(self.default_config['download']['bulk_mode'])
+            self.json_layout_var.set(self.default_config['download']['json_layout'])
             
             # 保存配置
             self.save_config()
@@ -2302,13 +1886,22 @@ start_batch_download()
             # 监控配置变量
             self.rise_threshold_var.trace('w', lambda *args: self.auto_save_config())
             self.fall_threshold_var.trace('w', lambda *args: self.auto_save_config())
+            self.hysteresis_var.trace('w', lambda *args: self.auto_save_config())
+            self.cooldown_var.trace('w', lambda *args: self.auto_save_config())
             self.monitor_stocks_var.trace('w', lambda *args: self.auto_save_config())
             self.sound_enabled_var.trace('w', lambda *args: self.auto_save_config())
             self.sound_type_var.trace('w', lambda *args: self.auto_save_config())
+            self.sound_enabled_var.trace('w', lambda *args: self.apply_monitor_settings())
+            self.sound_type_var.trace('w', lambda *args: self.apply_monitor_settings())
             
             # 实时行情配置变量
             self.rt_stock_code_var.trace('w', lambda *args: self.auto_save_config())
             
+            # 下载配置变量
+            self.batch_workers_var.trace('w', lambda *args: self.auto_save_config())
+            self.bulk_mode_var.trace('w', lambda *args: self.auto_save_config())
+            self.json_layout_var.trace('w', lambda *args: self.auto_save_config())
+            
         except Exception as e:
             self.log(f"绑定配置事件时发生错误: {e}")
 
@@ -0,0 +1,287 @@
+# coding=utf-8
+"""
+QMT批量下载引擎
+以有限并发的工作线程池执行下载任务，并把每只股票的结果回报给调用方；
+同时提供基于xtdata列表接口的多股票合并下载与读取，以及按时间区间合并的分笔数据下载
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+
+from qmt_rate_limiter import xtdata_limiter
+from qmt_trading_calendar import BEIJING_OFFSET_MS, MS_PER_DAY
+
+# QMT相关导入
+try:
+    from xtquant import xtdata
+except ImportError:
+    xtdata = None
+
+
+# K线数据字段
+KLINE_FIELDS = ['time', 'open', 'high', 'low', 'close', 'volume', 'amount']
+
+# 合并请求时每组包含的股票数量
+BULK_CHUNK_SIZE = 500
+
+# 分笔数据每次请求覆盖的交易日数量
+TICK_WINDOW_SESSIONS = 20
+
+
+class BatchDownloadEngine:
+    """批量下载引擎
+
+    每个任务是一组股票代码（逐只下载时每组只有一只）。同一时刻最多只有
+    max_workers 个任务在途，每个任务完成后立即补充下一个，因此对QMT客户端
+    的并发请求数始终是有界的。
+    """
+
+    def __init__(self, worker, max_workers=4, on_start=None, on_result=None):
+        """
+        初始化下载引擎
+
+        Args:
+            worker: 下载函数，接收股票代码元组，返回 {股票代码: (状态, 说明)}
+            max_workers: 最大并发数，即同时在途的下载任务数量上限
+            on_start: 任务开始时的回调函数 on_start(stock_codes)
+            on_result: 每只股票结束时的回调函数 on_result(stock_code, status, message, elapsed)
+        """
+        self.worker = worker
+        self.max_workers = max(1, int(max_workers))
+        self.on_start = on_start
+        self.on_result = on_result
+
+    def run(self, tasks, stop_event=None):
+        """执行批量下载，阻塞直到全部任务结束或收到停止信号
+
+        Args:
+            tasks: 任务列表，每个任务是一个股票代码元组
+            stop_event (threading.Event): 停止信号，设置后不再开始新任务，等待在途任务结束后返回
+
+        Returns:
+            dict: {股票代码: (状态, 说明)}，没有开始的股票不在结果中
+        """
+        results = {}
+        task_iter = iter(tasks)
+        pending = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="qmt-download") as executor:
+            while True:
+                # 补充任务，保证在途任务数不超过并发上限
+                while len(pending) < self.max_workers and not (stop_event and stop_event.is_set()):
+                    stock_codes = next(task_iter, None)
+                    if stock_codes is None:
+                        break
+                    pending.add(executor.submit(self._run_one, stock_codes))
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_results, elapsed = future.result()
+                    for stock_code, (status, message) in task_results.items():
+                        results[stock_code] = (status, message)
+                        if self.on_result:
+                            self.on_result(stock_code, status, message, elapsed)
+
+        return results
+
+    def _run_one(self, stock_codes):
+        """执行单个下载任务，异常转换为错误状态，不影响其他任务"""
+        if self.on_start:
+            self.on_start(stock_codes)
+
+        start = time.perf_counter()
+        try:
+            task_results = self.worker(stock_codes)
+        except Exception as e:
+            task_results = {stock_code: ('错误', str(e)) for stock_code in stock_codes}
+        return task_results, time.perf_counter() - start
+
+
+def chunk_codes(stock_codes, chunk_size=BULK_CHUNK_SIZE):
+    """将股票代码列表切分为若干组
+
+    Args:
+        stock_codes: 股票代码列表
+        chunk_size: 每组的股票数量
+
+    Returns:
+        list: 股票代码元组列表
+    """
+    stock_codes = list(stock_codes)
+    return [tuple(stock_codes[i:i + chunk_size]) for i in range(0, len(stock_codes), chunk_size)]
+
+
+def split_market_data(market_data, fields=KLINE_FIELDS):
+    """将 get_market_data 的返回值一次性拆分为逐只股票的DataFrame
+
+    get_market_data 返回 {字段: DataFrame}，每个DataFrame的行是股票、列是时间。
+    这里把所有字段展平为一张长表，每只股票在长表中占据连续的一段，
+    按边界切片即可得到每只股票的数据，不需要逐只股票逐字段地循环。
+
+    Args:
+        market_data (dict): {字段: DataFrame(股票×时间)}
+        fields (list): 需要的字段列表
+
+    Returns:
+        dict: {股票代码: DataFrame}，DataFrame的列为字段，按时间升序
+    """
+    present = [field for field in fields if field in market_data]
+    if not present:
+        return {}
+
+    base = market_data[present[0]]
+    codes = np.asarray(base.index)
+    n_codes, n_times = base.shape
+    if n_codes == 0 or n_times == 0:
+        return {}
+
+    long_df = pd.DataFrame({
+        field: market_data[field].reindex(index=base.index, columns=base.columns).to_numpy().ravel()
+        for field in present
+    })
+    code_index = np.repeat(np.arange(n_codes), n_times)
+
+    # 去掉股票在该时间点没有数据的行（如上市前）
+    value_fields = [field for field in present if field != 'time']
+    if value_fields:
+        valid = long_df[value_fields].notna().any(axis=1).to_numpy()
+        long_df = long_df[valid].reset_index(drop=True)
+        code_index = code_index[valid]
+
+    if len(code_index) == 0:
+        return {}
+
+    if 'time' in long_df.columns:
+        long_df['time'] = long_df['time'].astype('int64')
+
+    bounds = np.flatnonzero(np.diff(code_index)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(code_index)]))
+
+    return {
+        codes[code_index[start]]: long_df.iloc[start:end].reset_index(drop=True)
+        for start, end in zip(starts, ends)
+    }
+
+
+def fetch_kline_bulk(stock_codes, period, start_time, end_time, fields=KLINE_FIELDS, limiter=xtdata_limiter):
+    """合并下载并读取一组股票的K线数据
+
+    整组股票只需调用一次 download_history_data2 和一次 get_market_data，
+    替代逐只股票各调用一次的方式。
+
+    Args:
+        stock_codes: 股票代码列表
+        period (str): 周期，如'1d'、'5m'、'1m'
+        start_time (str): 开始时间
+        end_time (str): 结束时间
+        fields (list): 字段列表
+        limiter (AdaptiveRateLimiter): 请求限速器
+
+    Returns:
+        dict: {股票代码: DataFrame}
+    """
+    stock_codes = list(stock_codes)
+    batch_size = len(stock_codes)
+    limiter.call_batch(batch_size, xtdata.download_history_data2, stock_codes, period=period,
+                       start_time=start_time, end_time=end_time)
+    market_data = limiter.call_batch(batch_size, xtdata.get_market_data, field_list=fields, stock_list=stock_codes,
+                                     period=period, start_time=start_time, end_time=end_time)
+    if not market_data:
+        return {}
+    return split_market_data(market_data, fields)
+
+
+def iter_session_windows(trading_days, window_sessions=TICK_WINDOW_SESSIONS):
+    """将交易日列表切分为若干个连续的时间窗口
+
+    Args:
+        trading_days (list): 升序排列的交易日列表，格式YYYYMMDD
+        window_sessions (int): 每个窗口包含的交易日数量
+
+    Yields:
+        tuple: (窗口开始日期, 窗口结束日期)
+    """
+    for i in range(0, len(trading_days), window_sessions):
+        window = trading_days[i:i + window_sessions]
+        yield window[0], window[-1]
+
+
+def fetch_tick_range(stock_code, start_time, end_time, limiter=xtdata_limiter):
+    """一次请求下载并读取一段时间内的分笔数据
+
+    Args:
+        stock_code (str): 股票代码
+        start_time (str): 开始时间
+        end_time (str): 结束时间
+        limiter (AdaptiveRateLimiter): 请求限速器
+
+    Returns:
+        DataFrame: 分笔数据，没有数据时返回空DataFrame
+    """
+    limiter.call(xtdata.download_history_data, stock_code, period='tick', start_time=start_time, end_time=end_time)
+    data = limiter.call(xtdata.get_market_data_ex, [], [stock_code], period='tick',
+                        start_time=start_time, end_time=end_time)
+    if not data or stock_code not in data:
+        return pd.DataFrame()
+    return data[stock_code]
+
+
+def split_by_trading_day(tick_df):
+    """按交易日（北京时间）拆分分笔数据
+
+    Args:
+        tick_df (DataFrame): 包含毫秒时间戳time列、按时间升序的分笔数据
+
+    Yields:
+        tuple: (交易日YYYYMMDD, 当日分笔数据)
+    """
+    if tick_df is None or tick_df.empty:
+        return
+
+    tick_df = tick_df.reset_index(drop=True)
+    day_numbers = (tick_df['time'].to_numpy(dtype='int64') + BEIJING_OFFSET_MS) // MS_PER_DAY
+    bounds = np.flatnonzero(np.diff(day_numbers)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(day_numbers)]))
+
+    for start, end in zip(starts, ends):
+        trade_date = pd.Timestamp(int(day_numbers[start]) * MS_PER_DAY, unit='ms').strftime('%Y%m%d')
+        yield trade_date, tick_df.iloc[start:end]
+
+
+def iter_tick_days(stock_code, trading_days, window_sessions=TICK_WINDOW_SESSIONS, start_time=None, on_error=None):
+    """按时间窗口合并请求分笔数据，并在本地按交易日拆分
+
+    一年的分笔数据只需十余次请求，而不是每个自然日各请求一次，
+    窗口只由真实的交易日组成，周末和节假日不会产生请求。
+
+    Args:
+        stock_code (str): 股票代码
+        trading_days (list): 需要下载的交易日列表，格式YYYYMMDD
+        window_sessions (int): 每次请求覆盖的交易日数量
+        start_time (str): 第一个窗口的精确开始时间（YYYYMMDDHHMMSS），用于日内增量续传
+        on_error: 某个窗口重试后仍下载失败时的回调函数 on_error(窗口开始日期, 窗口结束日期, 异常)，
+            未提供时直接抛出异常
+
+    Yields:
+        tuple: (交易日YYYYMMDD, 当日分笔数据)
+    """
+    for window_index, (window_start, window_end) in enumerate(iter_session_windows(trading_days, window_sessions)):
+        if window_index == 0 and start_time and start_time[:8] == window_start:
+            window_start = start_time
+        try:
+            tick_df = fetch_tick_range(stock_code, window_start, window_end)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(window_start, window_end, e)
+            continue
+
+        yield from split_by_trading_day(tick_df)
@@ -0,0 +1,258 @@
+# coding=utf-8
+"""
+QMT批量下载任务日志
+把每次批量下载记录为一个任务，逐只股票持久化下载状态和时间范围，
+程序关闭或异常退出后可以继续未完成的股票，失败的股票可以单独重试
+"""
+
+import datetime
+import sqlite3
+import threading
+
+
+# 股票在任务中的状态
+STATE_PENDING = 'pending'   # 等待下载
+STATE_RUNNING = 'running'   # 下载中
+STATE_DONE = 'done'         # 完成（包括已是最新）
+STATE_EMPTY = 'empty'       # 没有数据
+STATE_FAILED = 'failed'     # 失败
+
+# 任务状态
+JOB_RUNNING = 'running'
+JOB_STOPPED = 'stopped'
+JOB_FINISHED = 'finished'
+
+# 下载结果状态到任务日志状态的映射
+RESULT_STATES = {
+    '完成': STATE_DONE,
+    '已是最新': STATE_DONE,
+    '无数据': STATE_EMPTY,
+    '错误': STATE_FAILED,
+}
+
+# 任务日志状态在股票列表中的显示文字
+STATE_LABELS = {
+    STATE_PENDING: '待下载',
+    STATE_RUNNING: '待下载',
+    STATE_DONE: '完成',
+    STATE_EMPTY: '无数据',
+    STATE_FAILED: '错误',
+}
+
+# 任务参数字段
+JOB_FIELDS = ['data_type', 'start_date', 'end_date', 'save_format', 'save_path', 'bulk_mode']
+
+
+class JobJournal:
+    """批量下载任务日志
+
+    任务和逐只股票的状态保存在SQLite文件中，每次状态变化都立即提交，
+    因此任何时刻退出程序，日志中都保留着每只股票最后的状态。
+    """
+
+    def __init__(self, db_path="download_jobs.db"):
+        """
+        初始化任务日志
+
+        Args:
+            db_path (str): 日志数据库文件路径
+        """
+        self.path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data_type TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                save_format TEXT NOT NULL,
+                save_path TEXT NOT NULL,
+                bulk_mode INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                created_at TEXT,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id INTEGER NOT NULL,
+                stock_code TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                range_start TEXT,
+                range_end TEXT,
+                message TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT,
+                PRIMARY KEY (job_id, stock_code)
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_items_state ON job_items (job_id, state);
+        """)
+        self.conn.commit()
+
+    def create_job(self, params, stock_codes):
+        """创建任务，所有股票的初始状态为等待下载
+
+        Args:
+            params (dict): 任务参数，包含 JOB_FIELDS 中的字段
+            stock_codes (list): 股票代码列表
+
+        Returns:
+            int: 任务编号
+        """
+        now = self._now()
+        with self.lock:
+            with self.conn:
+                cursor = self.conn.execute(
+                    "INSERT INTO jobs (data_type, start_date, end_date, save_format, save_path, bulk_mode, "
+                    "status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (params['data_type'], params['start_date'], params['end_date'], params['save_format'],
+                     params['save_path'], int(bool(params['bulk_mode'])), JOB_RUNNING, now, now)
+                )
+                job_id = cursor.lastrowid
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO job_items (job_id, stock_code, position, state, range_start, range_end, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(job_id, stock_code, position, STATE_PENDING, params['start_date'], params['end_date'], now)
+                     for position, stock_code in enumerate(stock_codes)]
+                )
+        return job_id
+
+    def get_job(self, job_id):
+        """查询任务参数和状态
+
+        Returns:
+            dict: 任务信息，不存在时返回None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT job_id, {', '.join(JOB_FIELDS)}, status, created_at FROM jobs WHERE job_id=?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(['job_id'] + JOB_FIELDS + ['status', 'created_at'], row))
+        job['bulk_mode'] = bool(job['bulk_mode'])
+        return job
+
+    def latest_job(self, unfinished_only=False):
+        """查询最近的任务
+
+        Args:
+            unfinished_only (bool): 只查询尚未完成（运行中或已停止）的任务
+
+        Returns:
+            dict: 任务信息，不存在时返回None
+        """
+        sql = "SELECT job_id FROM jobs"
+        params = ()
+        if unfinished_only:
+            sql += " WHERE status IN (?, ?)"
+            params = (JOB_RUNNING, JOB_STOPPED)
+        sql += " ORDER BY job_id DESC LIMIT 1"
+        with self.lock:
+            row = self.conn.execute(sql, params).fetchone()
+        return self.get_job(row[0]) if row else None
+
+    def items(self, job_id):
+        """按原始顺序列出任务中的全部股票及状态
+
+        Returns:
+            list: (股票代码, 状态) 列表
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT stock_code, state FROM job_items WHERE job_id=? ORDER BY position", (job_id,)
+            ).fetchall()
+
+    def codes_in_state(self, job_id, states):
+        """列出处于指定状态的股票
+
+        Args:
+            job_id (int): 任务编号
+            states (tuple): 状态列表
+
+        Returns:
+            list: 按原始顺序排列的股票代码
+        """
+        placeholders = ', '.join('?' for _ in states)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT stock_code FROM job_items WHERE job_id=? AND state IN ({placeholders}) ORDER BY position",
+                (job_id,) + tuple(states)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self, job_id):
+        """统计任务中各状态的股票数量
+
+        Returns:
+            dict: {状态: 数量}
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM job_items WHERE job_id=? GROUP BY state", (job_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def mark_running(self, job_id, stock_codes):
+        """标记股票开始下载，并累计尝试次数"""
+        now = self._now()
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE job_items SET state=?, attempts=attempts+1, updated_at=? WHERE job_id=? AND stock_code=?",
+                    [(STATE_RUNNING, now, job_id, stock_code) for stock_code in stock_codes]
+                )
+
+    def mark_result(self, job_id, stock_code, state, message=None, range_start=None, range_end=None):
+        """记录股票的下载结果
+
+        Args:
+            job_id (int): 任务编号
+            stock_code (str): 股票代码
+            state (str): 状态
+            message (str): 结果说明
+            range_start (str): 实际下载的开始时间，未提供时保持不变
+            range_end (str): 实际下载的结束时间，未提供时保持不变
+        """
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE job_items SET state=?, message=?, range_start=COALESCE(?, range_start), "
+                    "range_end=COALESCE(?, range_end), updated_at=? WHERE job_id=? AND stock_code=?",
+                    (state, message, range_start, range_end, self._now(), job_id, stock_code)
+                )
+
+    def reset_states(self, job_id, states):
+        """将处于指定状态的股票重新置为等待下载，用于继续中断的任务或重试失败的股票
+
+        Returns:
+            int: 重置的股票数量
+        """
+        placeholders = ', '.join('?' for _ in states)
+        with self.lock:
+            with self.conn:
+                cursor = self.conn.execute(
+                    f"UPDATE job_items SET state=?, updated_at=? WHERE job_id=? AND state IN ({placeholders})",
+                    (STATE_PENDING, self._now(), job_id) + tuple(states)
+                )
+        return cursor.rowcount
+
+    def set_job_status(self, job_id, status):
+        """更新任务状态"""
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE jobs SET status=?, updated_at=? WHERE job_id=?", (status, self._now(), job_id)
+                )
+
+    def close(self):
+        """关闭日志数据库连接"""
+        with self.lock:
+            self.conn.close()
+
+    @staticmethod
+    def _now():
+        """当前时间字符串"""
+        return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,753 @@
+# coding=utf-8
+"""
+QMT全推行情监控
+订阅沪深两市的全推行情，按涨跌幅阈值筛选监控范围内的股票并发出预警，
+不依赖图形界面，预警文字通过回调交给调用方显示，声音在Windows上使用系统提示音。
+QMT的推送回调只把数据按股票代码合并到待处理快照中，由唯一的处理线程按到达顺序处理，
+处理速度跟不上推送时，多次推送合并为一次，同一股票只保留最新的快照。
+监控范围在启动时编译为股票代码到数组下标的索引，每批快照写入NumPy数组后一次性向量化判断涨跌幅。
+预警声音由唯一的声音线程播放，同一类型的声音在 DEFAULT_SOUND_INTERVAL 秒内最多播放一次
+"""
+
+import datetime
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+# QMT相关导入
+try:
+    from xtquant import xtdata
+except ImportError:
+    xtdata = None
+
+
+# 可选的监控范围及其对应的QMT板块，自定义列表由调用方提供
+MONITOR_SECTORS = {
+    "全市场": ['上海A股', '深圳A股'],
+    "沪深A股": ['沪深A股'],
+    "创业板": ['创业板'],
+    "科创板": ['科创板'],
+}
+CUSTOM_SCOPE = "自定义列表"
+
+# 可选的预警声音
+SOUND_TYPES = ("系统提示音", "警报声", "铃声", "自定义音效")
+
+# 每次推送在显示区域中每个方向最多列出的股票数量
+MAX_ALERT_LINES = 5
+
+# 处理线程输出吞吐量和延迟统计的间隔（秒）
+STATS_INTERVAL = 60
+
+# 同一类型的预警声音两次播放之间的最短间隔（秒），间隔内的预警合并为一次
+DEFAULT_SOUND_INTERVAL = 1.0
+
+# 声音线程待处理事件的上限，队列满时丢弃新事件，反正它们会被合并
+SOUND_QUEUE_SIZE = 64
+
+# 预警回差：预警后涨跌幅需要回到阈值以内超过该幅度才重新布防，避免在阈值附近反复预警
+DEFAULT_HYSTERESIS = 0.005
+
+# 预警冷却时间（秒）：同一股票两次预警之间的最短间隔
+DEFAULT_COOLDOWN = 60
+
+# 股票的预警状态
+ALERT_ARMED = 0   # 已布防，越过阈值时预警
+ALERT_RISE = 1    # 已发出涨幅预警，等待回落
+ALERT_FALL = -1   # 已发出跌幅预警，等待回升
+
+
+def get_monitor_stock_list(monitor_type, custom_stock_list=None, log=print):
+    """获取要监控的股票列表
+
+    Args:
+        monitor_type (str): 监控范围，MONITOR_SECTORS 中的一个或"自定义列表"
+        custom_stock_list (list): 自定义股票列表
+        log: 日志输出回调函数
+
+    Returns:
+        list: 股票代码列表
+    """
+    try:
+        if monitor_type == CUSTOM_SCOPE:
+            return list(custom_stock_list or [])
+
+        sectors = MONITOR_SECTORS.get(monitor_type)
+        if not sectors or xtdata is None:
+            return []
+
+        xtdata.download_sector_data()
+        stocks = []
+        for sector in sectors:
+            stocks.extend(xtdata.get_stock_list_in_sector(sector))
+        return stocks
+
+    except Exception as e:
+        log(f"获取监控股票列表时发生错误: {e}")
+        return []
+
+
+def play_alert_sound(alert_type="rise", sound_type="系统提示音"):
+    """播放预警声音，winsound只在Windows上可用，其他系统不发声
+
+    Args:
+        alert_type (str): 预警类型，'rise'表示涨幅预警，'fall'表示跌幅预警
+        sound_type (str): 声音类型，见 SOUND_TYPES
+
+    Returns:
+        bool: 是否播放了声音
+    """
+    try:
+        import winsound  # Windows系统声音
+    except ImportError:
+        return False
+
+    if sound_type == "系统提示音":
+        # 使用不同的系统声音区分涨跌
+        if alert_type == "rise":
+            winsound.MessageBeep(winsound.MB_OK)  # 上涨用OK声音
+        else:
+            winsound.MessageBeep(winsound.MB_ICONEXCLAMATION)  # 下跌用警告声音
+
+    elif sound_type == "警报声":
+        # 播放系统警报声
+        winsound.MessageBeep(winsound.MB_ICONHAND)
+
+    elif sound_type == "铃声":
+        # 播放系统铃声
+        winsound.MessageBeep(winsound.MB_ICONASTERISK)
+
+    elif sound_type == "自定义音效":
+        # 这里可以扩展为播放自定义音频文件
+        winsound.MessageBeep(winsound.MB_ICONQUESTION)
+
+    return True
+
+
+class WinsoundBackend:
+    """Windows系统提示音，见 play_alert_sound"""
+
+    name = "winsound"
+
+    def play(self, alert_type, sound_type):
+        return play_alert_sound(alert_type, sound_type)
+
+
+class BellBackend:
+    """终端响铃，适用于在终端中运行、没有winsound的系统，不区分涨跌和声音类型"""
+
+    name = "bell"
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def play(self, alert_type, sound_type):
+        stream = self.stream or sys.stdout
+        stream.write('\a')
+        stream.flush()
+        return True
+
+
+class NullBackend:
+    """不发声，用于没有声音设备的系统"""
+
+    name = "none"
+
+    def play(self, alert_type, sound_type):
+        return False
+
+
+class RecordingBackend:
+    """不发声，只记录每次播放请求，用于无界面的Linux环境检查预警声音的合并效果
+
+    只供测试直接创建，不在 SOUND_BACKENDS 中，命令行和配置文件不能选择
+    """
+
+    name = "record"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.played = []  # (time.monotonic(), alert_type, sound_type)
+
+    def play(self, alert_type, sound_type):
+        with self.lock:
+            self.played.append((time.monotonic(), alert_type, sound_type))
+        return True
+
+
+# 命令行和配置文件可以选择的声音后端
+SOUND_BACKENDS = {backend.name: backend for backend in (WinsoundBackend, BellBackend, NullBackend)}
+
+
+def create_sound_backend(name="auto"):
+    """按名称创建声音后端
+
+    Args:
+        name (str): 'auto' 或 SOUND_BACKENDS 中的名称，'auto' 在可以导入winsound时使用系统提示音，否则不发声
+
+    Returns:
+        声音后端，提供 play(alert_type, sound_type) 方法，返回是否播放了声音
+    """
+    if name == "auto":
+        try:
+            import winsound  # Windows系统声音
+            name = WinsoundBackend.name
+        except ImportError:
+            name = NullBackend.name
+    if name not in SOUND_BACKENDS:
+        raise ValueError(f"不支持的声音后端: {name}")
+    return SOUND_BACKENDS[name]()
+
+
+class AlertSoundWorker:
+    """预警声音线程
+
+    notify 只把预警事件放入队列，不会阻塞调用方；唯一的声音线程依次取出事件，
+    同一类型的声音距上次播放不足 min_interval 秒时先挂起，间隔结束后只播放一次，
+    因此一次推送中的大量预警或连续多次推送最多只产生每种类型每个间隔一次声音。
+    声音线程在第一次 notify 时启动。
+    """
+
+    def __init__(self, backend=None, min_interval=DEFAULT_SOUND_INTERVAL, log_callback=None):
+        """
+        初始化预警声音线程
+
+        Args:
+            backend: 声音后端，默认由 create_sound_backend 自动选择
+            min_interval (float): 同一类型的声音两次播放之间的最短间隔（秒）
+            log_callback: 日志输出回调函数，默认直接打印
+        """
+        self.backend = backend if backend is not None else create_sound_backend()
+        self.min_interval = min_interval
+        self.log = log_callback or print
+        self.queue = queue.Queue(maxsize=SOUND_QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.events = 0  # 收到的预警事件数
+        self.played = 0  # 实际播放的次数
+        self.unsupported_logged = False
+
+    def notify(self, alert_type, sound_type="系统提示音"):
+        """提交一次预警声音，可以在任意线程中调用
+
+        Args:
+            alert_type (str): 预警类型，'rise'表示涨幅预警，'fall'表示跌幅预警
+            sound_type (str): 声音类型，见 SOUND_TYPES
+        """
+        with self.lock:
+            if self.stop_event.is_set():
+                return
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="qmt-alert-sound", daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait((alert_type, sound_type))
+        except queue.Full:
+            pass
+
+    def stop(self, timeout=2):
+        """停止声音线程，挂起未播放的声音直接丢弃"""
+        with self.lock:
+            self.stop_event.set()
+            thread = self.thread
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=timeout)
+
+    def run(self):
+        """声音线程：合并同一类型的事件，每个间隔最多播放一次"""
+        pending = {}  # 预警类型 -> 声音类型，等待间隔结束后播放
+        last_played = {}  # 预警类型 -> 上次播放时间
+        while not self.stop_event.is_set():
+            timeout = None
+            if pending:
+                due = min(last_played[alert_type] + self.min_interval for alert_type in pending)
+                timeout = max(due - time.monotonic(), 0)
+            try:
+                event = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                event = None
+
+            # 把队列中已经到达的事件一起取出合并
+            while event is not None:
+                self.events += 1
+                pending[event[0]] = event[1]
+                try:
+                    event = self.queue.get_nowait()
+                except queue.Empty:
+                    event = None
+            if self.stop_event.is_set():
+                break
+
+            now = time.monotonic()
+            for alert_type in list(pending):
+                if alert_type in last_played and now - last_played[alert_type] < self.min_interval:
+                    continue
+                last_played[alert_type] = now
+                self.play(alert_type, pending.pop(alert_type))
+
+    def play(self, alert_type, sound_type):
+        """通过后端播放一次声音"""
+        try:
+            if self.backend.play(alert_type, sound_type):
+                self.played += 1
+            elif not self.unsupported_logged:
+                self.unsupported_logged = True
+                self.log("当前系统不支持播放预警声音")
+        except Exception as e:
+            self.log(f"播放声音时发生错误: {e}")
+
+
+class MonitorUniverse:
+    """监控范围内股票的价格数组
+
+    每只股票在启动时分配一个固定下标，最新价、昨收价、涨跌幅阈值和预警状态都保存在按下标排列的NumPy数组中。
+    update 把一批快照写入数组，evaluate 对这批快照涉及的股票一次性计算涨跌幅并推进预警状态，
+    不在Python循环中逐只股票判断。
+
+    预警只在越过阈值时触发一次：发出涨幅预警后，涨幅回落到 阈值-回差 以下才重新布防，跌幅同理；
+    同一股票在冷却时间内不会再次预警，冷却期间越过阈值的股票在冷却结束后仍在阈值之外时预警。
+    """
+
+    def __init__(self, stock_codes, rise_threshold, fall_threshold, hysteresis=DEFAULT_HYSTERESIS,
+                 cooldown=DEFAULT_COOLDOWN):
+        """
+        初始化监控范围
+
+        Args:
+            stock_codes (list): 监控的股票代码，重复的代码只保留一个
+            rise_threshold (float): 涨幅阈值
+            fall_threshold (float): 跌幅阈值（正数）
+            hysteresis (float): 预警回差，例如0.005表示0.5%
+            cooldown (float): 预警冷却时间（秒）
+        """
+        self.codes = list(dict.fromkeys(stock_codes))
+        self.index = {code: slot for slot, code in enumerate(self.codes)}
+        size = len(self.codes)
+        self.last_price = np.full(size, np.nan)
+        self.pre_close = np.full(size, np.nan)
+        self.rise_threshold = np.full(size, float(rise_threshold))
+        self.fall_threshold = np.full(size, float(fall_threshold))
+        self.hysteresis = float(hysteresis)
+        self.cooldown = float(cooldown)
+        self.state = np.full(size, ALERT_ARMED, dtype=np.int8)
+        self.last_alert_time = np.full(size, -np.inf)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def set_thresholds(self, rise_threshold=None, fall_threshold=None, stock_codes=None):
+        """修改涨跌幅阈值
+
+        Args:
+            rise_threshold (float): 涨幅阈值，None表示不修改
+            fall_threshold (float): 跌幅阈值，None表示不修改
+            stock_codes (list): 只修改这些股票的阈值，默认全部股票
+        """
+        slots = slice(None) if stock_codes is None else self.slots_of(stock_codes)
+        if rise_threshold is not None:
+            self.rise_threshold[slots] = rise_threshold
+        if fall_threshold is not None:
+            self.fall_threshold[slots] = fall_threshold
+
+    def slots_of(self, stock_codes):
+        """股票代码对应的下标，不在监控范围内的代码被忽略"""
+        return np.array([self.index[code] for code in stock_codes if code in self.index], dtype=np.intp)
+
+    def update(self, data_dict):
+        """把一批快照写入价格数组
+
+        Args:
+            data_dict (dict): {股票代码: 快照}，快照是包含lastPrice和lastClose的字典，或这样的字典的列表
+
+        Returns:
+            ndarray: 本批快照涉及的下标，按快照在字典中的顺序排列
+        """
+        index_get = self.index.get
+        slots = np.fromiter((index_get(code, -1) for code in data_dict), dtype=np.intp, count=len(data_dict))
+        ticks = list(data_dict.values())
+        try:
+            # 常见情况下快照都是字典，用列表推导式一次取出价格
+            prices = np.array([tick_data['lastPrice'] for tick_data in ticks], dtype=np.float64)
+            closes = np.array([tick_data['lastClose'] for tick_data in ticks], dtype=np.float64)
+        except (KeyError, TypeError, IndexError, ValueError):
+            prices, closes = self._extract_prices(ticks)
+
+        # 不在监控范围内或快照无效的股票不写入
+        valid = (slots >= 0) & ~np.isnan(prices)
+        slots = slots[valid]
+        self.last_price[slots] = prices[valid]
+        self.pre_close[slots] = closes[valid]
+        return slots
+
+    @staticmethod
+    def _extract_prices(ticks):
+        """逐条取出快照中的最新价和昨收价，兼容列表形式的快照，无效的快照价格为NaN"""
+        prices = np.full(len(ticks), np.nan)
+        closes = np.full(len(ticks), np.nan)
+        for position, tick_data in enumerate(ticks):
+            if isinstance(tick_data, list):
+                if not tick_data:
+                    continue
+                tick_data = tick_data[0]
+            try:
+                price = float(tick_data['lastPrice'])
+                close = float(tick_data['lastClose'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            prices[position] = price
+            closes[position] = close
+        return prices, closes
+
+    def change_ratio(self, slots):
+        """计算给定下标的涨跌幅，昨收价无效时为NaN"""
+        pre_close = self.pre_close[slots]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(pre_close > 0, self.last_price[slots] / pre_close - 1, np.nan)
+
+    def evaluate(self, slots, now=None):
+        """对给定下标一次性推进预警状态，返回本次新越过阈值的股票
+
+        Args:
+            slots (ndarray): 需要判断的下标
+            now (float): 当前时间（time.monotonic），默认取当前时间
+
+        Returns:
+            tuple: (新发出涨幅预警的下标, 新发出跌幅预警的下标, 全部给定下标的涨跌幅)
+        """
+        if now is None:
+            now = time.monotonic()
+        ratio = self.change_ratio(slots)
+        state = self.state[slots]
+        rise_threshold = self.rise_threshold[slots]
+        fall_threshold = self.fall_threshold[slots]
+
+        # 回到阈值以内超过回差的股票重新布防；NaN参与比较的结果为False，昨收价无效的股票状态不变
+        state[(state == ALERT_RISE) & (ratio < rise_threshold - self.hysteresis)] = ALERT_ARMED
+        state[(state == ALERT_FALL) & (ratio > -fall_threshold + self.hysteresis)] = ALERT_ARMED
+
+        ready = self.last_alert_time[slots] + self.cooldown <= now
+        rise_mask = ready & (state != ALERT_RISE) & (ratio > rise_threshold)
+        fall_mask = ready & (state != ALERT_FALL) & (ratio < -fall_threshold) & ~rise_mask
+        state[rise_mask] = ALERT_RISE
+        state[fall_mask] = ALERT_FALL
+
+        self.state[slots] = state
+        fired = slots[rise_mask | fall_mask]
+        self.last_alert_time[fired] = now
+        return slots[rise_mask], slots[fall_mask], ratio
+
+    def rearm(self):
+        """清除全部股票的预警状态和冷却时间"""
+        self.state[:] = ALERT_ARMED
+        self.last_alert_time[:] = -np.inf
+
+
+class LatestSnapshotBuffer:
+    """按股票代码合并的待处理推送
+
+    put 在QMT的回调线程中调用，只把推送合并到字典中，同一股票的新快照覆盖旧快照；
+    take 在处理线程中调用，一次取走全部待处理的快照。待处理数据最多为每只股票一条，
+    内存占用以全市场股票数为上限，与推送频率无关。
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.push_count = 0  # 自上次取走以来合并的推送次数
+        self.first_push_time = None  # 自上次取走以来第一次推送的到达时间
+        self.closed = False
+
+    def put(self, data_dict):
+        """合并一次推送
+
+        Args:
+            data_dict (dict): {股票代码: 快照}
+        """
+        with self.condition:
+            if self.closed:
+                return
+            if self.first_push_time is None:
+                self.first_push_time = time.perf_counter()
+            self.pending.update(data_dict)
+            self.push_count += 1
+            self.condition.notify()
+
+    def take(self, timeout=None):
+        """取走全部待处理的快照，没有数据时最多等待timeout秒
+
+        Returns:
+            tuple: (快照字典, 合并的推送次数, 第一次推送的到达时间)，超时或已关闭时返回None
+        """
+        with self.condition:
+            if not self.pending and not self.closed:
+                self.condition.wait(timeout)
+            if not self.pending:
+                return None
+            batch = (self.pending, self.push_count, self.first_push_time)
+            self.pending = {}
+            self.push_count = 0
+            self.first_push_time = None
+            return batch
+
+    def close(self):
+        """不再接收推送，唤醒等待中的处理线程"""
+        with self.condition:
+            self.closed = True
+            self.pending = {}
+            self.condition.notify_all()
+
+
+class FullPushMonitor:
+    """全推行情涨跌幅监控
+
+    start 把监控范围编译为 MonitorUniverse，订阅全推行情并启动处理线程，stop 取消订阅并等待处理线程退出。
+    涨幅越过 rise_threshold 或跌幅越过 fall_threshold 的股票产生一条预警，停留在阈值之外不会重复预警，
+    预警文字和每批的汇总通过 on_message 回调输出，吞吐量和延迟统计每隔 STATS_INTERVAL 秒输出到日志。
+    """
+
+    def __init__(self, rise_threshold=0.05, fall_threshold=0.05, sound_enabled=True, sound_type="系统提示音",
+                 on_message=None, log_callback=None, hysteresis=DEFAULT_HYSTERESIS, cooldown=DEFAULT_COOLDOWN,
+                 sound_worker=None):
+        """
+        初始化全推监控
+
+        Args:
+            rise_threshold (float): 涨幅阈值，例如0.05表示5%
+            fall_threshold (float): 跌幅阈值
+            sound_enabled (bool): 是否播放预警声音
+            sound_type (str): 声音类型，见 SOUND_TYPES
+            on_message: 预警文字回调函数，参数为一行以换行符结尾的文字，默认输出到日志
+            log_callback: 日志输出回调函数，默认直接打印
+            hysteresis (float): 预警回差，见 MonitorUniverse
+            cooldown (float): 同一股票两次预警之间的最短间隔（秒）
+            sound_worker (AlertSoundWorker): 预警声音线程，可以与调用方共用；默认由监控自行创建并在停止时关闭
+        """
+        self.rise_threshold = rise_threshold
+        self.fall_threshold = fall_threshold
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+        self.sound_enabled = sound_enabled
+        self.sound_type = sound_type
+        self.log = log_callback or print
+        self.on_message = on_message or (lambda text: self.log(text.rstrip('\n')))
+        self.monitor_stocks = []
+        self.universe = None
+        self.subscription_id = None
+        self.running = False
+        self.alert_count = {"rise": 0, "fall": 0}  # 预警计数
+        self.buffer = None
+        self.worker = None
+        self.owns_sound_worker = sound_worker is None
+        self.sound_worker = sound_worker
+        self.reset_stats()
+
+    def start(self, monitor_stocks):
+        """订阅全推行情并开始监控
+
+        Args:
+            monitor_stocks (list): 要监控的股票列表
+
+        Returns:
+            bool: 是否订阅成功
+        """
+        if xtdata is None:
+            self.log("错误: QMT库不可用")
+            return False
+        if self.running:
+            self.stop()
+
+        self.monitor_stocks = list(monitor_stocks)
+        self.universe = MonitorUniverse(self.monitor_stocks, self.rise_threshold, self.fall_threshold,
+                                        self.hysteresis, self.cooldown)
+        self.alert_count = {"rise": 0, "fall": 0}  # 重置计数
+        self.reset_stats()
+        buffer = LatestSnapshotBuffer()
+        self.buffer = buffer
+        if self.sound_worker is None or (self.owns_sound_worker and self.sound_worker.stop_event.is_set()):
+            self.sound_worker = AlertSoundWorker(log_callback=self.log)
+
+        def fullpush_callback(data_dict):
+            # 回调中只合并数据，不做任何处理，避免阻塞QMT的推送线程
+            buffer.put(data_dict)
+
+        self.running = True
+        self.worker = threading.Thread(target=self.process_loop, args=(buffer,), name="qmt-fullpush", daemon=True)
+        self.worker.start()
+
+        try:
+            subscription_id = xtdata.subscribe_whole_quote(["SH", "SZ"], callback=fullpush_callback)
+        except Exception as e:
+            # 订阅失败时处理线程已经启动，同样需要停止，否则监控一直处于运行状态
+            self.stop()
+            self.log(f"订阅全推行情时发生错误: {e}")
+            return False
+        if subscription_id > 0:
+            self.subscription_id = subscription_id
+            return True
+
+        self.stop()
+        self.log("全推监控启动失败")
+        return False
+
+    def stop(self):
+        """取消全推订阅并停止监控"""
+        # 设置停止标志
+        self.running = False
+
+        # 取消订阅
+        if self.subscription_id and xtdata is not None:
+            try:
+                xtdata.unsubscribe_quote(self.subscription_id)
+                self.log(f"已取消全推订阅 (ID: {self.subscription_id})")
+            except Exception as e:
+                self.log(f"取消订阅时发生错误: {e}")
+            finally:
+                self.subscription_id = None
+
+        # 关闭待处理快照并等待处理线程退出，正在处理的一批会完整处理完
+        if self.buffer is not None:
+            self.buffer.close()
+        if self.worker is not None and self.worker is not threading.current_thread():
+            self.worker.join(timeout=5)
+        self.worker = None
+
+        if self.owns_sound_worker and self.sound_worker is not None:
+            self.sound_worker.stop()
+
+    def status_text(self, monitor_type):
+        """监控启动后显示的参数说明"""
+        return (f"全推监控已启动\n监控范围: {monitor_type} ({len(self.universe or self.monitor_stocks)}只股票)\n"
+                f"涨幅阈值: {self.rise_threshold:.1%}, 跌幅阈值: {self.fall_threshold:.1%}, "
+                f"回差: {self.hysteresis:.2%}, 冷却: {self.cooldown:g}秒\n"
+                f"声音预警: {'启用' if self.sound_enabled else '禁用'}\n")
+
+    def reset_stats(self):
+        """清零吞吐量和延迟统计"""
+        self.stats = {
+            'pushes': 0,         # 收到的推送次数
+            'batches': 0,        # 实际处理的批次数，多次推送可能合并为一批
+            'codes': 0,          # 处理的快照条数
+            'process_ms': 0.0,   # 累计处理耗时
+            'max_process_ms': 0.0,
+            'latency_ms': 0.0,   # 累计延迟：批内第一次推送到达至处理完成
+            'max_latency_ms': 0.0,
+        }
+
+    def stats_text(self):
+        """吞吐量和延迟统计的说明文字"""
+        stats = self.stats
+        batches = max(stats['batches'], 1)
+        return (f"全推处理统计: 收到推送 {stats['pushes']} 次，合并为 {stats['batches']} 批，"
+                f"处理快照 {stats['codes']} 条，平均处理 {stats['process_ms'] / batches:.1f} 毫秒"
+                f"（最大 {stats['max_process_ms']:.1f}），平均延迟 {stats['latency_ms'] / batches:.1f} 毫秒"
+                f"（最大 {stats['max_latency_ms']:.1f}）")
+
+    def process_loop(self, buffer):
+        """处理线程：依次取出合并后的快照并处理，直到停止监控
+
+        Args:
+            buffer (LatestSnapshotBuffer): 待处理快照
+        """
+        next_report = time.monotonic() + STATS_INTERVAL
+        while self.running:
+            batch = buffer.take(timeout=1.0)
+            if batch is not None:
+                data_dict, push_count, first_push_time = batch
+                started = time.perf_counter()
+                self.process_fullpush_data(data_dict)
+                finished = time.perf_counter()
+
+                stats = self.stats
+                process_ms = (finished - started) * 1000
+                latency_ms = (finished - first_push_time) * 1000
+                stats['pushes'] += push_count
+                stats['batches'] += 1
+                stats['codes'] += len(data_dict)
+                stats['process_ms'] += process_ms
+                stats['max_process_ms'] = max(stats['max_process_ms'], process_ms)
+                stats['latency_ms'] += latency_ms
+                stats['max_latency_ms'] = max(stats['max_latency_ms'], latency_ms)
+
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + STATS_INTERVAL
+                if self.stats['batches']:
+                    self.log(self.stats_text())
+
+    def process_fullpush_data(self, data_dict):
+        """处理全推数据，支持涨跌双向监控，只在处理线程中调用
+
+        快照先写入监控范围的价格数组，再对本批涉及的股票一次性向量化判断，
+        只有产生预警的股票才会在Python中格式化文字。
+
+        Args:
+            data_dict (dict): 全推数据字典，可能由多次推送合并而成
+        """
+        try:
+            # 检查是否仍在运行
+            universe = self.universe
+            if not self.running or universe is None:
+                return
+
+            slots = universe.update(data_dict)
+            if not len(slots):
+                return
+            rise_slots, fall_slots, _ = universe.evaluate(slots)
+            rise_count = len(rise_slots)
+            fall_count = len(fall_slots)
+            if not rise_count and not fall_count:
+                return
+
+            self.alert_count["rise"] += rise_count
+            self.alert_count["fall"] += fall_count
+
+            # 每个方向提交一次预警声音，由声音线程合并后播放
+            sound_worker = self.sound_worker
+            if self.sound_enabled and sound_worker is not None:
+                if rise_count:
+                    sound_worker.notify("rise", self.sound_type)
+                if fall_count:
+                    sound_worker.notify("fall", self.sound_type)
+
+            if self.running:
+                timestamp = datetime.datetime.now().strftime('%H:%M:%S')
+                for alert in self.format_alerts(universe, rise_slots, "rise", timestamp):
+                    self.on_message(alert)
+                for alert in self.format_alerts(universe, fall_slots, "fall", timestamp):
+                    self.on_message(alert)
+
+                # 输出汇总信息
+                summary = f"[{timestamp}] 本次推送: 新增涨幅预警 {rise_count} 只, 新增跌幅预警 {fall_count} 只 (累计: 涨 {self.alert_count['rise']}, 跌 {self.alert_count['fall']})\n"
+                self.on_message(summary)
+
+        except Exception as e:
+            self.log(f"处理全推数据时发生错误: {e}")
+
+    @staticmethod
+    def format_alerts(universe, slots, alert_type, timestamp):
+        """格式化一个方向的预警文字，最多列出 MAX_ALERT_LINES 只股票，其余只给出数量
+
+        Returns:
+            list: 以换行符结尾的文字行
+        """
+        lines = []
+        shown = slots[:MAX_ALERT_LINES]
+        ratios = universe.change_ratio(shown)
+        for slot, change_ratio in zip(shown, ratios):
+            code = universe.codes[slot]
+            last_price = universe.last_price[slot]
+            if alert_type == "rise":
+                lines.append(f"[{timestamp}] 📈 {code} 涨幅 {change_ratio:.2%}，最新价 {last_price:.2f}\n")
+            else:
+                lines.append(f"[{timestamp}] 📉 {code} 跌幅 {abs(change_ratio):.2%}，最新价 {last_price:.2f}\n")
+        if len(slots) > MAX_ALERT_LINES:
+            direction = "涨幅" if alert_type == "rise" else "跌幅"
+            lines.append(f"[{timestamp}] ... 还有 {len(slots) - MAX_ALERT_LINES} 只股票{direction}超过阈值\n")
+        return lines
@@ -0,0 +1,175 @@
+# coding=utf-8
+"""
+QMT请求限速
+以令牌桶控制对QMT客户端的请求速率：请求持续快速成功时逐步提高速率，
+出错或响应变慢时成倍降低速率，临时性错误按指数退避自动重试有限次数
+"""
+
+import math
+import random
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    """自适应令牌桶限速器
+
+    每次请求前从令牌桶中取一个令牌，令牌按当前速率补充。速率按“加性增、乘性减”调整：
+    每次快速成功的请求使速率增加 increase_step，每次失败或慢响应使速率乘以 decrease_factor，
+    速率始终限制在 [min_rate, max_rate] 之间。多个下载线程共享同一个限速器。
+    一次请求包含多只股票时通过 call_batch 调用，慢响应阈值按股票数量放大，正常的合并请求不会拖慢其他请求。
+    """
+
+    # 参数或编程错误，重试不会成功
+    NON_RETRYABLE = (TypeError, ValueError, KeyError, AttributeError)
+
+    def __init__(self, rate=5.0, min_rate=0.5, max_rate=50.0, burst=None,
+                 increase_step=0.5, decrease_factor=0.5, slow_threshold=10.0,
+                 max_retries=3, base_delay=1.0, max_delay=30.0):
+        """
+        初始化限速器
+
+        Args:
+            rate (float): 初始速率（次/秒）
+            min_rate (float): 最低速率
+            max_rate (float): 最高速率
+            burst (int): 令牌桶容量，即允许的瞬时突发请求数，默认为4（与默认并发数相同）
+            increase_step (float): 每次快速成功后增加的速率
+            decrease_factor (float): 失败或慢响应时速率的缩减比例
+            slow_threshold (float): 单只股票的请求超过该秒数视为慢响应
+            max_retries (int): 临时性错误的最大重试次数
+            base_delay (float): 第一次重试前的等待秒数，之后每次翻倍
+            max_delay (float): 重试等待的最长秒数
+        """
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.capacity = float(burst if burst is not None else 4)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.slow_threshold = slow_threshold
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.lock = threading.Lock()
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+
+        self.success_count = 0
+        self.failure_count = 0
+        self.retry_count = 0
+
+    def acquire(self):
+        """取得一个令牌，令牌不足时等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def record_success(self, elapsed, batch_size=1):
+        """记录一次成功的请求，快速响应时提高速率，慢响应时降低速率
+
+        Args:
+            elapsed (float): 请求耗时（秒）
+            batch_size (int): 请求包含的股票数量，见 batch_slow_threshold
+        """
+        with self.lock:
+            self.success_count += 1
+            if elapsed > self.batch_slow_threshold(batch_size):
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def batch_slow_threshold(self, batch_size):
+        """一次请求的慢响应阈值（秒）
+
+        合并请求的耗时随股票数量增长，但远低于逐只请求的总耗时，阈值按股票数量的对数放大：
+        单只为 slow_threshold，50只约为6.6倍，500只约为10倍。
+
+        Args:
+            batch_size (int): 请求包含的股票数量
+
+        Returns:
+            float: 超过该秒数视为慢响应
+        """
+        return self.slow_threshold * (1 + math.log2(max(batch_size, 1)))
+
+    def record_failure(self):
+        """记录一次失败的请求，降低速率并清空令牌，避免失败后立即集中重试"""
+        with self.lock:
+            self.failure_count += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = min(self.tokens, 0.0)
+
+    def call(self, func, *args, **kwargs):
+        """在限速下调用函数，临时性错误按指数退避重试
+
+        Args:
+            func: 被调用的函数，如 xtdata.download_history_data
+            *args, **kwargs: 函数参数
+
+        Returns:
+            函数的返回值；重试次数用尽后抛出最后一次的异常
+        """
+        return self.call_batch(1, func, *args, **kwargs)
+
+    def call_batch(self, batch_size, func, *args, **kwargs):
+        """在限速下调用一次包含多只股票的请求，如 xtdata.download_history_data2
+
+        与 call 相同，只是慢响应阈值按股票数量放大，见 batch_slow_threshold
+
+        Args:
+            batch_size (int): 请求包含的股票数量
+            func: 被调用的函数
+            *args, **kwargs: 函数参数
+
+        Returns:
+            函数的返回值；重试次数用尽后抛出最后一次的异常
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except self.NON_RETRYABLE:
+                raise
+            except Exception:
+                self.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                # 指数退避，加入随机抖动，避免多个线程同时重试
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                attempt += 1
+                with self.lock:
+                    self.retry_count += 1
+                continue
+
+            self.record_success(time.monotonic() - start, batch_size)
+            return result
+
+    def stats(self):
+        """当前速率和请求统计
+
+        Returns:
+            dict: {rate, success, failure, retry}
+        """
+        with self.lock:
+            return {
+                'rate': self.rate,
+                'success': self.success_count,
+                'failure': self.failure_count,
+                'retry': self.retry_count
+            }
+
+
+# 所有xtdata下载和读取请求共享的限速器
+xtdata_limiter = AdaptiveRateLimiter()
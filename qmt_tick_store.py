@@ -0,0 +1,225 @@
+# coding=utf-8
+"""
+QMT二进制分笔数据存储
+每只股票每个交易日一个文件，文件内容是定长的NumPy结构化记录，没有文件头，只追加写入；
+读取时用 np.memmap 映射文件，直接返回零拷贝的数组视图，多个进程读取同一文件时共享操作系统的页缓存
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from qmt_columnar_store import expand_list_columns, partition_key_of_day
+from qmt_trading_calendar import BEIJING_OFFSET_MS, MS_PER_DAY
+
+
+# 保存格式名称和文件扩展名
+BINARY_FORMAT = 'binary'
+TICK_FILE_EXTENSION = '.tick'
+
+# 盘口档位数量
+TICK_LEVELS = 5
+
+# 每条分笔记录的布局（小端，紧凑排列），修改布局需要同时更换保存目录，否则无法读取已有文件
+TICK_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('lastPrice', '<f8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('lastClose', '<f8'),
+    ('volume', '<i8'),
+    ('amount', '<f8'),
+    ('askPrice', '<f8', (TICK_LEVELS,)),
+    ('bidPrice', '<f8', (TICK_LEVELS,)),
+    ('askVol', '<i8', (TICK_LEVELS,)),
+    ('bidVol', '<i8', (TICK_LEVELS,)),
+])
+
+
+def frame_to_records(df):
+    """将分笔数据DataFrame转换为定长记录数组
+
+    盘口列可以是QMT返回的列表列（askPrice），也可以是已经展开的档位列（askPrice1至askPrice5），
+    缺少的字段填0。
+
+    Args:
+        df (DataFrame): 分笔数据，time列为毫秒时间戳
+
+    Returns:
+        ndarray: TICK_DTYPE 结构化数组
+    """
+    df = expand_list_columns(df.reset_index(drop=True))
+    records = np.zeros(len(df), dtype=TICK_DTYPE)
+    for name in TICK_DTYPE.names:
+        shape = TICK_DTYPE[name].shape
+        if not shape:
+            if name in df.columns:
+                records[name] = df[name].fillna(0).to_numpy()
+            continue
+        for level in range(shape[0]):
+            column = f"{name}{level + 1}"
+            if column in df.columns:
+                records[name][:, level] = df[column].fillna(0).to_numpy()
+    return records
+
+
+def records_to_frame(records):
+    """将记录数组转换为DataFrame，盘口字段展开为按档位编号的列
+
+    Args:
+        records (ndarray): TICK_DTYPE 结构化数组或其视图
+
+    Returns:
+        DataFrame: 分笔数据，time列为毫秒时间戳
+    """
+    columns = {}
+    for name in TICK_DTYPE.names:
+        values = records[name]
+        if values.ndim == 1:
+            columns[name] = values
+        else:
+            for level in range(values.shape[1]):
+                columns[f"{name}{level + 1}"] = values[:, level]
+    return pd.DataFrame(columns)
+
+
+class TickBinaryStore:
+    """二进制分笔数据存储
+
+    目录结构为 {保存目录}/binary/tick/{股票代码}/{交易日YYYYMMDD}.tick。
+    写入时只追加时间晚于文件最后一条记录的数据，不改写已有内容；
+    异常中断留下的不完整记录在读取时忽略，下次写入时被新记录覆盖。
+    """
+
+    def __init__(self, save_path):
+        """
+        初始化二进制分笔存储
+
+        Args:
+            save_path (str): 数据保存目录
+        """
+        self.root = os.path.join(save_path, BINARY_FORMAT, 'tick')
+
+    def stock_dir(self, stock_code):
+        """股票数据所在的目录"""
+        return os.path.join(self.root, stock_code)
+
+    def file_path(self, stock_code, trade_date):
+        """股票某个交易日的数据文件路径"""
+        return os.path.join(self.stock_dir(stock_code), f"{trade_date}{TICK_FILE_EXTENSION}")
+
+    def days(self, stock_code):
+        """列出股票已保存的交易日
+
+        Returns:
+            list: 升序排列的交易日，格式YYYYMMDD
+        """
+        directory = self.stock_dir(stock_code)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len(TICK_FILE_EXTENSION)] for name in os.listdir(directory)
+                      if name.endswith(TICK_FILE_EXTENSION))
+
+    def append(self, stock_code, df):
+        """追加分笔数据，按交易日写入各自的文件
+
+        Args:
+            stock_code (str): 股票代码
+            df (DataFrame): 分笔数据，time列为毫秒时间戳
+
+        Returns:
+            int: 实际追加的记录数，早于或等于文件中最后一条记录时间的数据被忽略
+        """
+        if df is None or df.empty:
+            return 0
+
+        records = frame_to_records(df.drop(columns=['stock_code'], errors='ignore'))
+        records = records[np.argsort(records['time'], kind='stable')]
+        day_numbers = (records['time'] + BEIJING_OFFSET_MS) // MS_PER_DAY
+        bounds = np.flatnonzero(np.diff(day_numbers)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(records)]))
+
+        os.makedirs(self.stock_dir(stock_code), exist_ok=True)
+        written = 0
+        for start, end in zip(starts, ends):
+            trade_date = partition_key_of_day(day_numbers[start], 'tick')
+            file_path = self.file_path(stock_code, trade_date)
+            last_time, complete_size = self._last_record(file_path)
+
+            day_records = records[start:end]
+            if last_time is not None:
+                day_records = day_records[day_records['time'] > last_time]
+            if len(day_records) == 0:
+                continue
+            # 同一时间的多条快照只保留最后一条
+            keep = np.concatenate((day_records['time'][1:] != day_records['time'][:-1], [True]))
+            day_records = day_records[keep]
+
+            # 从最后一条完整记录之后写入，覆盖写入中断时留下的半条记录。文件只增长不截断：
+            # 文件可能正被读取方映射，Windows 上不能截断已映射的文件
+            with open(file_path, 'r+b' if os.path.exists(file_path) else 'wb') as f:
+                f.seek(complete_size)
+                f.write(day_records.tobytes())
+            written += len(day_records)
+        return written
+
+    def read_day(self, stock_code, trade_date):
+        """映射股票一个交易日的数据文件
+
+        Returns:
+            ndarray: 只读的 TICK_DTYPE 记录视图（np.memmap），按字段访问同样不复制数据；
+                没有数据时返回空数组
+        """
+        file_path = self.file_path(stock_code, trade_date)
+        count = os.path.getsize(file_path) // TICK_DTYPE.itemsize if os.path.exists(file_path) else 0
+        if count == 0:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return np.memmap(file_path, dtype=TICK_DTYPE, mode='r', shape=(count,))
+
+    def read(self, stock_code, start_date=None, end_date=None):
+        """映射股票一段日期内的全部数据文件
+
+        Args:
+            stock_code (str): 股票代码
+            start_date (str): 开始日期，格式YYYYMMDD（包含）
+            end_date (str): 结束日期，格式YYYYMMDD（包含）
+
+        Returns:
+            dict: {交易日: 记录视图}，按交易日升序
+        """
+        return {trade_date: self.read_day(stock_code, trade_date)
+                for trade_date in self.days(stock_code)
+                if (not start_date or trade_date >= str(start_date)[:8])
+                and (not end_date or trade_date <= str(end_date)[:8])}
+
+    def last_time(self, stock_code):
+        """获取已保存数据的最新时间，只读取最后一个文件的最后一条记录
+
+        Returns:
+            int: 毫秒时间戳，没有数据时返回None
+        """
+        for trade_date in reversed(self.days(stock_code)):
+            records = self.read_day(stock_code, trade_date)
+            if len(records):
+                return int(records['time'][-1])
+        return None
+
+    @staticmethod
+    def _last_record(file_path):
+        """获取最后一条完整记录的时间和完整记录的总字节数，文件末尾不完整的记录不计入
+
+        Returns:
+            tuple: (最后一条记录的时间, 完整记录的字节数)，文件不存在或没有完整记录时为 (None, 0)
+        """
+        if not os.path.exists(file_path):
+            return None, 0
+        size = os.path.getsize(file_path)
+        complete = size - size % TICK_DTYPE.itemsize
+        if complete == 0:
+            return None, 0
+        with open(file_path, 'rb') as f:
+            f.seek(complete - TICK_DTYPE.itemsize)
+            return int(np.frombuffer(f.read(TICK_DTYPE.itemsize), dtype=TICK_DTYPE)['time'][0]), complete
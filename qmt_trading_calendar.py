@@ -0,0 +1,317 @@
+# coding=utf-8
+"""
+QMT交易日历
+从xtdata构建一次交易日列表并缓存到本地文件，提供O(1)的前后交易日查询和区间枚举
+"""
+
+import datetime
+import json
+import os
+import threading
+
+# QMT相关导入
+try:
+    from xtquant import xtdata
+except ImportError:
+    xtdata = None
+
+
+# 北京时间相对UTC的偏移（毫秒）以及一天的毫秒数，用于从毫秒时间戳计算交易日
+BEIJING_OFFSET_MS = 8 * 3600 * 1000
+MS_PER_DAY = 24 * 3600 * 1000
+
+
+def ms_to_date(timestamp_ms):
+    """将毫秒时间戳转换为北京时间的日期字符串
+
+    Args:
+        timestamp_ms (int): 毫秒时间戳
+
+    Returns:
+        str: 日期，格式YYYYMMDD
+    """
+    day_number = (int(timestamp_ms) + BEIJING_OFFSET_MS) // MS_PER_DAY
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=day_number)).strftime('%Y%m%d')
+
+
+def ms_to_time_str(timestamp_ms):
+    """将毫秒时间戳转换为北京时间的时间字符串
+
+    Args:
+        timestamp_ms (int): 毫秒时间戳
+
+    Returns:
+        str: 时间，格式YYYYMMDDHHMMSS，可直接作为xtdata的start_time
+    """
+    dt = datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=int(timestamp_ms) + BEIJING_OFFSET_MS)
+    return dt.strftime('%Y%m%d%H%M%S')
+
+
+def session_close_ms(date_str):
+    """获取交易日收盘时刻（北京时间15:00）的毫秒时间戳
+
+    Args:
+        date_str (str): 日期，格式YYYYMMDD
+
+    Returns:
+        int: 毫秒时间戳
+    """
+    close_dt = datetime.datetime.strptime(date_str, '%Y%m%d') + datetime.timedelta(hours=15)
+    return int((close_dt - datetime.datetime(1970, 1, 1)).total_seconds() * 1000) - BEIJING_OFFSET_MS
+
+
+def _shift_date(date_str, days):
+    """日期字符串加减天数"""
+    dt = datetime.datetime.strptime(date_str, '%Y%m%d') + datetime.timedelta(days=days)
+    return dt.strftime('%Y%m%d')
+
+
+def _is_weekday(date_str):
+    """是否为周一至周五"""
+    return datetime.datetime.strptime(date_str, '%Y%m%d').weekday() < 5
+
+
+class TradingCalendar:
+    """交易日历
+
+    交易日列表只在首次使用（或缓存已过期）时从xtdata获取，之后从本地文件加载。
+    查询时使用预先计算好的日期索引，不需要在列表中查找。
+    超出缓存范围的日期（如尚未公布假期安排的未来日期）按周一至周五近似处理。
+    """
+
+    def __init__(self, cache_file="trading_calendar.json", market="SH", start_date="19900101"):
+        """
+        初始化交易日历
+
+        Args:
+            cache_file (str): 本地缓存文件路径
+            market (str): 市场代码，沪深交易日相同，默认使用上海
+            start_date (str): 日历起始日期
+        """
+        self.cache_file = cache_file
+        self.market = market
+        self.start_date = start_date
+        self.lock = threading.Lock()
+
+        self.dates = []            # 升序排列的交易日
+        self.covered_until = ""    # 日历可信覆盖到的日期
+        self._index = {}           # 交易日 -> 在dates中的位置
+        self._first_on_or_after = {}  # 覆盖范围内的每个自然日 -> 不早于该日的第一个交易日的位置
+        self._last_build_date = None
+
+    def ensure(self, end_date=None):
+        """确保日历覆盖到指定日期，必要时从本地缓存加载或从xtdata重新构建
+
+        Args:
+            end_date (str): 需要覆盖到的日期，默认为今天
+
+        Returns:
+            bool: 日历是否来自真实的交易日数据
+        """
+        today = datetime.datetime.now().strftime('%Y%m%d')
+        # 未来日期的假期安排未必已公布，最多要求覆盖到今天
+        target = min(end_date or today, today)
+
+        with self.lock:
+            if self.dates and self.covered_until >= target:
+                return True
+
+            if not self.dates:
+                self._load()
+                if self.dates and self.covered_until >= target:
+                    return True
+
+            # 每天最多尝试从xtdata构建一次
+            if self._last_build_date != today:
+                self._last_build_date = today
+                dates, covered_until = self._build(today)
+                if dates:
+                    self._set_dates(dates, covered_until)
+                    self._save()
+
+            return bool(self.dates)
+
+    def is_trading_day(self, date_str):
+        """判断是否为交易日
+
+        Args:
+            date_str (str): 日期，格式YYYYMMDD
+
+        Returns:
+            bool: 是否为交易日
+        """
+        if self._in_range(date_str):
+            return date_str in self._index
+        return _is_weekday(date_str)
+
+    def next_trading_day(self, date_str):
+        """获取指定日期之后的下一个交易日
+
+        Args:
+            date_str (str): 日期，格式YYYYMMDD
+
+        Returns:
+            str: 下一个交易日，格式YYYYMMDD
+        """
+        candidate = _shift_date(date_str, 1)
+        if self.dates and candidate < self.dates[0]:
+            return self.dates[0]
+
+        if self._in_range(candidate):
+            if candidate in self._index:
+                return candidate
+            position = self._first_on_or_after[candidate]
+            if position < len(self.dates):
+                return self.dates[position]
+            candidate = _shift_date(self.covered_until, 1)
+
+        # 超出日历范围，按工作日近似
+        while not _is_weekday(candidate):
+            candidate = _shift_date(candidate, 1)
+        return candidate
+
+    def prev_trading_day(self, date_str):
+        """获取指定日期之前的上一个交易日
+
+        Args:
+            date_str (str): 日期，格式YYYYMMDD
+
+        Returns:
+            str: 上一个交易日，格式YYYYMMDD，早于日历起点时返回None
+        """
+        candidate = _shift_date(date_str, -1)
+        while not self.dates or candidate > self.covered_until:
+            # 超出日历范围，按工作日近似
+            if _is_weekday(candidate):
+                return candidate
+            candidate = _shift_date(candidate, -1)
+
+        if candidate < self.dates[0]:
+            return None
+        if candidate in self._index:
+            return candidate
+        position = self._first_on_or_after[candidate] - 1
+        return self.dates[position] if position >= 0 else None
+
+    def trading_days(self, start_date, end_date):
+        """枚举区间内的全部交易日（包含首尾）
+
+        Args:
+            start_date (str): 开始日期，格式YYYYMMDD
+            end_date (str): 结束日期，格式YYYYMMDD
+
+        Returns:
+            list: 交易日列表，格式YYYYMMDD
+        """
+        if start_date > end_date:
+            return []
+
+        result = []
+        if self.dates and start_date <= self.covered_until:
+            first = self._position_on_or_after(start_date)
+            last_date = min(end_date, self.covered_until)
+            last = self._position_on_or_after(_shift_date(last_date, 1))
+            result.extend(self.dates[first:last])
+            start_date = _shift_date(self.covered_until, 1)
+
+        # 超出日历范围的部分按工作日近似
+        current = start_date
+        while current <= end_date:
+            if _is_weekday(current):
+                result.append(current)
+            current = _shift_date(current, 1)
+        return result
+
+    def _in_range(self, date_str):
+        """日期是否在日历的可信覆盖范围内"""
+        return bool(self.dates) and self.dates[0] <= date_str <= self.covered_until
+
+    def _position_on_or_after(self, date_str):
+        """不早于指定日期的第一个交易日的位置"""
+        if date_str < self.dates[0]:
+            return 0
+        if date_str > self.covered_until:
+            return len(self.dates)
+        if date_str in self._index:
+            return self._index[date_str]
+        return self._first_on_or_after[date_str]
+
+    def _set_dates(self, dates, covered_until):
+        """设置交易日列表并重建日期索引"""
+        dates = sorted(set(dates))
+        covered_until = max(covered_until, dates[-1])
+
+        index = {date_str: position for position, date_str in enumerate(dates)}
+        first_on_or_after = {}
+        position = 0
+        current = datetime.datetime.strptime(dates[0], '%Y%m%d')
+        end = datetime.datetime.strptime(covered_until, '%Y%m%d')
+        while current <= end:
+            date_str = current.strftime('%Y%m%d')
+            while position < len(dates) and dates[position] < date_str:
+                position += 1
+            if date_str not in index:
+                first_on_or_after[date_str] = position
+            current += datetime.timedelta(days=1)
+
+        self.dates = dates
+        self.covered_until = covered_until
+        self._index = index
+        self._first_on_or_after = first_on_or_after
+
+    def _build(self, today):
+        """从xtdata获取交易日列表
+
+        Returns:
+            tuple: (交易日列表, 覆盖到的日期)，获取失败时交易日列表为空
+        """
+        if xtdata is None:
+            return [], ""
+
+        # 优先使用包含未来假期安排的交易日历
+        try:
+            if hasattr(xtdata, 'download_holiday_data'):
+                xtdata.download_holiday_data()
+            year_end = f"{today[:4]}1231"
+            dates = xtdata.get_trading_calendar(self.market, start_time=self.start_date, end_time=year_end)
+            if dates:
+                return [str(date_str) for date_str in dates], year_end
+        except Exception:
+            pass
+
+        # 退回到历史交易日
+        try:
+            timestamps = xtdata.get_trading_dates(self.market, start_time=self.start_date, end_time=today)
+            if timestamps:
+                return [ms_to_date(timestamp) for timestamp in timestamps], today
+        except Exception:
+            pass
+
+        return [], ""
+
+    def _load(self):
+        """从本地缓存文件加载交易日历"""
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+                if cache.get('market') == self.market and cache.get('dates'):
+                    self._set_dates(cache['dates'], cache.get('covered_until', ''))
+        except Exception:
+            pass
+
+    def _save(self):
+        """将交易日历写入本地缓存文件"""
+        try:
+            cache = {
+                'market': self.market,
+                'covered_until': self.covered_until,
+                'built_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'dates': self.dates
+            }
+            temp_file = f"{self.cache_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except Exception:
+            pass
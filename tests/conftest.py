@@ -0,0 +1,7 @@
+# coding=utf-8
+"""测试公共设置：把仓库根目录加入模块搜索路径，测试直接导入顶层的 qmt_* 模块"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
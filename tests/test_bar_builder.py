@@ -0,0 +1,99 @@
+# coding=utf-8
+"""qmt_bar_builder 测试：交易时段划分和K线合成"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from qmt_bar_builder import build_tick_bars, minute_bar_labels, tick_bar_labels
+
+
+def bj_ms(text):
+    """北京时间字符串转换为毫秒时间戳"""
+    return int((pd.Timestamp(text) - pd.Timedelta(hours=8)).value // 10 ** 6)
+
+
+def labels_of(func, times, size, fmt='%H:%M'):
+    """计算2024-01-02一组北京时间的标签，返回北京时间的时间字符串"""
+    labels = func(np.array([bj_ms(f"2024-01-02 {t}") for t in times]), size)
+    return [(pd.Timestamp(int(label), unit='ms') + pd.Timedelta(hours=8)).strftime(fmt) for label in labels]
+
+
+@pytest.mark.parametrize("minutes, times, expected", [
+    # 09:30 集合竞价并入第一根，K线以结束时刻标记
+    (30, ['09:30', '09:31', '10:00', '10:01'], ['10:00', '10:00', '10:00', '10:30']),
+    # 上午最后一根在 11:30 结束，下午从 13:00 重新计数
+    (30, ['11:01', '11:30', '13:01', '13:30', '13:31'], ['11:30', '11:30', '13:30', '13:30', '14:00']),
+    (60, ['10:31', '11:30', '13:01', '14:00', '14:01'], ['11:30', '11:30', '14:00', '14:00', '15:00']),
+    (5, ['11:26', '11:30', '13:01', '13:05', '13:06'], ['11:30', '11:30', '13:05', '13:05', '13:10']),
+])
+def test_minute_bar_labels_session_boundaries(minutes, times, expected):
+    assert labels_of(minute_bar_labels, times, minutes) == expected
+
+
+def test_minute_bar_labels_clip_outside_session():
+    # 开盘前并入第一根，15:00之后的盘后交易并入最后一根
+    assert labels_of(minute_bar_labels, ['09:15', '15:00', '15:01', '15:30'], 15) == \
+        ['09:45', '15:00', '15:00', '15:00']
+
+
+@pytest.mark.parametrize("bar_ms, times, expected", [
+    # K线区间左开右闭：09:31:00 属于 09:31 的K线，09:31:03 属于 09:32
+    (60000, ['09:25:00', '09:30:00', '09:30:03', '09:31:00', '09:31:03'],
+     ['09:31:00', '09:31:00', '09:31:00', '09:31:00', '09:32:00']),
+    # 午休期间的快照并入 11:30，13:00 整点属于下午第一根
+    (60000, ['11:29:59', '11:30:00', '11:30:05', '12:59:59', '13:00:00', '13:00:03'],
+     ['11:30:00', '11:30:00', '11:30:00', '11:30:00', '13:01:00', '13:01:00']),
+    (300000, ['11:29:59', '13:00:00', '13:05:00', '13:05:01'], ['11:30:00', '13:05:00', '13:05:00', '13:10:00']),
+    (1000, ['09:30:00.500', '11:30:00', '13:00:00', '13:00:00.500'], ['09:30:01', '11:30:00', '13:00:01', '13:00:01']),
+])
+def test_tick_bar_labels_session_boundaries(bar_ms, times, expected):
+    assert labels_of(tick_bar_labels, times, bar_ms, '%H:%M:%S') == expected
+
+
+def test_tick_bar_labels_clip_after_close():
+    # 15:00 收盘集合竞价及之后的快照并入最后一根
+    assert labels_of(tick_bar_labels, ['14:59:59', '15:00:00', '15:00:03', '15:30:00'], 60000, '%H:%M:%S') == \
+        ['15:00:00', '15:00:00', '15:00:00', '15:00:00']
+
+
+def ticks(rows):
+    """构造分笔数据，每行为(北京时间, 最新价, 累计成交量, 累计成交额)"""
+    return pd.DataFrame({
+        'time': [bj_ms(t) for t, _, _, _ in rows],
+        'lastPrice': [price for _, price, _, _ in rows],
+        'volume': [volume for _, _, volume, _ in rows],
+        'amount': [amount for _, _, _, amount in rows],
+        'lastClose': 9.9,
+    })
+
+
+def test_build_tick_bars_differences_cumulative_volume():
+    tick_df = ticks([
+        ('2024-01-02 09:20:00', 10.5, 0, 0),         # 09:25 之前的虚拟价格不参与开高低收
+        ('2024-01-02 09:25:00', 10.0, 100, 1000),
+        ('2024-01-02 09:30:03', 10.2, 150, 1510),
+        ('2024-01-02 09:30:30', 10.1, 180, 1813),
+        ('2024-01-02 09:31:03', 10.3, 200, 2019),
+        ('2024-01-02 09:31:06', 10.3, 190, 1916),    # 累计值回落，增量记为0
+        ('2024-01-03 09:30:03', 11.0, 50, 550),      # 新交易日第一笔以累计值作为增量
+    ])
+    bars = build_tick_bars(tick_df, '1m_tick')
+
+    assert [(pd.Timestamp(int(t), unit='ms') + pd.Timedelta(hours=8)).strftime('%m%d %H:%M') for t in bars['time']] == \
+        ['0102 09:31', '0102 09:32', '0103 09:31']
+    assert bars['volume'].tolist() == [180, 20, 50]
+    assert bars['amount'].tolist() == [1813, 206, 550]
+    assert bars[['open', 'high', 'low', 'close']].values.tolist() == [
+        [10.0, 10.2, 10.0, 10.1],
+        [10.3, 10.3, 10.3, 10.3],
+        [11.0, 11.0, 11.0, 11.0],
+    ]
+    assert bars['preClose'].tolist() == [9.9, 9.9, 9.9]
+
+
+def test_build_tick_bars_skips_zero_prices():
+    tick_df = ticks([('2024-01-02 09:30:03', 0.0, 0, 0), ('2024-01-02 09:30:06', 0.0, 0, 0)])
+    assert build_tick_bars(tick_df, '1m_tick').empty
+    with pytest.raises(ValueError):
+        build_tick_bars(tick_df, '1m')
@@ -0,0 +1,156 @@
+# coding=utf-8
+"""qmt_bar_store 测试：按时间范围和最后N条读取本地数据，以及CSV的字节定位"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from qmt_bar_store import LocalBarStore
+from qmt_data_store import (MARKET_DB_FILE, SQLiteMarketStore, find_csv_rows_before, read_csv_range_bytes,
+                            read_csv_time_range)
+
+MINUTE_MS = 60000
+BASE_MS = 1704159060000  # 2024-01-02 09:31 北京时间
+
+
+def bars(minutes, closes):
+    """构造分钟线数据，time列为毫秒时间戳"""
+    return pd.DataFrame({'time': [BASE_MS + m * MINUTE_MS for m in minutes], 'close': closes})
+
+
+def write_csv(path, df):
+    """按保存CSV时的格式写入文件"""
+    out = df.copy()
+    out['time'] = pd.to_datetime(out['time'], unit='ms')
+    out.to_csv(path, index=False, encoding='utf-8')
+
+
+def save(save_path, save_format, stock_code, df):
+    """按保存格式写入一只股票的1分钟线"""
+    if save_format == 'csv':
+        write_csv(os.path.join(save_path, f"{stock_code}_1m.csv"), df)
+    else:
+        store = SQLiteMarketStore(os.path.join(save_path, MARKET_DB_FILE))
+        store.write(stock_code, '1m', df)
+        store.close()
+
+
+@pytest.fixture(params=['csv', 'db'])
+def bar_store(request, tmp_path):
+    save(str(tmp_path), request.param, '000001.SZ', bars(range(5), [10.0, 10.1, 10.2, 10.3, 10.4]))
+    save(str(tmp_path), request.param, '600000.SH', bars([1, 3, 5], [7.1, 7.3, 7.5]))
+    store = LocalBarStore(str(tmp_path), request.param)
+    yield store
+    store.close()
+
+
+def test_read_one_all(bar_store):
+    df = bar_store.read_one('000001.SZ', '1m')
+    assert df['time'].tolist() == [BASE_MS + m * MINUTE_MS for m in range(5)]
+    assert df['close'].tolist() == [10.0, 10.1, 10.2, 10.3, 10.4]
+
+
+def test_read_one_start_end_inclusive(bar_store):
+    df = bar_store.read_one('000001.SZ', '1m', start=BASE_MS + MINUTE_MS, end=BASE_MS + 3 * MINUTE_MS)
+    assert df['close'].tolist() == [10.1, 10.2, 10.3]
+
+
+def test_read_one_count(bar_store):
+    assert bar_store.read_one('000001.SZ', '1m', count=2)['close'].tolist() == [10.3, 10.4]
+    # count在时间范围内取最后几条
+    df = bar_store.read_one('000001.SZ', '1m', end=BASE_MS + 2 * MINUTE_MS, count=2)
+    assert df['close'].tolist() == [10.1, 10.2]
+    # 范围内不足count条时返回全部
+    assert len(bar_store.read_one('000001.SZ', '1m', start=BASE_MS + 3 * MINUTE_MS, count=10)) == 2
+
+
+def test_read_one_date_string_bounds(bar_store):
+    assert len(bar_store.read_one('000001.SZ', '1m', start='20240102', end='20240102')) == 5
+    assert bar_store.read_one('000001.SZ', '1m', start='20240103').empty
+
+
+def test_read_one_missing_stock(bar_store):
+    assert bar_store.read_one('000002.SZ', '1m').empty
+
+
+def test_read_one_header_only_csv(tmp_path):
+    write_csv(tmp_path / "000001.SZ_1m.csv", bars([], []))
+    store = LocalBarStore(str(tmp_path), 'csv')
+    assert store.read_one('000001.SZ', '1m').empty
+    assert store.read_one('000001.SZ', '1m', start=BASE_MS, count=3).empty
+    assert store.read(['000001.SZ'], '1m', fields=['close']).columns.tolist() == ['stock_code', 'time', 'close']
+
+
+def test_read_long_table(bar_store):
+    df = bar_store.read(['600000.SH', '000001.SZ'], '1m', count=2)
+    assert df['stock_code'].tolist() == ['600000.SH', '600000.SH', '000001.SZ', '000001.SZ']
+    assert df['close'].tolist() == [7.3, 7.5, 10.3, 10.4]
+
+
+def test_read_panel_aligns_times(bar_store):
+    times, values = bar_store.read_panel(['000001.SZ', '600000.SH'], '1m', start=BASE_MS + 3 * MINUTE_MS,
+                                         fields=['close'])
+    assert times.tolist() == [BASE_MS + m * MINUTE_MS for m in (3, 4, 5)]
+    assert values.shape == (1, 2, 3)
+    np.testing.assert_array_equal(values[0, 0], [10.3, 10.4, np.nan])
+    np.testing.assert_array_equal(values[0, 1], [7.3, np.nan, 7.5])
+
+
+def test_read_panel_count_and_empty(bar_store):
+    times, values = bar_store.read_panel(['000001.SZ', '600000.SH'], '1m', count=1, fields=['close', 'open'])
+    assert times.tolist() == [BASE_MS + 4 * MINUTE_MS, BASE_MS + 5 * MINUTE_MS]
+    np.testing.assert_array_equal(values[0], [[10.4, np.nan], [np.nan, 7.5]])
+    assert np.isnan(values[1]).all()  # 文件中没有的字段为NaN
+
+    times, values = bar_store.read_panel(['000001.SZ'], '1m', start='20240103', fields=['close'])
+    assert times.size == 0
+    assert values.shape == (1, 1, 0)
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "000001.SZ_1m.csv"
+    write_csv(path, bars(range(5), [10.0, 10.1, 10.2, 10.3, 10.4]))
+    return str(path)
+
+
+def line_offsets(path):
+    """每个数据行的行首偏移和文件长度"""
+    with open(path, 'rb') as f:
+        lines = f.read().split(b'\n')[:-1]
+    offsets = [len(lines[0]) + 1]
+    for line in lines[1:]:
+        offsets.append(offsets[-1] + len(line) + 1)
+    return offsets
+
+
+def test_find_csv_rows_before(csv_file):
+    offsets = line_offsets(csv_file)  # 5个数据行的行首及文件长度
+    file_size = offsets[-1]
+    assert find_csv_rows_before(csv_file, file_size, 0) == file_size
+    assert find_csv_rows_before(csv_file, file_size, 1) == offsets[4]
+    assert find_csv_rows_before(csv_file, file_size, 3) == offsets[2]
+    assert find_csv_rows_before(csv_file, offsets[3], 2) == offsets[1]
+    # 不足count行时返回第一条数据行
+    assert find_csv_rows_before(csv_file, file_size, 10) == offsets[0]
+
+
+def test_read_csv_range_bytes(csv_file):
+    header, data_bytes = read_csv_range_bytes(csv_file, BASE_MS + MINUTE_MS, BASE_MS + 2 * MINUTE_MS)
+    assert header == ['time', 'close']
+    assert data_bytes.count(b'\n') == 2
+    assert data_bytes.startswith(b'2024-01-02 01:32:00,')
+
+    _, data_bytes = read_csv_range_bytes(csv_file, count=1)
+    assert data_bytes.startswith(b'2024-01-02 01:35:00,')
+    _, data_bytes = read_csv_range_bytes(csv_file, BASE_MS + 10 * MINUTE_MS)
+    assert data_bytes == b''
+
+
+def test_read_csv_time_range(csv_file):
+    df = read_csv_time_range(csv_file, BASE_MS + MINUTE_MS, None, columns=['close'], count=2)
+    assert df['time'].tolist() == [BASE_MS + 3 * MINUTE_MS, BASE_MS + 4 * MINUTE_MS]
+    assert df['close'].tolist() == [10.3, 10.4]
+    assert read_csv_time_range(csv_file, None, BASE_MS - 1).empty
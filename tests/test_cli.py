@@ -0,0 +1,79 @@
+# coding=utf-8
+"""qmt_cli 测试：批量任务和全推监控在等待期间响应 Ctrl+C，不需要连接QMT"""
+
+import os
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+import qmt_cli
+
+
+class FakeService:
+    """批量任务一直运行到 stop_batch 被调用"""
+
+    def __init__(self, status='完成'):
+        self.status = status
+        self.stop_event = threading.Event()
+        self.logs = []
+        self.thread = None
+
+    def log(self, message):
+        self.logs.append(message)
+
+    def stop_batch(self):
+        self.stop_event.set()
+
+    def run_batch_job(self, job_id, stock_codes, workers):
+        self.thread = threading.current_thread()
+        self.stop_event.wait(5)
+        return {stock_code: (self.status, '') for stock_code in stock_codes}
+
+
+def interrupt_after(delay):
+    threading.Timer(delay, os.kill, args=(os.getpid(), signal.SIGINT)).start()
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="Windows 上 os.kill 不能向自身发送 SIGINT")
+def test_run_job_with_signals_stops_on_interrupt():
+    service = FakeService()
+    interrupt_after(0.1)
+    started = time.monotonic()
+    assert qmt_cli.run_job_with_signals(service, 1, ['000001.SZ'], 1) == 0
+    assert time.monotonic() - started < 2
+    assert service.stop_event.is_set()
+    assert service.thread is not threading.main_thread()
+    assert service.logs == ["收到中断信号，等待正在下载的股票完成"]
+    # 执行完成后恢复原来的信号处理
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
+
+
+def test_run_job_with_signals_reports_failures():
+    service = FakeService(status='错误')
+    service.stop_batch()
+    assert qmt_cli.run_job_with_signals(service, 1, ['000001.SZ'], 1) == 1
+
+
+def test_wait_until_stopped():
+    stop_event = threading.Event()
+    started = time.monotonic()
+    assert qmt_cli.wait_until_stopped(stop_event, 0.2) is False
+    assert 0.15 < time.monotonic() - started < 1
+
+    threading.Timer(0.1, stop_event.set).start()
+    started = time.monotonic()
+    assert qmt_cli.wait_until_stopped(stop_event) is True
+    assert time.monotonic() - started < 1
+
+
+def test_sound_backend_choices_match_public_backends():
+    from qmt_monitor import SOUND_BACKENDS
+
+    parser = qmt_cli.build_parser()
+    for name in ['auto'] + list(SOUND_BACKENDS):
+        assert parser.parse_args(['monitor', '--sound-backend', name]).sound_backend == name
+    with pytest.raises(SystemExit):
+        parser.parse_args(['monitor', '--sound-backend', 'record'])
@@ -0,0 +1,88 @@
+# coding=utf-8
+"""qmt_columnar_store 测试：分区键、时间转换和分区文件的读写"""
+
+import pandas as pd
+import pytest
+
+from qmt_columnar_store import ColumnarStore, expand_list_columns, partition_key_of_day, time_str_to_ms
+
+pytest.importorskip('pyarrow')
+
+DAY_MS = 24 * 3600 * 1000
+JAN31_MS = 1706664600000  # 2024-01-31 09:30 北京时间（01:30 UTC）
+
+
+def day_number(date_str):
+    return (pd.Timestamp(date_str) - pd.Timestamp('1970-01-01')).days
+
+
+def test_partition_key_of_day():
+    assert partition_key_of_day(day_number('2024-01-31'), 'tick') == '20240131'
+    assert partition_key_of_day(day_number('2024-01-31'), '1m') == '202401'
+    assert partition_key_of_day(day_number('2024-01-31'), '5m') == '202401'
+    assert partition_key_of_day(day_number('2024-01-31'), '1d') == '2024'
+
+
+def test_time_str_to_ms_uses_beijing_time():
+    # 北京时间 2024-01-31 00:00 即 UTC 2024-01-30 16:00
+    assert time_str_to_ms('20240131') == 1706630400000
+    assert time_str_to_ms('20240131', end=True) == 1706630400000 + DAY_MS - 1
+    assert time_str_to_ms('20240131093000') == JAN31_MS
+    assert time_str_to_ms(20240131) == 1706630400000
+
+
+def test_expand_list_columns():
+    df = pd.DataFrame({'time': [1, 2], 'askPrice': [[1.0, 2.0], [3.0]], 'volume': [5, 6]})
+    out = expand_list_columns(df)
+    assert list(out.columns) == ['time', 'askPrice1', 'askPrice2', 'volume']
+    assert out['askPrice2'].isna().tolist() == [False, True]
+
+
+def bars(times, close=10.0):
+    return pd.DataFrame({'time': times, 'close': [close + i for i in range(len(times))],
+                         'volume': [100] * len(times)})
+
+
+@pytest.mark.parametrize("file_format", ['parquet', 'feather'])
+def test_write_read_round_trip(tmp_path, file_format):
+    store = ColumnarStore(str(tmp_path), file_format)
+    # 北京时间1月31日和2月1日的分钟线分别落在两个月分区
+    times = [JAN31_MS, JAN31_MS + 60000, JAN31_MS + DAY_MS]
+    assert store.write('000001.SZ', '1m', bars(times)) == 3
+    assert [key for key, _ in store.partitions('000001.SZ', '1m')] == ['202401', '202402']
+
+    df = store.read('000001.SZ', '1m')
+    assert df['time'].tolist() == times
+    assert df['time'].dtype == 'int64'
+    assert store.read('000001.SZ', '1m', columns=['close']).columns.tolist() == ['time', 'close']
+    assert store.read('000001.SZ', '1m', start_time='20240201')['time'].tolist() == [JAN31_MS + DAY_MS]
+    assert store.last_time('000001.SZ', '1m') == JAN31_MS + DAY_MS
+
+    # 重叠的时间以新数据为准
+    store.write('000001.SZ', '1m', bars([JAN31_MS + 60000, JAN31_MS + 120000], close=20.0))
+    df = store.read('000001.SZ', '1m')
+    assert df['time'].tolist() == [JAN31_MS, JAN31_MS + 60000, JAN31_MS + 120000, JAN31_MS + DAY_MS]
+    assert df['close'].tolist() == [10.0, 20.0, 21.0, 12.0]
+
+
+@pytest.mark.parametrize("file_format", ['parquet', 'feather'])
+def test_read_columns_missing_from_partition(tmp_path, file_format):
+    store = ColumnarStore(str(tmp_path), file_format)
+    store.write('000001.SZ', '1m', bars([JAN31_MS]))
+    # 后写入的分区多出一列，早期分区中没有该列
+    store.write('000001.SZ', '1m', bars([JAN31_MS + DAY_MS]).assign(openInterest=5))
+
+    df = store.read('000001.SZ', '1m', columns=['openInterest', 'close'])
+    assert df.columns.tolist() == ['time', 'openInterest', 'close']
+    assert df['close'].tolist() == [10.0, 10.0]
+    assert pd.isna(df['openInterest'].iloc[0])
+    assert df['openInterest'].iloc[1] == 5
+    assert store.read('000001.SZ', '1m', columns=['unknown'], count=1)['unknown'].isna().all()
+
+
+def test_empty_store(tmp_path):
+    store = ColumnarStore(str(tmp_path))
+    assert store.read('000001.SZ', '1d').empty
+    assert store.last_time('000001.SZ', '1d') is None
+    with pytest.raises(ValueError):
+        ColumnarStore(str(tmp_path), 'orc')
@@ -0,0 +1,108 @@
+# coding=utf-8
+"""qmt_core 测试：增量下载起点、批量任务的合并分组、停止和服务关闭，以及可选存储模块的延迟导入，不需要连接QMT"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from qmt_core import QMTDataService
+from qmt_job_journal import JobJournal, STATE_DONE, STATE_PENDING
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = QMTDataService(log_callback=lambda message: None,
+                             journal_path=str(tmp_path / "jobs.db"), calendar_path=str(tmp_path / "calendar.json"))
+    service.prepare_trading_calendar = lambda end_date: None
+    return service
+
+
+def test_close_waits_for_running_batch(service, tmp_path):
+    job_id = service.create_job(['000001.SZ', '000002.SZ'], '1d', '20240101', '20240131', 'csv', str(tmp_path),
+                                bulk_mode=False)
+    started = threading.Event()
+    finished = []
+
+    def download_stock_data(stock_code, *args, **kwargs):
+        started.set()
+        time.sleep(0.2)
+        finished.append(stock_code)
+        return '完成', f"{stock_code} 下载完成"
+
+    service.download_stock_data = download_stock_data
+    batch = threading.Thread(target=service.run_batch_job, args=(job_id, ['000001.SZ', '000002.SZ'], 1))
+    batch.start()
+    assert started.wait(2)
+
+    service.close(timeout=5)
+    # 正在下载的股票完成并写入任务日志后才关闭，之后的股票不再开始
+    assert finished == ['000001.SZ']
+    batch.join(timeout=2)
+    assert not batch.is_alive()
+    with pytest.raises(sqlite3.ProgrammingError):
+        service.job_journal.get_job(job_id)
+
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    assert journal.codes_in_state(job_id, (STATE_DONE,)) == ['000001.SZ']
+    assert journal.codes_in_state(job_id, (STATE_PENDING,)) == ['000002.SZ']
+    journal.close()
+
+
+def test_close_without_batch_returns_immediately(service):
+    started = time.monotonic()
+    service.close(timeout=5)
+    assert time.monotonic() - started < 1
+
+
+def test_import_does_not_load_optional_backends():
+    # 列式、二进制存储和K线合成在使用时才导入
+    code = ("import sys, qmt_core; "
+            "print(','.join(m for m in ('qmt_tick_store', 'qmt_bar_store', 'qmt_bar_builder') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == ''
+
+
+def bj_ms(time_str):
+    """北京时间字符串对应的毫秒时间戳"""
+    return int((pd.Timestamp(time_str) - pd.Timedelta(hours=8) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1))
+
+
+@pytest.mark.parametrize('data_type, last_time, expected', [
+    ('1m', '2024-01-02 10:31:00', '20240102103200'),
+    ('5m', '2024-01-02 10:35:00', '20240102104000'),
+    ('tick', '2024-01-02 10:31:05', '20240102103106'),
+    ('tick', '2024-01-02 10:31:05.500', '20240102103106'),
+    ('1m', '2024-01-02 15:00:00', '20240103'),
+    ('1d', '2024-01-02 00:00:00', '20240103'),
+])
+def test_incremental_start_time_skips_last_record(service, data_type, last_time, expected):
+    assert service.incremental_start_time(bj_ms(last_time), data_type, '20240131') == expected
+
+
+def test_incremental_start_time_up_to_date(service):
+    assert service.incremental_start_time(bj_ms('2024-01-31 15:00:00'), '1m', '20240131') is None
+
+
+def test_bulk_job_groups_by_exact_start(service, tmp_path):
+    stock_codes = ['000001.SZ', '000002.SZ', '600000.SH', '600001.SH']
+    starts = {'000001.SZ': '20240102103200', '000002.SZ': '20240102103200', '600000.SH': '20240102100100',
+              '600001.SH': '20240101'}
+    job_id = service.create_job(stock_codes, '1m', '20240101', '20240131', 'csv', str(tmp_path))
+    service.check_existing_data = lambda stock_code, *args: (starts[stock_code], '20240131')
+    requests = []
+
+    def download_kline_bulk(codes, data_type, start_date, end_date, save_format, save_path):
+        requests.append((tuple(codes), start_date))
+        return {stock_code: ('完成', '') for stock_code in codes}
+
+    service.download_kline_bulk = download_kline_bulk
+    service.run_batch_job(job_id, stock_codes, max_workers=1)
+    assert sorted(requests) == [(('000001.SZ', '000002.SZ'), '20240102103200'), (('600000.SH',), '20240102100100'),
+                                (('600001.SH',), '20240101')]
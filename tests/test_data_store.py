@@ -0,0 +1,152 @@
+# coding=utf-8
+"""qmt_data_store 测试：CSV文件末尾的合并写入和按时间定位，以及行情库对旧版本数据表的迁移"""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from qmt_data_store import (MARKET_DB_FILE, JsonStreamWriter, SQLiteMarketStore, find_csv_time_offset, parse_time_ms,
+                            upsert_csv_tail)
+
+MINUTE_MS = 60000
+BASE_MS = 1704159060000  # 2024-01-02 09:31 北京时间
+
+
+def bars(minutes, closes):
+    """构造分钟线数据，time列为毫秒时间戳"""
+    return pd.DataFrame({'time': [BASE_MS + m * MINUTE_MS for m in minutes], 'close': closes})
+
+
+def write_csv(path, df):
+    """按保存CSV时的格式写入文件"""
+    out = df.copy()
+    out['time'] = pd.to_datetime(out['time'], unit='ms')
+    out.to_csv(path, index=False, encoding='utf-8')
+
+
+def read_csv(path):
+    df = pd.read_csv(path)
+    df['time'] = df['time'].map(parse_time_ms)
+    return df
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "000001.SZ_1m.csv"
+    write_csv(path, bars([0, 1, 2], [10.0, 10.1, 10.2]))
+    return str(path)
+
+
+def test_upsert_csv_tail_without_overlap(csv_file):
+    assert upsert_csv_tail(csv_file, bars([3, 4], [10.3, 10.4])) == (0, 2)
+
+    df = read_csv(csv_file)
+    assert df['time'].tolist() == [BASE_MS + m * MINUTE_MS for m in range(5)]
+    assert df['close'].tolist() == [10.0, 10.1, 10.2, 10.3, 10.4]
+
+
+def test_upsert_csv_tail_overwrites_overlap(csv_file):
+    # 新数据从最后一根开始，最后一根被新值覆盖，不产生重复行
+    assert upsert_csv_tail(csv_file, bars([2, 3], [10.25, 10.3])) == (1, 2)
+
+    df = read_csv(csv_file)
+    assert df['time'].is_unique
+    assert df['close'].tolist() == [10.0, 10.1, 10.25, 10.3]
+
+
+def test_upsert_csv_tail_merges_interleaved_rows(csv_file):
+    # 新数据的开始时间早于文件末尾：重叠部分重新排序，文件前面的数据不变
+    upsert_csv_tail(csv_file, bars([4, 1], [10.4, 10.15]))
+
+    df = read_csv(csv_file)
+    assert df['time'].tolist() == [BASE_MS + m * MINUTE_MS for m in (0, 1, 2, 4)]
+    assert df['close'].tolist() == [10.0, 10.15, 10.2, 10.4]
+
+
+def test_upsert_csv_tail_rejects_other_columns(csv_file):
+    with pytest.raises(ValueError):
+        upsert_csv_tail(csv_file, bars([3], [10.3]).assign(volume=1))
+
+
+def row_offsets(path):
+    """每个数据行行首的字节偏移，以及文件长度"""
+    with open(path, 'rb') as f:
+        f.readline()
+        offsets = [f.tell()]
+        while f.readline():
+            offsets.append(f.tell())
+    return offsets
+
+
+def test_find_csv_time_offset(tmp_path):
+    path = str(tmp_path / "000001.SZ_1m.csv")
+    minutes = list(range(0, 600, 3))
+    write_csv(path, bars(minutes, [10.0] * len(minutes)))
+    offsets = row_offsets(path)
+
+    # 恰好命中某一行，以及落在两行之间时返回下一行
+    for index in (0, 1, 57, len(minutes) - 1):
+        assert find_csv_time_offset(path, BASE_MS + minutes[index] * MINUTE_MS) == offsets[index]
+        assert find_csv_time_offset(path, BASE_MS + minutes[index] * MINUTE_MS - 1) == offsets[index]
+        assert find_csv_time_offset(path, BASE_MS + minutes[index] * MINUTE_MS + 1) == offsets[index + 1]
+
+    # 早于全部数据时返回第一行，晚于全部数据时返回文件长度
+    assert find_csv_time_offset(path, 0) == offsets[0]
+    assert find_csv_time_offset(path, BASE_MS + 10 ** 9) == offsets[-1]
+
+
+def test_find_csv_time_offset_header_only(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text("time,close\n", encoding='utf-8')
+    assert find_csv_time_offset(str(path), BASE_MS) == len("time,close\n")
+
+
+def legacy_frame(minutes, closes, stock_code):
+    """按旧版本写入数据库时的格式构造数据：time列为时间，附加stock_code列"""
+    df = bars(minutes, closes)
+    df['time'] = pd.to_datetime(df['time'], unit='ms')
+    df['stock_code'] = stock_code
+    return df
+
+
+def test_sqlite_store_migrates_legacy_tables(tmp_path):
+    db_path = str(tmp_path / MARKET_DB_FILE)
+    conn = sqlite3.connect(db_path)
+    # 旧版本按周期分表追加写入，重复下载会产生重复记录
+    legacy_frame([0, 1], [10.0, 10.1], '000001.SZ').to_sql('data_1m', conn, if_exists='append', index=False)
+    legacy_frame([1, 2], [10.1, 10.2], '000001.SZ').to_sql('data_1m', conn, if_exists='append', index=False)
+    legacy_frame([0], [7.0], '600000.SH').to_sql('data_1m', conn, if_exists='append', index=False)
+    ticks = legacy_frame([0], [10.0], '000001.SZ').rename(columns={'close': 'lastPrice'})
+    ticks.to_sql('tick_data', conn, index=False)
+    conn.close()
+
+    store = SQLiteMarketStore(db_path)
+    df = store.read('000001.SZ', '1m')
+    assert df.columns.tolist() == ['time', 'close']
+    assert df['time'].tolist() == [BASE_MS + m * MINUTE_MS for m in range(3)]
+    assert df['close'].tolist() == [10.0, 10.1, 10.2]
+    assert store.last_time('600000.SH', '1m') == BASE_MS
+    assert store.read('000001.SZ', 'tick').columns.tolist() == ['time', 'lastPrice']
+    store.close()
+
+    # 旧表改名保留，再次打开时不会重复迁移
+    store = SQLiteMarketStore(db_path)
+    tables = {row[0] for row in store.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert {'legacy_data_1m', 'legacy_tick_data'} <= tables
+    assert 'data_1m' not in tables
+    assert len(store.read('000001.SZ', '1m')) == 3
+    store.close()
+
+
+def test_json_time_is_labelled_beijing_time(tmp_path):
+    path = tmp_path / "000001.SZ_1m.jsonl"
+    writer = JsonStreamWriter(str(path))
+    writer.write(bars([0, 1], [10.0, 10.1]))
+    writer.close()
+
+    records = pd.read_json(path, lines=True, convert_dates=False)
+    assert records['time'].tolist() == ['2024-01-02 09:31:00.000+08:00', '2024-01-02 09:32:00.000+08:00']
+    # 与CSV中不带时区的UTC时间解析为同一时间戳
+    assert [parse_time_ms(value) for value in records['time']] == [BASE_MS, BASE_MS + MINUTE_MS]
+    assert parse_time_ms('2024-01-02 01:31:00') == BASE_MS
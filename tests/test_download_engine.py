@@ -0,0 +1,55 @@
+# coding=utf-8
+"""qmt_download_engine 测试：只测试不访问QMT的数据拆分逻辑"""
+
+import numpy as np
+import pandas as pd
+
+from qmt_download_engine import split_market_data
+
+CODES = ['000001.SZ', '600000.SH', '688999.SH']
+TIMES = ['20240102', '20240103', '20240104']
+TIME_MS = [1704124800000, 1704211200000, 1704297600000]
+
+
+def market_frame(values):
+    """构造 get_market_data 返回的单个字段：行是股票、列是时间"""
+    return pd.DataFrame(values, index=CODES, columns=TIMES)
+
+
+def sample_market_data():
+    nan = np.nan
+    return {
+        'time': market_frame([TIME_MS] * len(CODES)),
+        'close': market_frame([[10.0, 10.5, 11.0], [nan, 7.1, 7.2], [nan, nan, nan]]),
+        'volume': market_frame([[100, 200, 300], [nan, 50, 60], [nan, nan, nan]]),
+    }
+
+
+def test_split_market_data_per_code():
+    result = split_market_data(sample_market_data(), ['time', 'close', 'volume'])
+
+    assert list(result) == ['000001.SZ', '600000.SH']
+    first = result['000001.SZ']
+    assert list(first.columns) == ['time', 'close', 'volume']
+    assert first['time'].tolist() == TIME_MS
+    assert first['close'].tolist() == [10.0, 10.5, 11.0]
+    assert first['time'].dtype == np.int64
+
+
+def test_split_market_data_drops_rows_without_values():
+    result = split_market_data(sample_market_data(), ['time', 'close', 'volume'])
+
+    # 上市前没有数据的时间点被去掉，整段都没有数据的股票不出现在结果中
+    second = result['600000.SH']
+    assert second['time'].tolist() == TIME_MS[1:]
+    assert second['close'].tolist() == [7.1, 7.2]
+    assert '688999.SH' not in result
+
+
+def test_split_market_data_ignores_missing_fields():
+    result = split_market_data(sample_market_data(), ['time', 'close', 'amount'])
+    assert list(result['000001.SZ'].columns) == ['time', 'close']
+
+    assert split_market_data({}, ['time', 'close']) == {}
+    empty = {'time': pd.DataFrame(index=CODES, columns=[])}
+    assert split_market_data(empty, ['time', 'close']) == {}
@@ -0,0 +1,193 @@
+# coding=utf-8
+"""获取qmt实时和历史行情数据 测试：历史行情缓存的命中、补齐、复权变化和盘中数据刷新"""
+
+import importlib
+import importlib.util
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+from qmt_trading_calendar import session_close_ms
+
+DATES = [day.strftime('%Y%m%d') for day in pd.bdate_range('2024-01-02', '2024-01-31')]
+
+
+def day_ms(date_str):
+    """日线的时间：当天北京时间0点的毫秒时间戳"""
+    return int((pd.Timestamp(date_str) - pd.Timedelta(hours=8) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1))
+
+
+class FakeServer:
+    """模拟QMT的历史日线，记录每次获取的参数"""
+
+    def __init__(self):
+        self.closes = {date: 10.0 + index * 0.1 for index, date in enumerate(DATES)}
+        self.calls = []
+        self.empty = False
+        self.ex_dates = ['20230615']  # 除权除息日，为None时获取除权数据失败
+
+    def fetch(self, stock_code, period, start_time, end_time, dividend_type):
+        self.calls.append((start_time, end_time))
+        dates = [] if self.empty else [date for date in DATES if start_time <= date <= end_time]
+        return pd.DataFrame({'time': [day_ms(date) for date in dates],
+                             'close': [self.closes[date] for date in dates]}, columns=['time', 'close'])
+
+    def get_divid_factors(self, stock_code):
+        if self.ex_dates is None:
+            raise RuntimeError("除权数据不可用")
+        return pd.DataFrame({'time': [day_ms(date) for date in self.ex_dates], 'dr': [1.0] * len(self.ex_dates)},
+                            index=self.ex_dates)
+
+
+@pytest.fixture(scope='module')
+def history_module():
+    with pytest.MonkeyPatch.context() as patch:
+        if importlib.util.find_spec('xtquant') is None:
+            xtquant = types.ModuleType('xtquant')
+            xtquant.xtdata = types.SimpleNamespace()
+            patch.setitem(sys.modules, 'xtquant', xtquant)
+        yield importlib.import_module('获取qmt实时和历史行情数据')
+
+
+@pytest.fixture
+def history(history_module, tmp_path, monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(history_module, 'HISTORY_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(history_module, '_fetch_history', server.fetch)
+    monkeypatch.setattr(history_module, 'xtdata', types.SimpleNamespace(get_divid_factors=server.get_divid_factors))
+    history_module.clear_history_cache(memory_only=True)
+    yield history_module, server
+    history_module.clear_history_cache(memory_only=True)
+
+
+def get(module, start_time, end_time, dividend_type='none', stock_code='000001.SZ'):
+    return module._get_cached_history(stock_code, '1d', start_time, end_time, dividend_type, '20240201')
+
+
+def test_cached_range_is_not_fetched_again(history):
+    module, server = history
+    df = get(module, '20240105', '20240115')
+    assert df['time'].tolist() == [day_ms(date) for date in DATES if '20240105' <= date <= '20240115']
+    assert server.calls == [('20240105', '20240115')]
+
+    assert get(module, '20240108', '20240112')['time'].tolist() == [day_ms(date) for date in
+                                                                     ('20240108', '20240109', '20240110',
+                                                                      '20240111', '20240112')]
+    assert len(server.calls) == 1
+
+
+def test_missing_head_and_tail_are_fetched_with_overlap(history):
+    module, server = history
+    get(module, '20240108', '20240112')
+
+    df = get(module, '20240108', '20240119')
+    assert server.calls[-1] == ('20240112', '20240119')
+    assert df['time'].is_unique
+    assert len(df) == 10
+
+    df = get(module, '20240102', '20240119')
+    assert server.calls[-1] == ('20240102', '20240108')
+    assert df['time'].tolist() == [day_ms(date) for date in DATES if date <= '20240119']
+
+
+def test_disk_cache_is_used_after_memory_is_cleared(history):
+    module, server = history
+    get(module, '20240105', '20240115')
+    module.clear_history_cache(memory_only=True)
+
+    assert len(get(module, '20240105', '20240115')) == 7
+    assert len(server.calls) == 1
+
+    module.clear_history_cache()
+    get(module, '20240105', '20240115')
+    assert len(server.calls) == 2
+
+
+def test_lru_evicts_least_recently_used(history, monkeypatch):
+    module, server = history
+    monkeypatch.setattr(module, 'HISTORY_CACHE_SIZE', 2)
+    for stock_code in ('000001.SZ', '000002.SZ', '000001.SZ', '600000.SH'):
+        get(module, '20240105', '20240115', stock_code=stock_code)
+    assert list(module._history_cache) == [('000001.SZ', '1d', 'none'), ('600000.SH', '1d', 'none')]
+
+
+def test_empty_result_is_not_cached(history):
+    module, server = history
+    server.empty = True
+    assert get(module, '20240105', '20240115').empty
+    server.empty = False
+    assert len(get(module, '20240105', '20240115')) == 7
+    assert len(server.calls) == 2
+
+
+def test_adjustment_change_refetches_everything(history):
+    module, server = history
+    get(module, '20240105', '20240115', dividend_type='front')
+    # 除权后前复权价格整体变化
+    server.closes = {date: close * 0.9 for date, close in server.closes.items()}
+
+    df = get(module, '20240105', '20240119', dividend_type='front')
+    assert server.calls[-2:] == [('20240115', '20240119'), ('20240105', '20240119')]
+    assert df['close'].tolist() == pytest.approx([server.closes[date] for date in DATES
+                                                  if '20240105' <= date <= '20240119'])
+
+
+def test_new_ex_date_invalidates_covered_range(history):
+    module, server = history
+    get(module, '20240105', '20240119', dividend_type='front')
+    assert len(get(module, '20240108', '20240112', dividend_type='front')) == 5
+    assert len(server.calls) == 1
+
+    # 请求的范围已被缓存覆盖，新的除权除息日仍然使缓存失效
+    server.ex_dates.append('20240122')
+    server.closes = {date: close * 0.9 for date, close in server.closes.items()}
+    df = get(module, '20240108', '20240112', dividend_type='front')
+    assert server.calls[-1] == ('20240108', '20240112')
+    assert df['close'].tolist() == pytest.approx([server.closes[date] for date in DATES
+                                                  if '20240108' <= date <= '20240112'])
+    assert module._history_cache[('000001.SZ', '1d', 'front')]['ex_date'] == '20240122'
+
+
+def test_adjusted_data_is_not_cached_without_ex_dates(history):
+    module, server = history
+    server.ex_dates = None
+    get(module, '20240105', '20240115', dividend_type='front')
+    get(module, '20240105', '20240115', dividend_type='front')
+    assert len(server.calls) == 2
+    assert not module._history_cache
+
+    # 不复权数据不需要除权数据
+    get(module, '20240105', '20240115')
+    get(module, '20240105', '20240115')
+    assert len(server.calls) == 3
+
+
+def test_unadjusted_tail_is_merged_without_refetch(history):
+    module, server = history
+    get(module, '20240105', '20240115')
+    server.closes['20240115'] = 99.0  # 不复权时重叠部分以新数据为准
+
+    df = get(module, '20240105', '20240119')
+    assert server.calls[-1] == ('20240115', '20240119')
+    assert df.loc[df['time'] == day_ms('20240115'), 'close'].tolist() == [99.0]
+
+
+def test_intraday_tail_is_refreshed_after_ttl(history):
+    module, server = history
+    get(module, '20240105', '20240115')
+    key = ('000001.SZ', '1d', 'none')
+
+    # 缓存在收盘后获取时不会过期
+    module._history_cache[key]['fetched_at'] = session_close_ms('20240115') / 1000 + 60
+    get(module, '20240105', '20240115')
+    assert len(server.calls) == 1
+
+    # 缓存在收盘前获取，超过有效期后重新获取最后一天
+    module._history_cache[key]['fetched_at'] = session_close_ms('20240115') / 1000 - 3600
+    server.closes['20240115'] = 99.0
+    df = get(module, '20240105', '20240115')
+    assert server.calls[-1] == ('20240115', '20240115')
+    assert df['close'].iloc[-1] == 99.0
+    assert module._history_cache[key]['fetched_at'] > session_close_ms('20240115') / 1000
@@ -0,0 +1,87 @@
+# coding=utf-8
+"""qmt_job_journal 测试：批量任务的继续和重试状态"""
+
+import pytest
+
+from qmt_job_journal import (JOB_FINISHED, JOB_RUNNING, JOB_STOPPED, JobJournal, STATE_DONE, STATE_EMPTY,
+                             STATE_FAILED, STATE_PENDING, STATE_RUNNING)
+
+PARAMS = {'data_type': '1d', 'start_date': '20240101', 'end_date': '20240131', 'save_format': 'csv',
+          'save_path': 'data', 'bulk_mode': True}
+CODES = ['000001.SZ', '600000.SH', '300750.SZ', '688981.SH']
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / "download_jobs.db"))
+    yield journal
+    journal.close()
+
+
+def test_create_job_starts_pending(journal):
+    job_id = journal.create_job(PARAMS, CODES)
+
+    job = journal.get_job(job_id)
+    assert job['status'] == JOB_RUNNING
+    assert job['bulk_mode'] is True
+    assert {key: job[key] for key in PARAMS} == PARAMS
+    assert journal.items(job_id) == [(code, STATE_PENDING) for code in CODES]
+    assert journal.codes_in_state(job_id, (STATE_PENDING,)) == CODES
+
+
+def test_running_and_results(journal):
+    job_id = journal.create_job(PARAMS, CODES)
+    journal.mark_running(job_id, CODES[:3])
+    journal.mark_result(job_id, CODES[0], STATE_DONE, "完成", range_start='20240115')
+    journal.mark_result(job_id, CODES[1], STATE_EMPTY, "无数据")
+
+    assert journal.items(job_id) == [(CODES[0], STATE_DONE), (CODES[1], STATE_EMPTY),
+                                     (CODES[2], STATE_RUNNING), (CODES[3], STATE_PENDING)]
+    assert journal.counts(job_id) == {STATE_DONE: 1, STATE_EMPTY: 1, STATE_RUNNING: 1, STATE_PENDING: 1}
+    # 未完成的股票按原始顺序排列
+    assert journal.codes_in_state(job_id, (STATE_PENDING, STATE_RUNNING)) == CODES[2:]
+
+
+def test_resume_interrupted_job(tmp_path):
+    path = str(tmp_path / "download_jobs.db")
+    journal = JobJournal(path)
+    job_id = journal.create_job(PARAMS, CODES)
+    journal.mark_running(job_id, CODES[:2])
+    journal.mark_result(job_id, CODES[0], STATE_DONE, "完成")
+    journal.close()
+
+    # 程序退出后重新打开，下载中的股票重新置为等待下载
+    journal = JobJournal(path)
+    try:
+        job = journal.latest_job(unfinished_only=True)
+        assert job['job_id'] == job_id
+        assert journal.reset_states(job_id, (STATE_RUNNING,)) == 1
+        assert journal.codes_in_state(job_id, (STATE_PENDING,)) == CODES[1:]
+    finally:
+        journal.close()
+
+
+def test_retry_failed_codes(journal):
+    job_id = journal.create_job(PARAMS, CODES)
+    journal.mark_running(job_id, CODES)
+    for code in CODES:
+        state = STATE_FAILED if code in (CODES[1], CODES[3]) else STATE_DONE
+        journal.mark_result(job_id, code, state, "错误" if state == STATE_FAILED else "完成")
+    journal.set_job_status(job_id, JOB_FINISHED)
+
+    assert journal.latest_job(unfinished_only=True) is None
+    assert journal.latest_job()['job_id'] == job_id
+    assert journal.codes_in_state(job_id, (STATE_FAILED,)) == [CODES[1], CODES[3]]
+    assert journal.reset_states(job_id, (STATE_FAILED,)) == 2
+    assert journal.codes_in_state(job_id, (STATE_PENDING,)) == [CODES[1], CODES[3]]
+
+
+def test_latest_unfinished_job(journal):
+    first = journal.create_job(PARAMS, CODES[:1])
+    journal.set_job_status(first, JOB_STOPPED)
+    second = journal.create_job(PARAMS, CODES[1:])
+    journal.set_job_status(second, JOB_FINISHED)
+
+    assert journal.latest_job()['job_id'] == second
+    assert journal.latest_job(unfinished_only=True)['job_id'] == first
+    assert journal.get_job(second + 1) is None
@@ -0,0 +1,137 @@
+# coding=utf-8
+"""qmt_monitor 测试：预警状态机和预警声音线程，不需要订阅行情"""
+
+import time
+
+import pytest
+
+from qmt_monitor import (AlertSoundWorker, BellBackend, MonitorUniverse, NullBackend, RecordingBackend,
+                         create_sound_backend)
+
+
+def wait_for(condition, timeout=2.0):
+    """等待后台线程满足条件"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.005)
+
+
+def step(universe, prices, now):
+    """写入一批最新价（昨收价均为10）并判断预警，返回(涨幅预警代码, 跌幅预警代码)"""
+    slots = universe.update({code: {'lastPrice': price, 'lastClose': 10.0} for code, price in prices.items()})
+    rise_slots, fall_slots, _ = universe.evaluate(slots, now=now)
+    return [universe.codes[slot] for slot in rise_slots], [universe.codes[slot] for slot in fall_slots]
+
+
+def test_alert_fires_once_until_rearmed_below_hysteresis():
+    universe = MonitorUniverse(['000001.SZ'], 0.05, 0.05, hysteresis=0.005, cooldown=0)
+
+    assert step(universe, {'000001.SZ': 10.6}, 1) == (['000001.SZ'], [])
+    assert step(universe, {'000001.SZ': 10.7}, 2) == ([], [])
+    # 回落到阈值以内但未超过回差，不重新布防
+    assert step(universe, {'000001.SZ': 10.46}, 3) == ([], [])
+    assert step(universe, {'000001.SZ': 10.6}, 4) == ([], [])
+    # 回落超过回差后重新布防，再次越过阈值时预警
+    assert step(universe, {'000001.SZ': 10.44}, 5) == ([], [])
+    assert step(universe, {'000001.SZ': 10.6}, 6) == (['000001.SZ'], [])
+
+
+def test_fall_alert_and_direction_change():
+    universe = MonitorUniverse(['600000.SH'], 0.05, 0.05, hysteresis=0.005, cooldown=0)
+
+    assert step(universe, {'600000.SH': 9.4}, 1) == ([], ['600000.SH'])
+    assert step(universe, {'600000.SH': 9.54}, 2) == ([], [])
+    assert step(universe, {'600000.SH': 9.4}, 3) == ([], [])
+    # 直接从跌幅预警翻转到涨幅预警
+    assert step(universe, {'600000.SH': 10.6}, 4) == (['600000.SH'], [])
+    assert step(universe, {'600000.SH': 9.4}, 5) == ([], ['600000.SH'])
+
+
+def test_cooldown_defers_repeat_alert():
+    universe = MonitorUniverse(['000001.SZ', '300750.SZ'], 0.05, 0.05, hysteresis=0.005, cooldown=60)
+
+    assert step(universe, {'000001.SZ': 10.6}, 0) == (['000001.SZ'], [])
+    assert step(universe, {'000001.SZ': 10.0}, 10) == ([], [])
+    # 已重新布防，但仍在冷却时间内
+    assert step(universe, {'000001.SZ': 10.6, '300750.SZ': 10.6}, 20) == (['300750.SZ'], [])
+    # 冷却结束时仍在阈值之外，补发预警
+    assert step(universe, {'000001.SZ': 10.6}, 60) == (['000001.SZ'], [])
+
+
+def test_invalid_snapshots_are_ignored():
+    universe = MonitorUniverse(['000001.SZ'], 0.05, 0.05, cooldown=0)
+
+    slots = universe.update({'000001.SZ': {'lastPrice': 11.0, 'lastClose': 0}, '999999.SH': {'lastPrice': 1.0}})
+    rise_slots, fall_slots, _ = universe.evaluate(slots, now=1)
+    assert len(rise_slots) == 0 and len(fall_slots) == 0
+
+
+def test_rearm_clears_state_and_cooldown():
+    universe = MonitorUniverse(['000001.SZ'], 0.05, 0.05, cooldown=60)
+
+    assert step(universe, {'000001.SZ': 10.6}, 0) == (['000001.SZ'], [])
+    universe.rearm()
+    assert step(universe, {'000001.SZ': 10.6}, 1) == (['000001.SZ'], [])
+
+
+def burst(worker, count=200):
+    for _ in range(count):
+        worker.notify("rise", "警报声")
+        worker.notify("fall", "警报声")
+
+
+def test_sound_worker_coalesces_bursts():
+    backend = RecordingBackend()
+    worker = AlertSoundWorker(backend, min_interval=0.3)
+    try:
+        # 第一批：每种类型立即播放一次
+        burst(worker)
+        wait_for(lambda: len(backend.played) >= 2)
+        # 间隔内的第二批挂起，间隔结束后每种类型只播放一次
+        burst(worker)
+        wait_for(lambda: len(backend.played) >= 4)
+        time.sleep(0.4)
+    finally:
+        worker.stop()
+
+    assert sorted(alert_type for _, alert_type, _ in backend.played) == ["fall", "fall", "rise", "rise"]
+    assert worker.played == 4
+    assert all(sound_type == "警报声" for _, _, sound_type in backend.played)
+    rise_times = [played_at for played_at, alert_type, _ in backend.played if alert_type == "rise"]
+    assert rise_times[1] - rise_times[0] >= 0.3 - 0.01
+
+
+def test_sound_worker_logs_unsupported_backend_once():
+    messages = []
+    worker = AlertSoundWorker(NullBackend(), min_interval=0, log_callback=messages.append)
+    try:
+        worker.notify("rise")
+        wait_for(lambda: worker.events >= 1)
+        worker.notify("fall")
+        wait_for(lambda: worker.events >= 2)
+        time.sleep(0.05)
+    finally:
+        worker.stop()
+    assert messages == ["当前系统不支持播放预警声音"]
+    assert worker.played == 0
+
+
+def test_sound_worker_ignores_events_after_stop():
+    backend = RecordingBackend()
+    worker = AlertSoundWorker(backend)
+    worker.stop()
+    worker.notify("rise")
+    assert worker.thread is None
+    assert backend.played == []
+
+
+def test_create_sound_backend():
+    assert isinstance(create_sound_backend("bell"), BellBackend)
+    assert isinstance(create_sound_backend("none"), NullBackend)
+    assert create_sound_backend("auto").name in ("winsound", "none")
+    with pytest.raises(ValueError):
+        create_sound_backend("speaker")
+    # 记录后端只供测试使用
+    with pytest.raises(ValueError):
+        create_sound_backend("record")
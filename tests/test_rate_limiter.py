@@ -0,0 +1,99 @@
+# coding=utf-8
+"""qmt_rate_limiter 测试：速率调整、退避重试和不可重试的错误"""
+
+import pytest
+
+import qmt_rate_limiter
+from qmt_rate_limiter import AdaptiveRateLimiter
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录退避等待时间，不真正等待"""
+    recorded = []
+    monkeypatch.setattr(qmt_rate_limiter.time, 'sleep', recorded.append)
+    monkeypatch.setattr(qmt_rate_limiter.random, 'uniform', lambda low, high: high)
+    return recorded
+
+
+def flaky(failures, exception=OSError):
+    """前 failures 次调用抛出异常，之后返回调用次数"""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise exception("QMT客户端繁忙")
+        return len(calls)
+    return func, calls
+
+
+def test_success_increases_rate():
+    limiter = AdaptiveRateLimiter(rate=5.0, max_rate=6.0, increase_step=0.5)
+    limiter.record_success(0.1)
+    assert limiter.rate == 5.5
+    limiter.record_success(0.1)
+    limiter.record_success(0.1)
+    assert limiter.rate == 6.0
+
+
+def test_slow_response_decreases_rate():
+    limiter = AdaptiveRateLimiter(rate=4.0, min_rate=1.5, slow_threshold=1.0)
+    limiter.record_success(2.0)
+    assert limiter.rate == 2.0
+    limiter.record_success(2.0)
+    assert limiter.rate == 1.5
+
+
+def test_slow_threshold_scales_with_batch_size():
+    limiter = AdaptiveRateLimiter(rate=4.0, slow_threshold=1.0, increase_step=0.5)
+    assert limiter.batch_slow_threshold(1) == 1.0
+    assert limiter.batch_slow_threshold(0) == 1.0
+    assert limiter.batch_slow_threshold(8) == 4.0
+    limiter.record_success(5.0, batch_size=50)
+    assert limiter.rate == 4.5
+    limiter.record_success(20.0, batch_size=50)
+    assert limiter.rate == 2.25
+
+
+def test_slow_bulk_call_lowers_rate():
+    # 默认阈值下500只股票的合并请求约100秒算慢响应，而不是按数量线性放大的5000秒
+    limiter = AdaptiveRateLimiter(rate=4.0, increase_step=0.5)
+    limiter.record_success(60.0, batch_size=500)
+    assert limiter.rate == 4.5
+    limiter.record_success(150.0, batch_size=500)
+    assert limiter.rate == 2.25
+
+
+def test_retries_with_exponential_backoff(sleeps):
+    limiter = AdaptiveRateLimiter(rate=1000.0, burst=100, base_delay=1.0, max_delay=3.0, max_retries=3)
+    func, calls = flaky(3)
+
+    assert limiter.call(func) == 4
+    # 失败后清空令牌，其余较短的等待是取令牌时的等待
+    assert [delay for delay in sleeps if delay >= 0.5] == [1.0, 2.0, 3.0]
+    stats = limiter.stats()
+    assert (stats['success'], stats['failure'], stats['retry']) == (1, 3, 3)
+
+
+def test_failure_halves_rate_and_gives_up_after_max_retries(sleeps):
+    limiter = AdaptiveRateLimiter(rate=1000.0, burst=100, decrease_factor=0.5, max_retries=2)
+    func, calls = flaky(10)
+
+    with pytest.raises(OSError):
+        limiter.call(func)
+    assert len(calls) == 3
+    assert limiter.rate == 125.0
+
+
+@pytest.mark.parametrize("exception", [TypeError, ValueError, KeyError, AttributeError])
+def test_non_retryable_errors_raise_immediately(sleeps, exception):
+    limiter = AdaptiveRateLimiter(rate=1000.0, burst=100)
+    func, calls = flaky(1, exception)
+
+    with pytest.raises(exception):
+        limiter.call(func)
+    assert len(calls) == 1
+    assert sleeps == []
+    assert limiter.rate == 1000.0
+    assert limiter.stats()['failure'] == 0
@@ -0,0 +1,100 @@
+# coding=utf-8
+"""qmt_download_and_connect_test 测试：实时数据显示区域的行缓冲和定时刷新，不创建窗口"""
+
+import types
+
+import pytest
+
+gui = pytest.importorskip('qmt_download_and_connect_test')
+
+
+class FakeText:
+    """模拟Text控件，按行保存内容并记录插入次数"""
+
+    def __init__(self):
+        self.lines = []
+        self.inserts = 0
+
+    def config(self, state):
+        pass
+
+    def delete(self, start, end):
+        if end == gui.tk.END:
+            self.lines = []
+        else:
+            del self.lines[:int(str(end).split('.')[0]) - 1]
+
+    def insert(self, index, text):
+        self.inserts += 1
+        self.lines.extend(text.splitlines())
+
+    def index(self, index):
+        # 内容以换行符结尾，'end-1c' 位于最后一个空行
+        return f"{len(self.lines) + 1}.0"
+
+    def see(self, index):
+        pass
+
+
+def fake_gui(max_lines):
+    """只包含刷新显示需要的属性的界面对象"""
+    scheduled = []
+    view = types.SimpleNamespace(realtime_lines=gui.RealtimeLineBuffer(max_lines), realtime_text=FakeText(),
+                                 master=types.SimpleNamespace(after=lambda ms, func: scheduled.append(ms)),
+                                 log=print)
+    view.render_realtime_display = lambda: gui.QMTDataDownloadGUI.render_realtime_display(view)
+    view.update = lambda text, append=True: gui.QMTDataDownloadGUI.update_realtime_display(view, text, append)
+    return view, scheduled
+
+
+def test_buffer_is_bounded():
+    buffer = gui.RealtimeLineBuffer(max_lines=3)
+    for index in range(10):
+        buffer.append(f"line {index}\n")
+    assert list(buffer.lines) == ['line 7', 'line 8', 'line 9']
+    assert len(buffer.pending) == 3
+    # 新增的行挤出了全部旧内容，整体重绘
+    assert buffer.take() == (True, ['line 7', 'line 8', 'line 9'])
+    assert buffer.take() is None
+
+
+def test_take_returns_only_new_lines():
+    buffer = gui.RealtimeLineBuffer(max_lines=5)
+    buffer.append("a\nb\n")
+    assert buffer.take() == (False, ['a', 'b'])
+    buffer.append("c\n")
+    assert buffer.take() == (False, ['c'])
+    buffer.append("d\n", replace=True)
+    assert buffer.take() == (True, ['d'])
+    buffer.clear()
+    assert buffer.take() == (True, [])
+
+
+def test_render_batches_updates_between_refreshes():
+    view, scheduled = fake_gui(max_lines=500)
+    for index in range(100):
+        view.update(f"tick {index}\n")
+    assert view.realtime_text.inserts == 0  # 追加时不重绘
+
+    view.render_realtime_display()
+    assert view.realtime_text.inserts == 1
+    assert view.realtime_text.lines == [f"tick {index}" for index in range(100)]
+    assert scheduled == [gui.REALTIME_REFRESH_MS]
+
+    # 没有变化时不重绘，但仍然安排下一次刷新
+    view.render_realtime_display()
+    assert view.realtime_text.inserts == 1
+    assert scheduled == [gui.REALTIME_REFRESH_MS] * 2
+
+
+def test_render_keeps_display_within_max_lines():
+    view, _ = fake_gui(max_lines=5)
+    view.update("1\n2\n3\n")
+    view.render_realtime_display()
+    view.update("4\n5\n6\n7\n")
+    view.render_realtime_display()
+    assert view.realtime_text.lines == ['3', '4', '5', '6', '7']
+
+    view.update("new\n", append=False)
+    view.render_realtime_display()
+    assert view.realtime_text.lines == ['new']
@@ -0,0 +1,78 @@
+# coding=utf-8
+"""qmt_monitor 测试：全推快照的合并缓冲和处理线程，不需要订阅行情"""
+
+import threading
+import time
+
+from qmt_monitor import FullPushMonitor, LatestSnapshotBuffer
+
+
+def snapshot(price):
+    return {'lastPrice': price, 'lastClose': 10.0}
+
+
+def test_put_keeps_latest_snapshot_per_code():
+    buffer = LatestSnapshotBuffer()
+    buffer.put({'000001.SZ': snapshot(10.1), '600000.SH': snapshot(9.9)})
+    buffer.put({'000001.SZ': snapshot(10.2)})
+    buffer.put({'000001.SZ': snapshot(10.3)})
+
+    data_dict, push_count, first_push_time = buffer.take(timeout=0)
+    assert data_dict == {'000001.SZ': snapshot(10.3), '600000.SH': snapshot(9.9)}
+    assert push_count == 3
+    assert first_push_time <= time.perf_counter()
+
+
+def test_take_drains_buffer():
+    buffer = LatestSnapshotBuffer()
+    buffer.put({'000001.SZ': snapshot(10.1)})
+    assert buffer.take(timeout=0) is not None
+    assert buffer.take(timeout=0) is None
+
+    # 取走后重新计数
+    buffer.put({'000001.SZ': snapshot(10.2)})
+    assert buffer.take(timeout=0)[1] == 1
+
+
+def test_take_wakes_on_put_and_close():
+    buffer = LatestSnapshotBuffer()
+    threading.Timer(0.05, buffer.put, args=({'000001.SZ': snapshot(10.1)},)).start()
+    assert buffer.take(timeout=2)[0] == {'000001.SZ': snapshot(10.1)}
+
+    threading.Timer(0.05, buffer.close).start()
+    started = time.monotonic()
+    assert buffer.take(timeout=2) is None
+    assert time.monotonic() - started < 1
+    # 关闭后不再接收推送
+    buffer.put({'000001.SZ': snapshot(10.2)})
+    assert buffer.take(timeout=0) is None
+
+
+def test_process_loop_handles_merged_pushes():
+    monitor = FullPushMonitor(sound_enabled=False, log_callback=lambda text: None)
+    batches = []
+    monitor.process_fullpush_data = batches.append
+    buffer = LatestSnapshotBuffer()
+    # 处理线程启动前到达的推送合并为一批，只处理每只股票的最新快照
+    buffer.put({'000001.SZ': snapshot(10.6), '600000.SH': snapshot(10.0)})
+    buffer.put({'000001.SZ': snapshot(10.1)})
+    buffer.put({'600000.SH': snapshot(9.4)})
+
+    monitor.running = True
+    worker = threading.Thread(target=monitor.process_loop, args=(buffer,), daemon=True)
+    worker.start()
+    deadline = time.monotonic() + 2
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.005)
+    buffer.put({'000001.SZ': snapshot(10.2)})
+    while len(batches) < 2 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    monitor.running = False
+    buffer.close()
+    worker.join(timeout=2)
+
+    assert not worker.is_alive()
+    assert batches == [{'000001.SZ': snapshot(10.1), '600000.SH': snapshot(9.4)}, {'000001.SZ': snapshot(10.2)}]
+    assert monitor.stats['pushes'] == 4
+    assert monitor.stats['batches'] == 2
+    assert monitor.stats['codes'] == 3
@@ -0,0 +1,92 @@
+# coding=utf-8
+"""qmt_tick_store 测试：记录转换、按交易日追加和不完整记录的修复"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from qmt_tick_store import TICK_DTYPE, TickBinaryStore, frame_to_records, records_to_frame
+
+DAY1_MS = 1704159000000  # 2024-01-02 09:30 北京时间
+DAY2_MS = DAY1_MS + 24 * 3600 * 1000
+
+
+def tick_frame(times, start_price=10.0):
+    """构造分笔数据，盘口为QMT返回的列表列"""
+    count = len(times)
+    return pd.DataFrame({
+        'time': times,
+        'lastPrice': [start_price + i * 0.01 for i in range(count)],
+        'volume': [100 * (i + 1) for i in range(count)],
+        'amount': [1000.0 * (i + 1) for i in range(count)],
+        'askPrice': [[start_price + 0.01 * level for level in range(1, 6)]] * count,
+        'bidVol': [[10, 20, 30, 40, 50]] * count,
+    })
+
+
+def test_frame_records_round_trip():
+    df = tick_frame([DAY1_MS, DAY1_MS + 3000])
+    records = frame_to_records(df)
+
+    assert records.dtype == TICK_DTYPE
+    assert records['askPrice'][0].tolist() == pytest.approx([10.01, 10.02, 10.03, 10.04, 10.05])
+    # 缺少的字段填0
+    assert records['open'].tolist() == [0, 0]
+    assert records['bidPrice'][1].tolist() == [0] * 5
+
+    out = records_to_frame(records)
+    assert out['time'].tolist() == df['time'].tolist()
+    assert out['lastPrice'].tolist() == df['lastPrice'].tolist()
+    assert out['bidVol3'].tolist() == [30, 30]
+    assert 'askPrice' not in out.columns and 'askPrice5' in out.columns
+
+
+def test_expanded_columns_round_trip():
+    expanded = records_to_frame(frame_to_records(tick_frame([DAY1_MS])))
+    again = records_to_frame(frame_to_records(expanded))
+    pd.testing.assert_frame_equal(expanded, again)
+
+
+def test_append_splits_days_and_skips_old_ticks(tmp_path):
+    store = TickBinaryStore(str(tmp_path))
+    times = [DAY1_MS, DAY1_MS + 3000, DAY2_MS, DAY2_MS + 3000]
+    assert store.append('000001.SZ', tick_frame(times)) == 4
+    assert store.days('000001.SZ') == ['20240102', '20240103']
+
+    # 早于或等于最后一条记录的数据被忽略，同一时间只保留最后一条
+    more = tick_frame([DAY2_MS + 3000, DAY2_MS + 6000, DAY2_MS + 6000], start_price=11.0)
+    assert store.append('000001.SZ', more) == 1
+
+    day2 = store.read_day('000001.SZ', '20240103')
+    assert day2['time'].tolist() == [DAY2_MS, DAY2_MS + 3000, DAY2_MS + 6000]
+    assert day2['lastPrice'][-1] == pytest.approx(11.02)
+    assert store.last_time('000001.SZ') == DAY2_MS + 6000
+    assert list(store.read('000001.SZ', start_date='20240103')) == ['20240103']
+    assert len(store.read_day('000001.SZ', '20240104')) == 0
+
+
+def test_partial_record_is_ignored_and_overwritten(tmp_path):
+    store = TickBinaryStore(str(tmp_path))
+    store.append('000001.SZ', tick_frame([DAY1_MS, DAY1_MS + 3000]))
+    file_path = store.file_path('000001.SZ', '20240102')
+
+    # 模拟写入中断，文件末尾留下半条记录
+    with open(file_path, 'ab') as f:
+        f.write(b'\x01' * (TICK_DTYPE.itemsize // 2))
+    mapped = store.read_day('000001.SZ', '20240102')
+    assert len(mapped) == 2
+    assert store.last_time('000001.SZ') == DAY1_MS + 3000
+
+    # 没有新数据时不修改文件，写入新数据时覆盖半条记录，文件被映射期间也不截断
+    partial_size = os.path.getsize(file_path)
+    assert store.append('000001.SZ', tick_frame([DAY1_MS + 3000])) == 0
+    assert os.path.getsize(file_path) == partial_size
+    assert store.append('000001.SZ', tick_frame([DAY1_MS + 6000])) == 1
+    assert mapped['time'].tolist() == [DAY1_MS, DAY1_MS + 3000]
+    del mapped
+    assert os.path.getsize(file_path) == 3 * TICK_DTYPE.itemsize
+    records = store.read_day('000001.SZ', '20240102')
+    assert records['time'].tolist() == [DAY1_MS, DAY1_MS + 3000, DAY1_MS + 6000]
+    assert np.all(records['volume'] > 0)
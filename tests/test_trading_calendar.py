@@ -0,0 +1,61 @@
+# coding=utf-8
+"""qmt_trading_calendar 测试：使用本地缓存文件构建日历，不需要连接QMT"""
+
+import json
+
+import pytest
+
+from qmt_trading_calendar import TradingCalendar, ms_to_date
+
+# 2024年国庆假期前后的交易日，10月1日至7日休市
+DATES = ['20240926', '20240927', '20240930', '20241008', '20241009', '20241010', '20241011']
+
+
+@pytest.fixture
+def calendar(tmp_path):
+    cache_file = tmp_path / "trading_calendar.json"
+    cache_file.write_text(json.dumps({'market': 'SH', 'covered_until': '20241011', 'dates': DATES}), encoding='utf-8')
+    calendar = TradingCalendar(str(cache_file))
+    assert calendar.ensure('20241011')
+    return calendar
+
+
+def test_is_trading_day(calendar):
+    assert calendar.is_trading_day('20240930')
+    assert not calendar.is_trading_day('20241002')
+    assert not calendar.is_trading_day('20240928')
+
+
+def test_next_trading_day_skips_holiday(calendar):
+    assert calendar.next_trading_day('20240927') == '20240930'
+    assert calendar.next_trading_day('20240930') == '20241008'
+    assert calendar.next_trading_day('20241003') == '20241008'
+
+
+def test_prev_trading_day_skips_holiday(calendar):
+    assert calendar.prev_trading_day('20241008') == '20240930'
+    assert calendar.prev_trading_day('20241005') == '20240930'
+    assert calendar.prev_trading_day('20240930') == '20240927'
+
+
+def test_trading_days_across_holiday(calendar):
+    assert calendar.trading_days('20240928', '20241009') == ['20240930', '20241008', '20241009']
+    assert calendar.trading_days('20241002', '20241007') == []
+    assert calendar.trading_days('20241009', '20241008') == []
+
+
+def test_dates_before_calendar_start(calendar):
+    assert calendar.next_trading_day('20240901') == '20240926'
+    assert calendar.prev_trading_day('20240926') is None
+
+
+def test_dates_after_coverage_use_weekdays(calendar):
+    # 20241011为周五，覆盖范围之后按周一至周五近似
+    assert calendar.next_trading_day('20241011') == '20241014'
+    assert calendar.prev_trading_day('20241014') == '20241011'
+    assert calendar.trading_days('20241010', '20241015') == ['20241010', '20241011', '20241014', '20241015']
+
+
+def test_ms_to_date_uses_beijing_time():
+    # 2024-10-07 16:30 UTC 为北京时间 2024-10-08 00:30
+    assert ms_to_date(1728318600000) == '20241008'
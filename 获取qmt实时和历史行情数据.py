@@ -1,56 +1,255 @@
 from xtquant import xtdata
 xtdata.enable_hello = False
+import os
+import threading
+import time
+from collections import OrderedDict
 import pandas as pd
 from datetime import datetime, timedelta
 
+from qmt_trading_calendar import ms_to_date, session_close_ms
+
+
+# 历史行情缓存：进程内LRU + 本地磁盘，键为(股票代码, 周期, 复权方式)
+HISTORY_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history_cache')
+HISTORY_CACHE_SIZE = 256     # 进程内最多缓存的(股票代码, 周期, 复权方式)数量
+HISTORY_CACHE_TTL = 60       # 最后一天在获取时尚未收盘的数据在多少秒内不重新获取
+HISTORY_FIELDS = ['time', 'open', 'high', 'low', 'close', 'volume', 'amount']
+
+_history_cache = OrderedDict()
+_history_cache_lock = threading.Lock()
+
+
+def _cache_file(stock_code, period, dividend_type):
+    """缓存文件路径"""
+    return os.path.join(HISTORY_CACHE_DIR, f"{stock_code}_{period}_{dividend_type}.pkl")
+
+
+def _load_cache_entry(key):
+    """先查进程内缓存，再查磁盘缓存，都没有时返回None"""
+    with _history_cache_lock:
+        if key in _history_cache:
+            _history_cache.move_to_end(key)
+            return _history_cache[key]
+
+    file_path = _cache_file(*key)
+    if not os.path.exists(file_path):
+        return None
+    try:
+        entry = pd.read_pickle(file_path)
+    except Exception as e:
+        print(f"读取缓存文件{file_path}失败: {e}，将重新获取")
+        return None
+    _remember_cache_entry(key, entry)
+    return entry
+
+
+def _remember_cache_entry(key, entry):
+    """放入进程内缓存，超出容量时淘汰最久未使用的"""
+    with _history_cache_lock:
+        _history_cache[key] = entry
+        _history_cache.move_to_end(key)
+        while len(_history_cache) > HISTORY_CACHE_SIZE:
+            _history_cache.popitem(last=False)
+
+
+def _save_cache_entry(key, entry):
+    """写入进程内缓存和磁盘缓存，磁盘文件先写临时文件再替换"""
+    _remember_cache_entry(key, entry)
+    os.makedirs(HISTORY_CACHE_DIR, exist_ok=True)
+    file_path = _cache_file(*key)
+    pd.to_pickle(entry, file_path + '.tmp')
+    os.replace(file_path + '.tmp', file_path)
+
+
+def clear_history_cache(memory_only=False):
+    """清空历史行情缓存
+
+    Args:
+        memory_only: 为True时只清空进程内缓存，保留磁盘缓存
+    """
+    with _history_cache_lock:
+        _history_cache.clear()
+    if not memory_only and os.path.isdir(HISTORY_CACHE_DIR):
+        for name in os.listdir(HISTORY_CACHE_DIR):
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(HISTORY_CACHE_DIR, name))
+
+
+def _fetch_history(stock_code, period, start_time, end_time, dividend_type):
+    """从QMT下载并读取一段历史行情，time列为毫秒时间戳"""
+    xtdata.download_history_data(stock_code, period=period, start_time=start_time, end_time=end_time)
+    # get_market_data_ex直接返回每只股票的DataFrame，不需要逐字段重建
+    market_data = xtdata.get_market_data_ex(HISTORY_FIELDS, [stock_code], period=period,
+                                            start_time=start_time, end_time=end_time,
+                                            dividend_type=dividend_type)
+    if not market_data or stock_code not in market_data:
+        return pd.DataFrame(columns=HISTORY_FIELDS)
+    df = market_data[stock_code]
+    return df[[field for field in HISTORY_FIELDS if field in df.columns]].reset_index(drop=True)
+
+
+def _latest_ex_date(stock_code):
+    """最近一次除权除息日，用于判断复权数据的缓存是否失效
+
+    Returns:
+        str: 日期，格式YYYYMMDD；没有除权除息记录时返回空字符串，获取失败时返回None
+    """
+    try:
+        factors = xtdata.get_divid_factors(stock_code)
+    except Exception as e:
+        print(f"获取{stock_code}的除权数据失败: {e}")
+        return None
+    if factors is None:
+        return None
+    if len(factors) == 0:
+        return ''
+    if 'time' in factors.columns:
+        return ms_to_date(int(factors['time'].max()))
+    return str(max(factors.index))[:8]
+
+
+def _merge_history(cached, fetched):
+    """合并缓存数据和新获取的数据，时间相同时以新数据为准"""
+    df = pd.concat([cached, fetched], ignore_index=True)
+    df = df.drop_duplicates(subset='time', keep='last').sort_values('time')
+    return df.reset_index(drop=True)
+
+
+def _adjustment_changed(cached, fetched):
+    """复权数据在新的除权除息后会整体变化：比较重叠时间的收盘价，不一致时说明缓存已失效"""
+    overlap = cached.merge(fetched, on='time', suffixes=('_cached', '_fetched'))
+    if overlap.empty or 'close_cached' not in overlap.columns:
+        return False
+    difference = (overlap['close_cached'] - overlap['close_fetched']).abs()
+    return bool((difference > 1e-6 * overlap['close_fetched'].abs().clip(lower=1)).any())
+
+
+def _date_before(date_str):
+    """前一个自然日，格式YYYYMMDD"""
+    return (datetime.strptime(date_str, '%Y%m%d') - timedelta(days=1)).strftime('%Y%m%d')
+
 
 # 获取股票历史行情数据，比如日线，分钟线等
-def get_stock_history_data(stock_code, period='1d', start_time=None, end_time=None):
+def get_stock_history_data(stock_code, period='1d', start_time=None, end_time=None, dividend_type='none',
+                           use_cache=True):
     """
     获取股票历史行情数据
     
+    重复调用时优先使用缓存：缓存已覆盖请求的时间范围时不访问QMT；
+    只缺少前面或后面一段时只下载缺少的部分；缓存的最后一天在获取时尚未收盘的，超过缓存有效期后重新获取。
+    
     Args:
         stock_code: 股票代码，如'000001.SZ'
         period: 周期，'1d'为日线，'1m'为1分钟线
-        start_time: 开始时间，格式'20240301'
-        end_time: 结束时间，格式'20240314'
+        start_time: 开始时间，格式'20240301'，默认为7年前
+        end_time: 结束时间，格式'20240314'，默认为今天
+        dividend_type: 复权方式，'none'不复权，'front'前复权，'back'后复权等
+        use_cache: 是否使用缓存，为False时直接从QMT获取，也不更新缓存
         
     Returns:
         DataFrame格式的行情数据
     """
-    # 如果没有指定时间，默认获取近10个交易日的数据
-    if not start_time or not end_time:
-        end_time = datetime.now().strftime('%Y%m%d')
+    today = datetime.now().strftime('%Y%m%d')
+    if not start_time:
         start_time = (datetime.now() - timedelta(days=7*365)).strftime('%Y%m%d')
+    if not end_time:
+        end_time = today
+    start_time, end_time = str(start_time)[:8], str(end_time)[:8]
     
-    # 下载历史数据
-    xtdata.download_history_data(stock_code, period=period, start_time=start_time)
+    if not use_cache:
+        df = _fetch_history(stock_code, period, start_time, end_time, dividend_type)
+    else:
+        df = _get_cached_history(stock_code, period, start_time, end_time, dividend_type, today)
     
-    # 获取历史行情数据
-    fields = ['time', 'open', 'high', 'low', 'close', 'volume', 'amount']
-    market_data = xtdata.get_market_data(field_list=fields,
-                                       stock_list=[stock_code],
-                                       period=period,
-                                       start_time=start_time,
-                                       end_time=end_time)
-    
-    if not market_data:
+    if df is None or df.empty:
         print(f"未获取到{stock_code}的数据")
         return None
     
-    # 转换成DataFrame格式
-    df = pd.DataFrame()
-    for field in fields:
-        if field in market_data:
-            df[field] = market_data[field].values[0]  # 使用values[0]获取数据
-    
     # 将time列转换为日期时间格式
-    if 'time' in df.columns:
-        df['time'] = pd.to_datetime(df['time'], unit='ms')
-    
+    df = df.copy()
+    df['time'] = pd.to_datetime(df['time'], unit='ms')
     return df
 
 
+def _get_cached_history(stock_code, period, start_time, end_time, dividend_type, today):
+    """按缓存覆盖的日期范围补齐缺少的部分，返回请求范围内的数据（time列为毫秒时间戳）
+    
+    缓存条目不在原地修改：更新时构造新的条目再放入缓存，其他线程读到的条目始终是完整的。
+    获取结果为空时不写入缓存（可能是QMT临时没有返回数据），下次调用时重新获取。
+    复权数据的缓存条目记录获取时最近一次除权除息日，之后有新的除权除息时整体重新获取，
+    即使请求的范围已被缓存覆盖；无法获取除权数据时复权数据不使用缓存。
+    """
+    key = (stock_code, period, dividend_type)
+    ex_date = ''
+    if dividend_type != 'none':
+        ex_date = _latest_ex_date(stock_code)
+        if ex_date is None:
+            return _fetch_history(stock_code, period, start_time, end_time, dividend_type)
+    entry = _load_cache_entry(key)
+    if entry is not None and entry.get('ex_date', '') != ex_date:
+        print(f"{stock_code}有新的除权除息（{ex_date}），重新获取全部数据")
+        entry = None
+    
+    if entry is None:
+        data = _fetch_history(stock_code, period, start_time, end_time, dividend_type)
+        if data.empty:
+            return data
+        entry = {'start': start_time, 'end': end_time, 'data': data, 'fetched_at': time.time(), 'ex_date': ex_date}
+        _save_cache_entry(key, entry)
+    else:
+        data = entry['data']
+        start, end, fetched_at = entry['start'], entry['end'], entry['fetched_at']
+        changed = False
+        
+        # 缺少前面一段：获取到缓存第一根K线所在的日期，保证与缓存有重叠，用于检查复权是否变化
+        if start_time < start:
+            refresh_to = _date_before(start)
+            if not data.empty:
+                refresh_to = ms_to_date(data['time'].iloc[0])
+            head = _fetch_history(stock_code, period, start_time, refresh_to, dividend_type)
+            if not head.empty:
+                if dividend_type != 'none' and _adjustment_changed(data, head):
+                    print(f"{stock_code}的复权数据已变化，重新获取全部数据")
+                    data = _fetch_history(stock_code, period, start_time, end, dividend_type)
+                    fetched_at = time.time()
+                else:
+                    data = _merge_history(head, data)
+                start = start_time
+                changed = True
+        
+        # 缺少后面一段，或缓存的最后一天在获取时尚未收盘、可能是盘中数据
+        tail_stale = (fetched_at * 1000 < session_close_ms(end)
+                      and time.time() - fetched_at > HISTORY_CACHE_TTL)
+        if end_time > end or tail_stale:
+            # 从缓存最后一根K线所在的日期开始，保证与缓存有重叠，用于检查复权是否变化
+            refresh_from = end
+            if not data.empty:
+                refresh_from = min(refresh_from, ms_to_date(data['time'].iloc[-1]))
+            tail = _fetch_history(stock_code, period, refresh_from, max(end_time, end), dividend_type)
+            if not tail.empty:
+                if dividend_type != 'none' and _adjustment_changed(data, tail):
+                    print(f"{stock_code}的复权数据已变化，重新获取全部数据")
+                    data = _fetch_history(stock_code, period, start, max(end_time, end), dividend_type)
+                else:
+                    data = _merge_history(data, tail)
+                end = max(end_time, end)
+                fetched_at = time.time()
+                changed = True
+        
+        if changed and not data.empty:
+            entry = {'start': start, 'end': end, 'data': data, 'fetched_at': fetched_at, 'ex_date': ex_date}
+            _save_cache_entry(key, entry)
+    
+    data = entry['data']
+    if data.empty:
+        return data
+    start_ms = int((pd.Timestamp(start_time) - pd.Timedelta(hours=8) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1))
+    end_ms = int((pd.Timestamp(end_time) + pd.Timedelta(hours=16) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1))
+    times = data['time'].to_numpy()
+    return data.iloc[times.searchsorted(start_ms, 'left'):times.searchsorted(end_ms, 'left')].reset_index(drop=True)
+
+
 
 # 获取股票实时行情tick数据和最新价格
 def get_stock_data(codes):